@@ -398,6 +398,9 @@ export interface Task {
   assigned_to_user_id: number;
   team_id: number;
   created_at: string;
+  comment_count: number;
+  file_count: number;
+  version: number;
 }
 
 export interface TaskComment {
@@ -408,6 +411,21 @@ export interface TaskComment {
   created_at: string;
 }
 
+export interface TaskStatusCounts {
+  total: number;
+  by_status: Record<'TODO' | 'IN_PROGRESS' | 'DONE', number>;
+}
+
+export interface TeamTaskCounts extends TaskStatusCounts {
+  by_assignee?: Record<string, TaskStatusCounts>;
+}
+
+export interface TaskPage {
+  results: Task[];
+  next: string | null;
+  prev: string | null;
+}
+
 export interface TaskFile {
   id: string;
   file: string;
@@ -435,9 +453,49 @@ export interface TaskComment {
 
 export interface TaskDetails extends Task {
   comments: TaskComment[];
+  comments_count: number;
+  comments_next: string | null;
   files: TaskFile[];
 }
 
+export interface CommentPage {
+  results: TaskComment[];
+  next: string | null;
+  prev: string | null;
+}
+
+export interface SearchHighlight {
+  snippet: string;
+  offsets: [number, number][];
+  truncated_start: boolean;
+  truncated_end: boolean;
+  comment_id?: string;
+}
+
+export interface TaskSearchResult {
+  task: Task;
+  score: number;
+  highlights: Partial<Record<'title' | 'description' | 'comment', SearchHighlight>>;
+}
+
+export interface TaskSearchPage {
+  results: TaskSearchResult[];
+  next: string | null;
+}
+
+export interface BulkCreateResult {
+  index: number;
+  status: 'created' | 'error';
+  id?: string;
+  errors?: Record<string, string[]>;
+}
+
+export interface BulkCreateResponse {
+  created: number;
+  failed: number;
+  results: BulkCreateResult[];
+}
+
 // Create a separate axios instance for taskservice
 const taskApiClient: AxiosInstance = axios.create({
   baseURL: TASK_API_BASE_URL,
@@ -446,6 +504,11 @@ const taskApiClient: AxiosInstance = axios.create({
   },
 });
 
+// Read-your-writes token from taskservice's last write response. Sent back
+// so that list reads right after a change come from the MongoDB primary
+// rather than a secondary that may not have the change yet.
+let readYourWritesToken: string | null = null;
+
 // Request interceptor to add auth token for taskservice
 taskApiClient.interceptors.request.use(
   (config: any) => {
@@ -453,6 +516,9 @@ taskApiClient.interceptors.request.use(
     if (token) {
       config.headers.Authorization = `Bearer ${token}`;
     }
+    if (readYourWritesToken) {
+      config.headers['X-Read-Your-Writes'] = readYourWritesToken;
+    }
     return config;
   },
   (error: any) => {
@@ -462,7 +528,13 @@ taskApiClient.interceptors.request.use(
 
 // Response interceptor for error handling (same as apiClient)
 taskApiClient.interceptors.response.use(
-  (response: any) => response,
+  (response: any) => {
+    const writeToken = response.headers?.['x-read-your-writes'];
+    if (writeToken) {
+      readYourWritesToken = writeToken;
+    }
+    return response;
+  },
   async (error: AxiosError) => {
     const originalRequest = error.config as any;
 
@@ -517,11 +589,51 @@ export const tasksAPI = {
     status?: string;
     due_date_from?: string;
     due_date_to?: string;
+    fields?: string;
   }): Promise<Task[]> => {
     const response = await taskApiClient.get<Task[]>('/api/tasks/tasks/', { params });
     return response.data;
   },
 
+  // Full-text search over titles, descriptions and comments, ranked by relevance
+  searchTasks: async (q: string, params?: {
+    team_id?: number;
+    assigned_to_user_id?: number;
+    status?: string;
+    fields?: string;
+    limit?: number;
+    cursor?: string;
+  }): Promise<TaskSearchPage> => {
+    const response = await taskApiClient.get<TaskSearchPage>('/api/tasks/tasks/search/', {
+      params: { q, ...params },
+    });
+    return response.data;
+  },
+
+  listTasksPage: async (params?: {
+    team_id?: number;
+    assigned_to_user_id?: number;
+    status?: string;
+    due_date_from?: string;
+    due_date_to?: string;
+    fields?: string;
+    ordering?: 'created_at' | '-created_at' | 'due_date' | '-due_date';
+    limit?: number;
+    cursor?: string;
+  }): Promise<TaskPage> => {
+    const response = await taskApiClient.get<TaskPage>('/api/tasks/tasks/', {
+      params: { limit: 50, ...params },
+    });
+    return response.data;
+  },
+
+  countTasks: async (teamIds: number[], byAssignee: boolean = false): Promise<Record<string, TeamTaskCounts>> => {
+    const response = await taskApiClient.get<{ teams: Record<string, TeamTaskCounts> }>('/api/tasks/tasks/counts/', {
+      params: { team_ids: teamIds.join(','), by_assignee: byAssignee },
+    });
+    return response.data.teams;
+  },
+
   createTask: async (taskData: {
     title: string;
     description: string;
@@ -535,6 +647,32 @@ export const tasksAPI = {
     return response.data;
   },
 
+  // Create many tasks in one request; partial failures come back per item (HTTP 207)
+  bulkCreateTasks: async (tasks: Array<{
+    title: string;
+    description: string;
+    assigned_to_user_id: number;
+    team_id: number;
+    priority?: 'LOW' | 'MEDIUM' | 'HIGH';
+    due_date: string;
+    status?: 'TODO' | 'IN_PROGRESS' | 'DONE';
+  }>): Promise<BulkCreateResponse> => {
+    const response = await taskApiClient.post<BulkCreateResponse>('/api/tasks/tasks/bulk/', tasks);
+    return response.data;
+  },
+
+  // Patch every task matched by ids and/or list filters in one request
+  bulkUpdateTasks: async (
+    target: { ids?: string[]; filter?: Record<string, string | number> },
+    patch: Partial<Pick<Task, 'status' | 'priority' | 'assigned_to_user_id' | 'due_date' | 'team_id'>>
+  ): Promise<{ matched: number; modified: number }> => {
+    const response = await taskApiClient.patch<{ matched: number; modified: number }>(
+      '/api/tasks/tasks/bulk/update/',
+      { ...target, patch }
+    );
+    return response.data;
+  },
+
   createTaskWithFiles: async (taskData: {
     title: string;
     description: string;
@@ -580,8 +718,10 @@ export const tasksAPI = {
     status?: 'TODO' | 'IN_PROGRESS' | 'DONE';
     priority?: 'LOW' | 'MEDIUM' | 'HIGH';
     due_date?: string;
-  }): Promise<Task> => {
-    const response = await taskApiClient.put<Task>(`/api/tasks/tasks/${taskId}/update/`, taskData);
+  }, version?: number): Promise<Task> => {
+    // With a version, the update fails with 409 if someone else changed the task first
+    const headers = version === undefined ? undefined : { 'If-Match': `"${version}"` };
+    const response = await taskApiClient.put<Task>(`/api/tasks/tasks/${taskId}/update/`, taskData, { headers });
     return response.data;
   },
 
@@ -589,8 +729,8 @@ export const tasksAPI = {
     await taskApiClient.delete(`/api/tasks/tasks/${taskId}/delete/`);
   },
 
-  updateTaskStatus: async (taskId: string, status: 'TODO' | 'IN_PROGRESS' | 'DONE'): Promise<Task> => {
-    const response = await taskApiClient.patch<Task>(`/api/tasks/tasks/${taskId}/status/`, { status });
+  updateTaskStatus: async (taskId: string, status: 'TODO' | 'IN_PROGRESS' | 'DONE', version?: number): Promise<Task> => {
+    const response = await taskApiClient.patch<Task>(`/api/tasks/tasks/${taskId}/status/`, { status, version });
     return response.data;
   },
 
@@ -618,6 +758,13 @@ export const tasksAPI = {
     return response.data;
   },
 
+  listCommentsPage: async (taskId: string, cursor?: string, limit: number = 20): Promise<CommentPage> => {
+    const response = await taskApiClient.get<CommentPage>(`/api/tasks/tasks/${taskId}/comments/`, {
+      params: { limit, cursor },
+    });
+    return response.data;
+  },
+
   attachFile: async (taskId: string, file: string): Promise<TaskFile> => {
     const response = await taskApiClient.post<TaskFile>(`/api/tasks/tasks/${taskId}/files/attach/`, { file });
     return response.data;
@@ -649,6 +796,12 @@ export const tasksAPI = {
     return `/api/tasks/tasks/${taskId}/files/${fileId}/${downloadParam}`;
   },
 
+  // Downscaled JPEG preview for images and PDFs; 202 (retry) while it renders,
+  // the original file when none can be rendered
+  getFileThumbnailUrl: (taskId: string, fileId: string): string => {
+    return `/api/tasks/tasks/${taskId}/files/${fileId}/?variant=thumb`;
+  },
+
   downloadFile: async (taskId: string, fileId: string, download: boolean = false): Promise<Blob> => {
     const downloadParam = download ? '?download=true' : '';
     const response = await taskApiClient.get(
@@ -693,6 +846,10 @@ export const tasksAPI = {
     return `/api/tasks/tasks/${taskId}/comments/${commentId}/files/${fileId}/${downloadParam}`;
   },
 
+  getCommentFileThumbnailUrl: (taskId: string, commentId: string, fileId: string): string => {
+    return `/api/tasks/tasks/${taskId}/comments/${commentId}/files/${fileId}/?variant=thumb`;
+  },
+
   deleteComment: async (taskId: string, commentId: string): Promise<void> => {
     await taskApiClient.delete(`/api/tasks/tasks/${taskId}/comments/${commentId}/delete/`);
   },
@@ -701,3 +858,113 @@ export const tasksAPI = {
     await taskApiClient.delete(`/api/tasks/tasks/${taskId}/comments/${commentId}/files/${fileId}/delete/`);
   },
 };
+
+export type TaskEventType =
+  | 'task.created'
+  | 'task.updated'
+  | 'task.status'
+  | 'task.deleted'
+  | 'comment.created'
+  | 'comment.deleted'
+  | 'file.created'
+  | 'file.deleted';
+
+export interface TaskEvent {
+  task_id: string;
+  task?: Task;
+  comment?: TaskComment;
+  comment_id?: string;
+  file?: TaskFile | CommentFile;
+  file_id?: string;
+}
+
+const TASK_EVENT_TYPES: TaskEventType[] = [
+  'task.created', 'task.updated', 'task.status', 'task.deleted',
+  'comment.created', 'comment.deleted', 'file.created', 'file.deleted',
+];
+
+// Live task changes over Server-Sent Events, replacing polling. EventSource
+// cannot send an Authorization header, so the token goes in the query string.
+// onResync is called when events may have been missed: refetch there.
+// Returns a function that closes the stream.
+export const subscribeTaskEvents = (
+  params: { team_ids?: number[]; task_id?: string },
+  onEvent: (type: TaskEventType, event: TaskEvent) => void,
+  onResync: () => void,
+): (() => void) => {
+  let source: EventSource | null = null;
+  let retry: ReturnType<typeof setTimeout> | undefined;
+  let closed = false;
+
+  const open = () => {
+    const query = new URLSearchParams({ token: tokenStorage.getAccessToken() || '' });
+    if (params.team_ids?.length) query.set('team_ids', params.team_ids.join(','));
+    if (params.task_id) query.set('task_id', params.task_id);
+    source = new EventSource(`${TASK_API_BASE_URL}/api/tasks/tasks/events/?${query}`);
+    TASK_EVENT_TYPES.forEach((type) => {
+      source!.addEventListener(type, (message) => {
+        onEvent(type, JSON.parse((message as MessageEvent).data));
+      });
+    });
+    source.addEventListener('resync', onResync);
+    source.onerror = () => {
+      // The browser reconnects by itself unless the stream was refused
+      // (e.g. an expired token); then reopen with the current token.
+      if (source?.readyState === EventSource.CLOSED && !closed) {
+        retry = setTimeout(open, 5000);
+      }
+    };
+  };
+
+  open();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    source?.close();
+  };
+};
+
+// Live comment thread of one task over WebSocket: comment and attachment
+// events, and task.deleted. Reconnects after drops, resuming from the last
+// event seen; onResync is called when the thread must be refetched.
+// Returns a function that closes the socket.
+export const subscribeCommentThread = (
+  taskId: string,
+  onEvent: (type: TaskEventType, event: TaskEvent) => void,
+  onResync: () => void,
+): (() => void) => {
+  let socket: WebSocket | null = null;
+  let retry: ReturnType<typeof setTimeout> | undefined;
+  let lastEventId = '';
+  let closed = false;
+
+  const open = () => {
+    const query = new URLSearchParams({ token: tokenStorage.getAccessToken() || '' });
+    if (lastEventId) query.set('last_event_id', lastEventId);
+    const base = TASK_API_BASE_URL.replace(/^http/, 'ws');
+    socket = new WebSocket(`${base}/api/tasks/tasks/${taskId}/comments/live/?${query}`);
+    socket.onmessage = (message) => {
+      const { id, type, data } = JSON.parse(message.data);
+      if (type === 'resync') {
+        lastEventId = '';
+        onResync();
+        return;
+      }
+      lastEventId = id;
+      onEvent(type, data);
+    };
+    socket.onclose = (event) => {
+      // 4401/4403/4404: not allowed to follow this task
+      if (!closed && event.code < 4400) {
+        retry = setTimeout(open, event.code === 4000 ? 0 : 5000);
+      }
+    };
+  };
+
+  open();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    socket?.close();
+  };
+};
@@ -49,8 +49,10 @@ const Dashboard = () => {
       const isAdmin = user && (user.role === 'ADMIN' || user.role_display === 'Admin');
       
       // If admin, fetch all tasks; otherwise fetch only assigned tasks
+      // Cards and stats never show descriptions, so don't download them
+      const fields = 'title,status,priority,due_date';
       const fetchedTasks = await tasksAPI.listTasks(
-        isAdmin ? {} : { assigned_to_user_id: user.id }
+        isAdmin ? { fields } : { assigned_to_user_id: user.id, fields }
       );
 
       setTasks(fetchedTasks);
@@ -93,30 +95,24 @@ const Dashboard = () => {
       setIsLoading(true);
       const apiTeams = await teamsAPI.listTeams();
       
-      // Fetch tasks for each team to get task counts
-      const teamsWithTaskCounts = await Promise.all(
-        apiTeams.map(async (team: APITeam) => {
-          try {
-            const teamTasks = await tasksAPI.listTasks({ team_id: team.id });
-            return {
-              id: team.id.toString(),
-              name: team.name,
-              leader: team.leader_full_name || "No leader",
-              memberCount: team.number_of_members,
-              taskCount: teamTasks.length,
-            };
-          } catch (error) {
-            // If fetching tasks fails for a team, just use 0
-            return {
-              id: team.id.toString(),
-              name: team.name,
-              leader: team.leader_full_name || "No leader",
-              memberCount: team.number_of_members,
-              taskCount: 0,
-            };
-          }
-        })
-      );
+      // Fetch task counts for all teams in a single request
+      let taskCounts: Record<string, { total: number }> = {};
+      if (apiTeams.length > 0) {
+        try {
+          taskCounts = await tasksAPI.countTasks(apiTeams.map((team: APITeam) => team.id));
+        } catch (error) {
+          // If fetching counts fails, just show 0 for every team
+          taskCounts = {};
+        }
+      }
+
+      const teamsWithTaskCounts = apiTeams.map((team: APITeam) => ({
+        id: team.id.toString(),
+        name: team.name,
+        leader: team.leader_full_name || "No leader",
+        memberCount: team.number_of_members,
+        taskCount: taskCounts[team.id.toString()]?.total ?? 0,
+      }));
       
       setTeams(teamsWithTaskCounts);
     } catch (error) {
@@ -8,7 +8,7 @@ import { Checkbox } from "../components/ui/checkbox";
 import { Label } from "../components/ui/label";
 import { Tabs, TabsContent, TabsList, TabsTrigger } from "../components/ui/tabs";
 import { Search, Filter } from "lucide-react";
-import { tasksAPI } from "../lib/api";
+import { tasksAPI, subscribeTaskEvents, type Task } from "../lib/api";
 import { useAuth } from "../contexts/AuthContext";
 import { toast } from "../hooks/use-toast";
 
@@ -46,15 +46,31 @@ interface TaskCardTask {
   assignee: string;
 }
 
+// Convert an API task to TaskCard format
+const toCardTask = (task: Task): TaskCardTask => ({
+  id: task.id,
+  title: task.title,
+  status: task.status,
+  priority: task.priority,
+  dueDate: new Date(task.due_date).toLocaleDateString('en-US', {
+    month: 'short',
+    day: 'numeric',
+    year: 'numeric'
+  }),
+  assignee: '', // Not used since showAssignee=false
+});
+
 const MyTasks = () => {
   const { user } = useAuth();
   const [tasks, setTasks] = useState<TaskCardTask[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [searchQuery, setSearchQuery] = useState("");
+  const [searchMatches, setSearchMatches] = useState<Set<string> | null>(null);
   const [activeTab, setActiveTab] = useState("all");
   const [isFilterOpen, setIsFilterOpen] = useState(false);
   const [priorityFilters, setPriorityFilters] = useState<string[]>([]);
   const [timeFilters, setTimeFilters] = useState<string[]>([]);
+  const [reloadKey, setReloadKey] = useState(0);
 
   // Fetch tasks - all tasks for admin, assigned tasks for others
   useEffect(() => {
@@ -74,25 +90,7 @@ const MyTasks = () => {
           isAdmin ? {} : { assigned_to_user_id: user.id }
         );
 
-        // Convert API tasks to TaskCard format
-        const formattedTasks: TaskCardTask[] = fetchedTasks.map((task) => {
-          const dueDate = new Date(task.due_date).toLocaleDateString('en-US', {
-            month: 'short',
-            day: 'numeric',
-            year: 'numeric'
-          });
-
-          return {
-            id: task.id,
-            title: task.title,
-            status: task.status,
-            priority: task.priority,
-            dueDate,
-            assignee: '', // Not used since showAssignee=false
-          };
-        });
-
-        setTasks(formattedTasks);
+        setTasks(fetchedTasks.map(toCardTask));
       } catch (error) {
         const errorMessage = error instanceof Error ? error.message : "Failed to fetch tasks";
         toast({
@@ -106,10 +104,58 @@ const MyTasks = () => {
     };
 
     fetchTasks();
+  }, [user?.id, user?.role, user?.role_display, reloadKey]);
+
+  // Apply live task changes instead of refetching the list
+  useEffect(() => {
+    if (!user?.id) return;
+    const isAdmin = user.role === 'ADMIN' || user.role_display === 'Admin';
+
+    return subscribeTaskEvents(
+      {},
+      (type, event) => {
+        if (type === 'task.deleted') {
+          setTasks((prev) => prev.filter((task) => task.id !== event.task_id));
+          return;
+        }
+        const changed = event.task;
+        if (!changed) return;
+        const mine = isAdmin || changed.assigned_to_user_id === user.id;
+        setTasks((prev) => {
+          const others = prev.filter((task) => task.id !== changed.id);
+          if (!mine) return others;
+          return prev.some((task) => task.id === changed.id)
+            ? prev.map((task) => (task.id === changed.id ? toCardTask(changed) : task))
+            : [toCardTask(changed), ...prev];
+        });
+      },
+      () => setReloadKey((key) => key + 1),
+    );
   }, [user?.id, user?.role, user?.role_display]);
 
+  // Search titles, descriptions and comments on the server (debounced)
+  useEffect(() => {
+    const query = searchQuery.trim();
+    if (!query) {
+      setSearchMatches(null);
+      return;
+    }
+    const timeout = setTimeout(async () => {
+      try {
+        const page = await tasksAPI.searchTasks(query, { fields: 'id', limit: 100 });
+        setSearchMatches(new Set(page.results.map((result) => result.task.id)));
+      } catch {
+        // Fall back to matching titles locally
+        setSearchMatches(null);
+      }
+    }, 250);
+    return () => clearTimeout(timeout);
+  }, [searchQuery]);
+
   const filteredTasks = tasks.filter((task) => {
-    const matchesSearch = task.title.toLowerCase().includes(searchQuery.toLowerCase());
+    const matchesSearch = searchMatches
+      ? searchMatches.has(task.id)
+      : task.title.toLowerCase().includes(searchQuery.toLowerCase());
     const matchesTab = activeTab === "all" || task.status === activeTab;
     
     // Priority filter
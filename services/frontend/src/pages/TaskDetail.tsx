@@ -23,7 +23,7 @@ import {
   Save
 } from "lucide-react";
 import { useState, useEffect } from "react";
-import { tasksAPI, authAPI, type TaskDetails as APITaskDetails, type TaskComment, type TaskFile, type CommentFile, type User as APIUser } from "../lib/api";
+import { tasksAPI, authAPI, subscribeTaskEvents, subscribeCommentThread, type TaskDetails as APITaskDetails, type TaskComment, type TaskFile, type CommentFile, type User as APIUser } from "../lib/api";
 import { toast } from "../hooks/use-toast";
 import { useAuth } from "../contexts/AuthContext";
 
@@ -47,6 +47,7 @@ const TaskDetail = () => {
   const [newCommentFiles, setNewCommentFiles] = useState<File[]>([]);
   const [commentFiles, setCommentFiles] = useState<Record<string, File[]>>({});
   const [uploadingCommentFiles, setUploadingCommentFiles] = useState<Record<string, boolean>>({});
+  const [isLoadingOlderComments, setIsLoadingOlderComments] = useState(false);
   
   // Check user role (will be computed after task is loaded)
   const isAdmin = user && (user.role === 'ADMIN' || user.role_display === 'Admin');
@@ -110,6 +111,113 @@ const TaskDetail = () => {
     fetchTask();
   }, [id]);
 
+  // Keep the task's fields live while the page is open
+  useEffect(() => {
+    if (!id) return;
+    return subscribeTaskEvents(
+      { task_id: id },
+      (type, event) => {
+        if (type === 'task.deleted') {
+          setTask(null);
+        } else if (event.task) {
+          const changed = event.task;
+          setTask(prev => prev && changed.version >= prev.version ? { ...prev, ...changed } : prev);
+        }
+      },
+      async () => {
+        try {
+          setTask(await tasksAPI.getTaskDetails(id));
+        } catch {
+          // The next event or a reload will bring the page up to date.
+        }
+      },
+    );
+  }, [id]);
+
+  // Keep the comment thread and attachments live
+  useEffect(() => {
+    if (!id) return;
+    return subscribeCommentThread(
+      id,
+      (type, event) => {
+        setTask(prev => {
+          if (!prev) return prev;
+          switch (type) {
+            case 'comment.created': {
+              const comment = event.comment!;
+              if (prev.comments.some(c => c.id === comment.id)) return prev;
+              return {
+                ...prev,
+                comments: [...prev.comments, { ...comment, files: [] }],
+                comments_count: prev.comments_count + 1,
+              };
+            }
+            case 'comment.deleted':
+              if (!prev.comments.some(c => c.id === event.comment_id)) return prev;
+              return {
+                ...prev,
+                comments: prev.comments.filter(c => c.id !== event.comment_id),
+                comments_count: prev.comments_count - 1,
+              };
+            case 'file.created':
+              if (event.comment_id) {
+                const file = event.file as CommentFile;
+                return {
+                  ...prev,
+                  comments: prev.comments.map(c =>
+                    c.id === event.comment_id && !c.files?.some(f => f.id === file.id)
+                      ? { ...c, files: [...(c.files || []), file] }
+                      : c
+                  ),
+                };
+              }
+              if (prev.files.some(f => f.id === event.file!.id)) return prev;
+              return { ...prev, files: [...prev.files, event.file as TaskFile] };
+            case 'file.deleted':
+              if (event.comment_id) {
+                return {
+                  ...prev,
+                  comments: prev.comments.map(c =>
+                    c.id === event.comment_id
+                      ? { ...c, files: (c.files || []).filter(f => f.id !== event.file_id) }
+                      : c
+                  ),
+                };
+              }
+              return { ...prev, files: prev.files.filter(f => f.id !== event.file_id) };
+            case 'task.deleted':
+              return null;
+            default:
+              return prev;
+          }
+        });
+      },
+      async () => {
+        try {
+          setTask(await tasksAPI.getTaskDetails(id));
+        } catch {
+          // The next event or a reload will bring the page up to date.
+        }
+      },
+    );
+  }, [id]);
+
+  // Load the authors of comments that arrived live
+  useEffect(() => {
+    const unknownUserIds = [...new Set((task?.comments || []).map(c => c.created_by_user_id))]
+      .filter(userId => !commentUsers[userId]);
+    if (unknownUserIds.length === 0) return;
+    authAPI.getUsersByIds(unknownUserIds)
+      .then(users => setCommentUsers(prev => {
+        const next = { ...prev };
+        users.forEach(u => { next[u.id] = u; });
+        return next;
+      }))
+      .catch(() => {
+        // Comments render without an author name until the next reload.
+      });
+  }, [task?.comments]);
+
   const handleAddComment = async () => {
     if (!newComment.trim() || !id) return;
     
@@ -172,6 +280,42 @@ const TaskDetail = () => {
     setNewCommentFiles((prev) => prev.filter((_, i) => i !== index));
   };
 
+  const handleLoadOlderComments = async () => {
+    if (!id || !task?.comments_next) return;
+    
+    try {
+      setIsLoadingOlderComments(true);
+      // Pages come newest first; the task keeps its comments oldest first
+      const page = await tasksAPI.listCommentsPage(id, task.comments_next);
+      const olderComments = [...page.results].reverse();
+      setTask(prev => prev ? {
+        ...prev,
+        comments: [...olderComments, ...prev.comments],
+        comments_next: page.next,
+      } : prev);
+      
+      const unknownUserIds = [...new Set(olderComments.map(c => c.created_by_user_id))]
+        .filter(userId => !commentUsers[userId]);
+      if (unknownUserIds.length > 0) {
+        const users = await authAPI.getUsersByIds(unknownUserIds);
+        setCommentUsers(prev => {
+          const next = { ...prev };
+          users.forEach(u => { next[u.id] = u; });
+          return next;
+        });
+      }
+    } catch (error) {
+      const errorMessage = error instanceof Error ? error.message : "Failed to load older comments";
+      toast({
+        title: "Error",
+        description: errorMessage,
+        variant: "destructive",
+      });
+    } finally {
+      setIsLoadingOlderComments(false);
+    }
+  };
+
   const handleDeleteTask = async () => {
     if (!id || !task) return;
     
@@ -200,7 +344,7 @@ const TaskDetail = () => {
     if (!id || !task) return;
     
     try {
-      await tasksAPI.updateTaskStatus(id, newStatus);
+      await tasksAPI.updateTaskStatus(id, newStatus, task.version);
       
       // Refresh task details
       const taskDetails = await tasksAPI.getTaskDetails(id);
@@ -301,7 +445,7 @@ const TaskDetail = () => {
       await tasksAPI.updateTask(task.id, {
         title: editTitle,
         description: editDescription,
-      });
+      }, task.version);
       
       // Refresh task details
       const taskDetails = await tasksAPI.getTaskDetails(task.id);
@@ -854,7 +998,21 @@ const TaskDetail = () => {
 
         {/* Comments */}
         <div className="p-6 rounded-xl bg-card border border-border">
-          <h2 className="text-lg font-semibold text-foreground mb-4">Comments</h2>
+          <h2 className="text-lg font-semibold text-foreground mb-4">
+            Comments{task.comments_count ? ` (${task.comments_count})` : ""}
+          </h2>
+          
+          {task.comments_next && (
+            <Button
+              variant="ghost"
+              size="sm"
+              className="mb-4"
+              onClick={handleLoadOlderComments}
+              disabled={isLoadingOlderComments}
+            >
+              {isLoadingOlderComments ? "Loading..." : "Load older comments"}
+            </Button>
+          )}
           
           <div className="space-y-4 mb-6">
             {task.comments && task.comments.length > 0 ? (
@@ -6,5 +6,10 @@ class TaskapiConfig(AppConfig):
     name = 'taskapi'
     
     def ready(self):
-        """Import models when app is ready to ensure they're registered with MongoEngine."""
+        """
+        Import models when app is ready to ensure they're registered with MongoEngine,
+        and register the MongoDB connection (it connects on first use).
+        """
         import taskapi.models  # noqa
+        from taskapi.mongo import register_connection
+        register_connection()
@@ -0,0 +1,225 @@
+"""
+Native async versions of the ``list_tasks`` and ``task_details`` reads.
+
+They return exactly what the synchronous views in ``views`` return, for
+the same parameters. Queries are still built with the MongoEngine
+querysets the sync views use (``visible_tasks``, ``filter_tasks``,
+``page_queryset``), but only their compiled ``find()`` arguments are
+taken, and the query runs on a motor client. Under ASGI a request waiting
+on MongoDB therefore holds no thread, and ``task_details`` fetches the
+task, its comments and its files concurrently.
+
+These are plain Django async views (DRF views are synchronous), routed
+under ``async/`` and authenticated with the same bearer tokens.
+"""
+import asyncio
+import weakref
+from collections import defaultdict
+from asgiref.sync import sync_to_async
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from .authentication import user_from_token
+from .models import Task, Comment, TaskFile, CommentFile
+from .mongo import client_options, list_reads
+from .pagination import InvalidCursor, finish_page, page_queryset, parse_limit
+from .queries import filter_tasks, find_args, parse_fields, visible_tasks
+from .serializers import (
+    TaskSerializer, CommentSerializer, TaskFileSerializer, CommentFileSerializer,
+    serialize_task_rows
+)
+from .views import (
+    COMMENT_ORDERING, TASK_DETAIL_FIELDS, TASK_FIELDS, TASK_LIST_FIELDS, TASK_LIST_ORDERINGS
+)
+
+# One motor client per event loop: a client is bound to the loop it first
+# runs on.
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_database():
+    """The motor database for the running event loop, created on first use."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = AsyncIOMotorClient(**client_options('motor'))
+        _clients[loop] = client
+    return client[settings.MONGO_DATABASE]
+
+
+def _collection(document_class, queryset):
+    # Carry over the queryset's read preference and concern (mongo.list_reads).
+    return get_database()[document_class._get_collection_name()].with_options(
+        read_preference=queryset._read_preference, read_concern=queryset._read_concern,
+    )
+
+
+async def _find(document_class, queryset):
+    """Run a MongoEngine queryset's find() on motor and return the raw rows."""
+    args = find_args(queryset)
+    collection = _collection(document_class, queryset)
+    return await collection.find(
+        args['filter'], args['projection'], sort=args['sort'], limit=args['limit'],
+    ).to_list(None)
+
+
+async def _count(document_class, queryset):
+    collection = _collection(document_class, queryset)
+    return await collection.count_documents(queryset._query)
+
+
+async def _querysets_ready():
+    # Document.objects resolves its pymongo collection (and may create
+    # indexes) synchronously on first use; do that off the event loop.
+    for document_class in (Task, Comment, TaskFile, CommentFile):
+        if document_class._collection is None:
+            await sync_to_async(document_class._get_collection)()
+
+
+def _json(data, response_status=status.HTTP_200_OK):
+    """Render like a DRF Response would."""
+    return HttpResponse(
+        JSONRenderer().render(data), status=response_status, content_type='application/json',
+    )
+
+
+def _user(request):
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    return user_from_token(auth_header.split(' ')[1])
+
+
+def _unauthorized():
+    return _json(
+        {'detail': 'Authentication credentials were not provided.'},
+        status.HTTP_401_UNAUTHORIZED,
+    )
+
+
+async def list_tasks(request):
+    """Async ``list_tasks``: same parameters and output."""
+    user = _user(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        fields = parse_fields(request.GET.get('fields'), TASK_LIST_FIELDS)
+    except ValueError as e:
+        return _json({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+
+    await _querysets_ready()
+    tasks = list_reads(filter_tasks(visible_tasks(user), request.GET), request)
+
+    limit = request.GET.get('limit')
+    cursor = request.GET.get('cursor')
+    if limit is None and cursor is None:
+        if fields:
+            tasks = tasks.only(*fields)
+        return _json(serialize_task_rows(await _find(Task, tasks), fields))
+
+    ordering = request.GET.get('ordering', '-created_at')
+    if ordering not in TASK_LIST_ORDERINGS:
+        return _json(
+            {'error': f"ordering must be one of: {', '.join(TASK_LIST_ORDERINGS)}"},
+            status.HTTP_400_BAD_REQUEST,
+        )
+
+    if fields:
+        # The sort key is needed to build cursors even when not requested.
+        tasks = tasks.only(*fields, ordering.lstrip('-'))
+
+    try:
+        limit = parse_limit(limit, settings.TASK_LIST_DEFAULT_LIMIT, settings.TASK_LIST_MAX_LIMIT)
+        rows = await _find(Task, page_queryset(tasks, ordering, limit, cursor))
+        rows, next_cursor, prev_cursor = finish_page(rows, ordering, limit, cursor)
+    except InvalidCursor as e:
+        return _json({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return _json({'error': 'limit must be a positive integer'}, status.HTTP_400_BAD_REQUEST)
+
+    return _json({
+        'results': serialize_task_rows(rows, fields),
+        'next': next_cursor,
+        'prev': prev_cursor,
+    })
+
+
+async def _latest_comments(task_id):
+    comments = Comment.objects.filter(task_id=task_id)
+    rows, count = await asyncio.gather(
+        _find(Comment, page_queryset(comments, COMMENT_ORDERING, settings.TASK_DETAIL_COMMENTS_LIMIT)),
+        _count(Comment, comments),
+    )
+    rows, comments_next, _ = finish_page(rows, COMMENT_ORDERING, settings.TASK_DETAIL_COMMENTS_LIMIT)
+    comments = [Comment._from_son(row) for row in reversed(rows)]
+
+    files_by_comment = defaultdict(list)
+    if comments:
+        comment_files = CommentFile.objects.filter(comment_id__in=[comment.id for comment in comments])
+        for row in await _find(CommentFile, comment_files):
+            comment_file = CommentFile._from_son(row)
+            files_by_comment[comment_file.comment_id].append(comment_file)
+
+    comments_data = []
+    for comment in comments:
+        comment_data = CommentSerializer(comment).data
+        comment_data['files'] = CommentFileSerializer(files_by_comment[comment.id], many=True).data
+        comments_data.append(comment_data)
+    return comments_data, count, comments_next
+
+
+async def _task_files(task_id):
+    rows = await _find(TaskFile, TaskFile.objects.filter(task_id=task_id))
+    return TaskFileSerializer([TaskFile._from_son(row) for row in rows], many=True).data
+
+
+async def task_details(request, task_id):
+    """Async ``task_details``: the task, its comments and its files are fetched concurrently."""
+    user = _user(request)
+    if user is None:
+        return _unauthorized()
+    try:
+        fields = parse_fields(request.GET.get('fields'), TASK_DETAIL_FIELDS)
+    except ValueError as e:
+        return _json({'error': str(e)}, status.HTTP_400_BAD_REQUEST)
+    try:
+        task_id = ObjectId(task_id)
+    except (InvalidId, TypeError):
+        return _json({'error': 'Task not found'}, status.HTTP_404_NOT_FOUND)
+
+    task_fields = None
+    if fields:
+        task_fields = [field for field in fields if field in TASK_FIELDS]
+
+    await _querysets_ready()
+    tasks = Task.objects.filter(id=task_id).limit(1)
+    if task_fields:
+        tasks = tasks.only(*task_fields)
+    want_comments = not fields or 'comments' in fields
+    want_files = not fields or 'files' in fields
+
+    reads = [_find(Task, tasks)]
+    if want_comments:
+        reads.append(_latest_comments(task_id))
+    if want_files:
+        reads.append(_task_files(task_id))
+    # The comment and file reads are wasted if the task does not exist,
+    # which is the rare case; it saves a round trip otherwise.
+    task_rows, *related = await asyncio.gather(*reads)
+    if not task_rows:
+        return _json({'error': 'Task not found'}, status.HTTP_404_NOT_FOUND)
+
+    task_data = TaskSerializer(Task._from_son(task_rows[0]), fields=task_fields).data
+    if want_comments:
+        comments_data, comments_count, comments_next = related.pop(0)
+        task_data['comments'] = comments_data
+        task_data['comments_count'] = comments_count
+        task_data['comments_next'] = comments_next
+    if want_files:
+        task_data['files'] = related.pop(0)
+    return _json(task_data)
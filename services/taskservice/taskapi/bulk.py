@@ -0,0 +1,157 @@
+"""
+Bulk task writes.
+
+``create_tasks`` validates a list of task payloads with a single
+TaskSerializer instance, then writes the valid ones with unordered
+``insert_many`` calls of ``TASK_BULK_BATCH_SIZE`` documents, mapping any
+per-document write errors back to the index of the item that caused them.
+
+``update_tasks`` applies one validated field patch to every task matched
+by a list of ids and/or the list_tasks filters, as a single ``update_many``
+scoped to what the user may see.
+"""
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from pymongo.errors import BulkWriteError
+from rest_framework import serializers
+from .events import RESYNC, publish_local
+from .list_cache import invalidate_task_lists
+from .models import Task
+from .queries import FILTER_PARAMS, visible_tasks, filter_tasks
+from .serializers import TaskSerializer
+
+
+def validate_items(serializer, items):
+    """
+    Validate each item with ``serializer.run_validation``.
+
+    Returns ``(valid, errors)``: a list of ``(index, validated_data)`` and a
+    dict of index to error detail.
+    """
+    valid = []
+    errors = {}
+    for index, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors[index] = {'non_field_errors': ['Expected an object.']}
+            continue
+        try:
+            valid.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as e:
+            errors[index] = e.detail
+    return valid, errors
+
+
+def insert_documents(document_class, documents, batch_size):
+    """
+    Insert documents with unordered ``insert_many`` batches.
+
+    Returns a list with, per document, its ``_id`` or the write error
+    message when that document was rejected.
+    """
+    collection = document_class._get_collection()
+    rows = [document.to_mongo().to_dict() for document in documents]
+    failures = {}
+    for start in range(0, len(rows), batch_size):
+        try:
+            collection.insert_many(rows[start:start + batch_size], ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details['writeErrors']:
+                failures[start + write_error['index']] = write_error['errmsg']
+    return [
+        {'error': failures[position]} if position in failures else {'id': row['_id']}
+        for position, row in enumerate(rows)
+    ]
+
+
+def create_tasks(items, user):
+    """
+    Create tasks from a list of payloads on behalf of ``user``.
+
+    Returns one result per item, in order: ``{'index', 'status': 'created',
+    'id'}`` or ``{'index', 'status': 'error', 'errors'}``.
+    """
+    valid, errors = validate_items(TaskSerializer(), items)
+    documents = [Task(created_by_user_id=user.id, **data) for _, data in valid]
+    written = insert_documents(Task, documents, settings.TASK_BULK_BATCH_SIZE)
+
+    results = [None] * len(items)
+    teams = set()
+    for index, detail in errors.items():
+        results[index] = {'index': index, 'status': 'error', 'errors': detail}
+    for (index, _), document, outcome in zip(valid, documents, written):
+        if 'id' in outcome:
+            results[index] = {'index': index, 'status': 'created', 'id': str(outcome['id'])}
+            document.id = outcome['id']
+            teams.add(document.team_id)
+            publish_local('task.created', document)
+        else:
+            results[index] = {
+                'index': index, 'status': 'error', 'errors': {'non_field_errors': [outcome['error']]},
+            }
+    if teams:
+        invalidate_task_lists(*teams)
+    return results
+
+
+# Fields a bulk patch may set; users other than team leaders (admins
+# included, as in update_task_status) may only move tasks assigned to them
+# between statuses.
+BULK_UPDATE_FIELDS = ('status', 'priority', 'assigned_to_user_id', 'due_date', 'team_id')
+MEMBER_BULK_UPDATE_FIELDS = ('status',)
+
+
+def update_tasks(user, patch, ids=None, filters=None):
+    """
+    Set the fields in ``patch`` on every matching task the user may see.
+
+    Tasks are matched by ``ids`` and/or ``filters`` (list_tasks filter
+    params); at least one is required. Raises ValidationError for invalid
+    input and returns ``(matched, modified)``.
+    """
+    if not isinstance(patch, dict) or not patch:
+        raise serializers.ValidationError({'patch': ['Expected a non-empty object.']})
+    is_leader = getattr(user, 'role', None) == 'TEAM_LEADER'
+    allowed = BULK_UPDATE_FIELDS if is_leader else MEMBER_BULK_UPDATE_FIELDS
+    unknown = sorted(set(patch) - set(allowed))
+    if unknown:
+        raise serializers.ValidationError({'patch': [f'Cannot bulk update: {", ".join(unknown)}']})
+
+    serializer = TaskSerializer(data=patch, partial=True, fields=list(allowed))
+    serializer.is_valid(raise_exception=True)
+
+    if not ids and not filters:
+        raise serializers.ValidationError({'non_field_errors': ['Provide ids or filter.']})
+    tasks = visible_tasks(user)
+    if not is_leader:
+        tasks = tasks.filter(assigned_to_user_id=user.id)
+    if ids:
+        if not isinstance(ids, list) or len(ids) > settings.TASK_BULK_MAX_ITEMS:
+            raise serializers.ValidationError(
+                {'ids': [f'Expected a list of at most {settings.TASK_BULK_MAX_ITEMS} ids.']}
+            )
+        try:
+            tasks = tasks.filter(id__in=[ObjectId(task_id) for task_id in ids])
+        except (InvalidId, TypeError):
+            raise serializers.ValidationError({'ids': ['Invalid task id.']})
+    if filters:
+        unknown = sorted(set(filters) - set(FILTER_PARAMS)) if isinstance(filters, dict) else ['filter']
+        if unknown:
+            raise serializers.ValidationError({'filter': [f'Unknown filter: {", ".join(unknown)}']})
+        if not any(filters.values()):
+            # filter_tasks skips empty values; never let them widen the
+            # update to every visible task.
+            raise serializers.ValidationError({'filter': ['Filter has no values.']})
+        try:
+            tasks = filter_tasks(tasks, filters, strict=True)
+        except ValueError as e:
+            raise serializers.ValidationError({'filter': [str(e)]})
+
+    updates = {f'set__{field}': value for field, value in serializer.validated_data.items()}
+    result = tasks.update(full_result=True, inc__version=1, **updates)
+    if result.modified_count:
+        # The modified tasks are not known here; streams refetch instead,
+        # and every cached list is dropped.
+        invalidate_task_lists()
+        publish_local(RESYNC)
+    return result.matched_count, result.modified_count
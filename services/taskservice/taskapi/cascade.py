@@ -0,0 +1,118 @@
+"""
+Background cascade delete for tasks and comments.
+
+Deleting a task only writes a tombstone (``Task.deleted_at``) in the
+request; ``schedule_task_cascade`` then removes its comments (with batched
+``delete_many`` calls), comment files and task files on a worker thread,
+releases their storage from a pool of unlink workers, and finally removes
+the tombstone itself. Documents are always deleted before their storage is
+released, and a file's storage is only released by the caller whose delete
+removed its document, so a crash can only leak storage (which the
+``sweep_orphans`` command reclaims) and a concurrent sweep can never
+release it twice.
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from .models import Task, Comment, TaskFile, CommentFile
+from .storage import release_blob, remove_file
+
+logger = logging.getLogger(__name__)
+
+_jobs = None
+_unlinkers = None
+_pools_lock = threading.Lock()
+
+
+def _pools():
+    global _jobs, _unlinkers
+    with _pools_lock:
+        if _jobs is None:
+            _jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='cascade')
+            _unlinkers = ThreadPoolExecutor(
+                max_workers=settings.TASK_CASCADE_WORKERS, thread_name_prefix='cascade-unlink',
+            )
+        return _jobs, _unlinkers
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def release_files(rows):
+    """
+    Release the storage behind raw TaskFile/CommentFile rows (dicts with
+    ``file`` and optionally ``sha256``), in parallel on the unlink pool.
+
+    Blob references are released once per digest with the combined count.
+    """
+    blob_refs = Counter(row['sha256'] for row in rows if row.get('sha256'))
+    legacy_files = [row['file'] for row in rows if not row.get('sha256')]
+    _, unlinkers = _pools()
+    futures = [unlinkers.submit(release_blob, sha256, count) for sha256, count in blob_refs.items()]
+    futures += [unlinkers.submit(remove_file, relative_path) for relative_path in legacy_files]
+    for future in futures:
+        future.result()
+
+
+def delete_file_rows(document_class, rows):
+    """
+    Delete raw TaskFile/CommentFile rows and release the storage of those
+    this call removed; rows already deleted by someone else are skipped.
+
+    Returns the number of documents deleted.
+    """
+    collection = document_class._get_collection()
+    deleted = [row for row in rows if collection.delete_one({'_id': row['_id']}).deleted_count]
+    release_files(deleted)
+    return len(deleted)
+
+
+def _delete_comment_files(comment_ids):
+    rows = list(CommentFile.objects(comment_id__in=comment_ids).only('file', 'sha256').as_pymongo())
+    return delete_file_rows(CommentFile, rows)
+
+
+def cascade_task(task_id):
+    """Remove a tombstoned task with everything that belongs to it."""
+    batch_size = settings.TASK_CASCADE_BATCH_SIZE
+    comment_ids = Comment.objects(task_id=task_id).scalar('id')
+    comments = files = 0
+    for batch in _batches(list(comment_ids), batch_size):
+        files += _delete_comment_files(batch)
+        comments += Comment.objects(id__in=batch).delete()
+
+    while True:
+        rows = list(TaskFile.objects(task_id=task_id).only('file', 'sha256').limit(batch_size).as_pymongo())
+        if not rows:
+            break
+        files += delete_file_rows(TaskFile, rows)
+
+    Task.all_objects(id=task_id, deleted_at__ne=None).delete()
+    logger.info('Cascade deleted task %s: %d comments, %d files', task_id, comments, files)
+
+
+def cascade_comment_files(comment_id):
+    """Remove the files of an already deleted comment."""
+    _delete_comment_files([comment_id])
+
+
+def _run(job, *args):
+    try:
+        job(*args)
+    except Exception:
+        # The tombstone/orphans stay behind; sweep_orphans retries them.
+        logger.exception('Cascade job %s%r failed', job.__name__, args)
+
+
+def schedule_task_cascade(task_id):
+    jobs, _ = _pools()
+    return jobs.submit(_run, cascade_task, task_id)
+
+
+def schedule_comment_cascade(comment_id):
+    jobs, _ = _pools()
+    return jobs.submit(_run, cascade_comment_files, comment_id)
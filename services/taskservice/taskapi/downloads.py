@@ -0,0 +1,202 @@
+"""
+Conditional and byte-range responses for task and comment attachments.
+
+Attachments never change once stored (content-addressed blobs are named by
+their SHA-256, older files by a random UUID), so every response carries a
+strong ETag and a long-lived ``Cache-Control``. Revalidation with
+``If-None-Match``/``If-Modified-Since`` answers 304 without touching the
+file, and ``Range`` requests (single or multiple ranges, honouring
+``If-Range``) answer 206 so browsers can seek in and resume large files.
+
+With ``TASK_FILE_SERVING`` set to ``nginx`` or ``sendfile``, the view only
+authorizes, looks up and revalidates; the bytes (and Range handling) are
+left to the front proxy through ``X-Accel-Redirect`` or ``X-Sendfile``.
+"""
+import mimetypes
+import os
+import re
+import secrets
+from urllib.parse import quote
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+MAX_RANGES = 16
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+# For a response that may be replaced at the same URL (an original served
+# while its preview cannot be rendered): cache, but revalidate every time.
+REVALIDATE_CACHE_CONTROL = 'private, no-cache'
+
+_RANGE_SPEC = re.compile(r'^(\d*)-(\d*)$')
+
+
+def file_etag(file_document, stat):
+    """Strong ETag for an attachment: its digest, or id/size/mtime for legacy files."""
+    if file_document.sha256:
+        return quote_etag(file_document.sha256)
+    return quote_etag(f'{file_document.id}-{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header against a file of ``size`` bytes.
+
+    Returns a list of inclusive ``(start, end)`` pairs, an empty list when
+    no range is satisfiable, or None when the header is malformed or asks
+    for too many ranges (in which case the whole file is sent).
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+    specs = [spec.strip() for spec in specs.split(',') if spec.strip()]
+    if not specs or len(specs) > MAX_RANGES:
+        return None
+
+    ranges = []
+    for spec in specs:
+        match = _RANGE_SPEC.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if first == '':
+            # Suffix range: the last N bytes.
+            length = int(last)
+            if length == 0:
+                continue
+            ranges.append((max(size - length, 0), size - 1))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        if start >= size:
+            continue
+        end = int(last) if last else size - 1
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        # Weak comparison: W/"x" matches "x".
+        return '*' in etags or etag in (tag.removeprefix('W/') for tag in etags)
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _range_applies(request, etag, mtime):
+    """``If-Range`` only keeps the Range header when the validator still matches."""
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def _offload(file_document, file_path, content_type):
+    """Hand the body off to the front proxy, or return None to stream from Python."""
+    mode = settings.TASK_FILE_SERVING
+    if mode == 'python':
+        return None
+    response = HttpResponse(content_type=content_type)
+    if mode == 'nginx':
+        prefix = settings.TASK_FILE_ACCEL_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(file_document.file)}'
+    elif mode == 'sendfile':
+        response['X-Sendfile'] = os.path.abspath(file_path)
+    else:
+        raise ValueError(f'Unknown TASK_FILE_SERVING mode: {mode!r}')
+    return response
+
+
+def _read_range(file_path, start, end):
+    with open(file_path, 'rb') as file_handle:
+        file_handle.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file_handle.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _multipart_ranges(file_path, ranges, size, content_type, boundary):
+    """Return (body iterator, content length) for a multipart/byteranges response."""
+    parts = []
+    length = 0
+    for start, end in ranges:
+        head = (
+            f'\r\n--{boundary}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+        ).encode()
+        parts.append((head, start, end))
+        length += len(head) + end - start + 1
+    tail = f'\r\n--{boundary}--\r\n'.encode()
+    length += len(tail)
+
+    def body():
+        for head, start, end in parts:
+            yield head
+            yield from _read_range(file_path, start, end)
+        yield tail
+
+    return body(), length
+
+
+def serve_file(request, file_document, download=False, cache_control=IMMUTABLE_CACHE_CONTROL):
+    """
+    Build the response for a TaskFile/CommentFile, honouring conditional
+    and Range request headers.
+    """
+    file_path = os.path.join(settings.MEDIA_ROOT, file_document.file)
+    stat = os.stat(file_path)
+    size = stat.st_size
+    etag = file_etag(file_document, stat)
+    content_type = 'application/octet-stream'
+    if not download:
+        content_type = mimetypes.guess_type(file_path)[0] or content_type
+
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponse(status=304)
+    elif (offloaded := _offload(file_document, file_path, content_type)) is not None:
+        response = offloaded
+    else:
+        ranges = None
+        range_header = request.META.get('HTTP_RANGE')
+        if range_header and _range_applies(request, etag, stat.st_mtime):
+            ranges = parse_range_header(range_header, size)
+
+        if ranges is None:
+            response = FileResponse(open(file_path, 'rb'), content_type=content_type)
+        elif not ranges:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            response = StreamingHttpResponse(
+                _read_range(file_path, start, end), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            boundary = secrets.token_hex(16)
+            body, length = _multipart_ranges(file_path, ranges, size, content_type, boundary)
+            response = StreamingHttpResponse(
+                body, status=206, content_type=f'multipart/byteranges; boundary={boundary}',
+            )
+            response['Content-Length'] = str(length)
+
+    filename = os.path.basename(file_document.file)
+    disposition = 'attachment' if download else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    response['Cache-Control'] = cache_control
+    return response
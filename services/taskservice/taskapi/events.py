@@ -0,0 +1,405 @@
+"""
+Live task change events.
+
+Writes become small events (``task.created``, ``task.updated``,
+``task.status``, ``task.deleted``, ``comment.created``,
+``comment.deleted``, ``file.created``, ``file.deleted``) carrying the
+changed task row, comment or file, and are fanned out to the streams open
+on this process (the ``tasks/events/`` Server-Sent Events feed and the
+per-task comment WebSockets in ``sockets``), filtered by what each user
+may see.
+
+Events come from one of two sources, chosen by ``TASK_EVENTS_SOURCE``:
+
+- ``changestream``: a watcher thread tails a MongoDB change stream on the
+  task, comment and file collections, so writes from every process (bulk
+  endpoints and management commands included) are published.
+- ``local``: the views publish their own writes in-process. No replica set
+  is needed, but only writes handled by this process are seen.
+
+``auto`` uses the change stream when MongoDB is a replica set. The source
+is picked when the first stream opens. Each stream has a bounded queue; a
+stream that falls behind gets ``resync`` and is closed, and the client
+refetches instead of receiving a partial history.
+"""
+import asyncio
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from pymongo.errors import PyMongoError
+from .models import Task, Comment, TaskFile, CommentFile
+from .serializers import (
+    CommentSerializer, TaskFileSerializer, CommentFileSerializer, serialize_task_rows
+)
+
+logger = logging.getLogger(__name__)
+
+RESYNC = 'resync'
+SOURCES = ('auto', 'changestream', 'local')
+
+
+def _event(event_type, task_row, previous_row=None, **data):
+    event = {
+        'type': event_type,
+        'task_id': str(task_row['_id']),
+        'team_id': task_row.get('team_id'),
+        'assigned_to_user_id': task_row.get('assigned_to_user_id'),
+        'data': {'task_id': str(task_row['_id']), **data},
+    }
+    if previous_row is not None:
+        # Streams that saw the task before the change also get it, so
+        # they can drop a task reassigned or moved away from them.
+        event['previous_team_id'] = previous_row.get('team_id')
+        event['previous_assigned_to_user_id'] = previous_row.get('assigned_to_user_id')
+    return event
+
+
+def task_event(event_type, task_row, previous_row=None):
+    """
+    Build a task event from a raw task row (``to_mongo()`` or pymongo dict),
+    optionally with the row's team and assignee before the change.
+    """
+    if event_type == 'task.deleted':
+        return _event(event_type, task_row)
+    return _event(event_type, task_row, previous_row, task=serialize_task_rows([task_row])[0])
+
+
+def comment_event(event_type, comment, task_row):
+    """Build a comment event for a Comment document on the given raw task row."""
+    if event_type == 'comment.deleted':
+        return _event(event_type, task_row, comment_id=str(comment.id))
+    return _event(event_type, task_row, comment=CommentSerializer(comment).data)
+
+
+def file_event(event_type, file_document, task_row):
+    """Build a file event for a TaskFile or CommentFile document on the given raw task row."""
+    data = {}
+    if isinstance(file_document, CommentFile):
+        data['comment_id'] = str(file_document.comment_id)
+    if event_type == 'file.deleted':
+        return _event(event_type, task_row, file_id=str(file_document.id), **data)
+    serializer = CommentFileSerializer if isinstance(file_document, CommentFile) else TaskFileSerializer
+    return _event(event_type, task_row, file=serializer(file_document).data, **data)
+
+
+def event_json(event):
+    """The event's ``data`` as JSON, encoded once however many streams send it."""
+    if 'json' not in event:
+        event['json'] = json.dumps(event.get('data', {}), cls=DjangoJSONEncoder)
+    return event['json']
+
+
+def format_event(event):
+    """Render an event as one Server-Sent Events message."""
+    if event['type'] == RESYNC:
+        return f'event: {RESYNC}\ndata: {{}}\n\n'
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {event_json(event)}\n\n"
+
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.put(event)
+
+
+class Subscription:
+    """One open event stream: its filters and a bounded queue on its event loop."""
+
+    __slots__ = ('user_id', 'sees_all', 'team_ids', 'task_id', 'types', 'loop', 'queue', 'closed')
+
+    def __init__(self, user, team_ids=(), task_id=None, types=None):
+        self.user_id = user.id
+        self.sees_all = getattr(user, 'role', None) in ('ADMIN', 'TEAM_LEADER')
+        self.team_ids = frozenset(team_ids)
+        self.task_id = task_id
+        self.types = types
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(settings.TASK_EVENTS_QUEUE_SIZE)
+        self.closed = False
+
+    def wants(self, event):
+        """Whether this stream should receive ``event`` (mirrors visible_tasks)."""
+        if event['type'] == RESYNC:
+            return True
+        if self.types is not None and event['type'] not in self.types:
+            return False
+        if self.task_id and event['task_id'] != self.task_id:
+            return False
+        if self.team_ids and not self.team_ids.intersection(
+            (event['team_id'], event.get('previous_team_id'))
+        ):
+            return False
+        return self.sees_all or self.user_id in (
+            event['assigned_to_user_id'], event.get('previous_assigned_to_user_id')
+        )
+
+    def put(self, event):
+        """Queue an event; must run on the subscription's loop."""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind to catch up: drop the backlog and ask the
+            # client to refetch.
+            self.closed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait({'type': RESYNC})
+
+
+class EventBus:
+    """
+    Process-wide fan-out of task events to Subscriptions.
+
+    Streams are indexed by the task they follow (None for all tasks), so
+    an event is only matched against the streams that could want it, and
+    delivered with one callback per event loop rather than per stream.
+    ``publish`` may be called from any thread. Event ids are
+    ``<process epoch>-<sequence>``; the last ``TASK_EVENTS_REPLAY`` events
+    are kept so a reconnecting client (``Last-Event-ID``) gets what it
+    missed, or ``resync`` when that is no longer available.
+    """
+
+    def __init__(self):
+        self.epoch = f'{os.getpid():x}{int(time.time()):x}'
+        self.source = None
+        self._sequence = itertools.count(1)
+        self._recent = deque(maxlen=settings.TASK_EVENTS_REPLAY)
+        self._by_task = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Pick the event source and start the change stream watcher if used (blocking)."""
+        with self._lock:
+            if self.source is not None:
+                return self.source
+            source = settings.TASK_EVENTS_SOURCE
+            if source not in SOURCES:
+                raise ValueError(f"TASK_EVENTS_SOURCE must be one of: {', '.join(SOURCES)}")
+            if source == 'auto':
+                source = 'changestream' if _is_replica_set() else 'local'
+            if source == 'changestream':
+                threading.Thread(target=_watch, args=(self,), name='task-events', daemon=True).start()
+            self.source = source
+            logger.info('Task events source: %s', source)
+            return source
+
+    def subscribe(self, user, team_ids=(), task_id=None, last_event_id=None, types=None):
+        """
+        Register a stream for the running event loop, optionally limited to
+        one task and to event ``types``. Events missed since
+        ``last_event_id`` are queued first.
+        """
+        subscription = Subscription(user, team_ids, task_id, types)
+        with self._lock:
+            if last_event_id:
+                missed = self._since(last_event_id)
+                for event in [{'type': RESYNC}] if missed is None else missed:
+                    if subscription.wants(event):
+                        subscription.put(event)
+            self._by_task[task_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._by_task.get(subscription.task_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._by_task[subscription.task_id]
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._by_task.values())
+
+    def publish(self, event):
+        """Assign the event an id, remember it and deliver it to matching streams."""
+        targets = defaultdict(list)
+        with self._lock:
+            if event['type'] == RESYNC:
+                candidates = itertools.chain.from_iterable(self._by_task.values())
+            else:
+                event['id'] = f'{self.epoch}-{next(self._sequence)}'
+                self._recent.append(event)
+                candidates = itertools.chain(
+                    self._by_task.get(None, ()), self._by_task.get(event['task_id'], ()),
+                )
+            for subscription in candidates:
+                if subscription.wants(event):
+                    targets[subscription.loop].append(subscription)
+        for loop, subscriptions in targets.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, subscriptions, event)
+            except RuntimeError:
+                # The loop has shut down.
+                for subscription in subscriptions:
+                    self.unsubscribe(subscription)
+
+    def _since(self, last_event_id):
+        epoch, _, sequence = last_event_id.partition('-')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        recent = list(self._recent)
+        if not recent:
+            return None
+        first = int(recent[0]['id'].rpartition('-')[2])
+        if sequence < first - 1:
+            return None
+        return [event for event in recent if int(event['id'].rpartition('-')[2]) > sequence]
+
+
+_bus = None
+_bus_lock = threading.Lock()
+
+
+def get_bus():
+    global _bus
+    with _bus_lock:
+        if _bus is None:
+            _bus = EventBus()
+        return _bus
+
+
+def publish_local(event_type, task=None, comment=None, file=None, previous=None):
+    """
+    Publish a write made by this process (a Task document, plus the Comment
+    or file for comment and file events, or the task's raw row before a
+    reassignment or team move as ``previous``) when events are sourced
+    in-process. A no-op, that builds nothing, when the change stream
+    already covers it or no stream was ever opened.
+    """
+    if _bus is None or _bus.source != 'local':
+        return
+    if event_type == RESYNC:
+        event = {'type': RESYNC}
+    elif file is not None:
+        event = file_event(event_type, file, task.to_mongo())
+    elif comment is not None:
+        event = comment_event(event_type, comment, task.to_mongo())
+    else:
+        event = task_event(event_type, task.to_mongo(), previous)
+    _bus.publish(event)
+
+
+def _is_replica_set():
+    try:
+        return bool(Task._get_db().client.admin.command('hello').get('setName'))
+    except PyMongoError:
+        logger.exception('Could not detect the MongoDB topology; publishing task events locally')
+        return False
+
+
+def _task_row(task_id):
+    return Task.all_objects(id=task_id).only('team_id', 'assigned_to_user_id').as_pymongo().first()
+
+
+def _file_task_row(file_document):
+    task_id = getattr(file_document, 'task_id', None)
+    if task_id is None:
+        task_id = Comment.objects(id=file_document.comment_id).scalar('task_id').first()
+    return task_id and _task_row(task_id)
+
+
+# Pre-images of deleted documents need MongoDB 6+ with them enabled on the
+# collection (init_collections does this); without one the delete is skipped.
+_PRE_IMAGE_COLLECTIONS = (Comment, TaskFile, CommentFile)
+
+# Task updates that can take a task out of a stream's view.
+_VISIBILITY_FIELDS = {'team_id', 'assigned_to_user_id'}
+
+
+def events_from_change(change):
+    """Translate one change stream document into task events (possibly none)."""
+    collection = change['ns']['coll']
+    operation = change['operationType']
+    document = change.get('fullDocument')
+
+    if collection == Task._get_collection_name():
+        if document is None:
+            # Hard delete after the cascade, or the task is already gone.
+            return []
+        if operation == 'insert':
+            return [task_event('task.created', document)]
+        updated = set(change.get('updateDescription', {}).get('updatedFields', {}))
+        if document.get('deleted_at'):
+            return [task_event('task.deleted', document)] if 'deleted_at' in updated else []
+        if operation == 'update' and updated <= {'comment_count', 'file_count'}:
+            # Counter bumps accompany comment and file events.
+            return []
+        if operation == 'update' and updated <= {'status', 'version'}:
+            return [task_event('task.status', document)]
+        if operation == 'replace' or updated & _VISIBILITY_FIELDS:
+            before = change.get('fullDocumentBeforeChange')
+            if before is None:
+                # Without the task's pre-image, streams that lost sight of
+                # it cannot be found; have every stream refetch.
+                return [task_event('task.updated', document), {'type': RESYNC}]
+            return [task_event('task.updated', document, before)]
+        return [task_event('task.updated', document)]
+
+    if collection == Comment._get_collection_name():
+        if operation == 'insert':
+            comment = Comment._from_son(document)
+            task_row = _task_row(comment.task_id)
+            return [comment_event('comment.created', comment, task_row)] if task_row else []
+        if operation == 'delete':
+            before = change.get('fullDocumentBeforeChange')
+            task_row = before and _task_row(before['task_id'])
+            if not task_row:
+                return []
+            return [comment_event('comment.deleted', Comment._from_son(before), task_row)]
+
+    for document_class in (TaskFile, CommentFile):
+        if collection != document_class._get_collection_name():
+            continue
+        if operation == 'insert':
+            event_type = 'file.created'
+        elif operation == 'delete':
+            event_type, document = 'file.deleted', change.get('fullDocumentBeforeChange')
+        else:
+            return []
+        if document is None:
+            return []
+        file_document = document_class._from_son(document)
+        task_row = _file_task_row(file_document)
+        return [file_event(event_type, file_document, task_row)] if task_row else []
+    return []
+
+
+def _watch(bus):
+    """Tail the change stream forever, restarting it after errors."""
+    collections = [
+        document_class._get_collection_name() for document_class in (Task,) + _PRE_IMAGE_COLLECTIONS
+    ]
+    pipeline = [{'$match': {
+        'ns.coll': {'$in': collections},
+        'operationType': {'$in': ['insert', 'update', 'replace', 'delete']},
+    }}]
+    resume_token = None
+    while True:
+        try:
+            with Task._get_db().watch(
+                pipeline,
+                full_document='updateLookup',
+                full_document_before_change='whenAvailable',
+                resume_after=resume_token,
+            ) as stream:
+                for change in stream:
+                    resume_token = stream.resume_token
+                    for event in events_from_change(change):
+                        bus.publish(event)
+        except PyMongoError:
+            # The driver already retries resumable errors once, so start a
+            # fresh stream and tell clients they may have missed events.
+            logger.exception('Task change stream failed; restarting')
+            resume_token = None
+            bus.publish({'type': RESYNC})
+            time.sleep(1)
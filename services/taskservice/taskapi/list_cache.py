@@ -0,0 +1,132 @@
+"""
+Response cache for ``list_tasks``.
+
+Rendered responses are stored in the ``task_lists`` cache (an in-process
+LRU by default, or a file or Redis backend, see ``TASK_LIST_CACHE_BACKEND``)
+under a key made of the caller's visibility scope, the normalized filters,
+the ordering, page cursor, limit and fields, where the request's reads go
+(``taskapi.mongo.list_reads``), and the generations of the data the list
+covers:
+
+- the epoch, part of every key;
+- for lists filtered by ``team_id``, that team's generation;
+- for all other lists, the global generation.
+
+A write that can change a list row calls ``invalidate_task_lists`` with
+the task's team, which gives that team and the global generation new
+random values (a write whose teams are unknown renews the epoch). Later
+requests build new keys, so a response cached before a write is never
+served after it; it just ages out. Setting a fresh value, unlike
+incrementing, is atomic on every backend, so concurrent writers can never
+land on the same generation.
+
+Only responses read from the primary are cached by default, so a miss
+that will be cached is read there: such an entry holds at least its
+generation's data and lives ``TASK_LIST_CACHE_TTL`` seconds. With
+``TASK_LIST_CACHE_SECONDARY_READS`` set, misses are read where
+``list_reads`` sends them instead; an entry read from a secondary may miss
+the write that renewed its generation, so those are kept apart and live at
+most ``TASK_LIST_READ_MAX_STALENESS`` seconds (when it is set), and a hit
+can then be up to twice that staleness behind.
+
+Generations live in the same cache, so with the in-process backend each
+process only sees its own writes: use ``file`` or ``redis`` with more than
+one process.
+"""
+import hashlib
+import json
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from . import metrics
+from .queries import FILTER_PARAMS
+
+EPOCH_KEY = 'task_lists:gen:epoch'
+ALL_TEAMS_KEY = 'task_lists:gen:all'
+
+
+def _cache():
+    return caches['task_lists']
+
+
+def _team_key(team_id):
+    return f'task_lists:gen:team:{team_id}'
+
+
+def _new_generation():
+    # Random, so an evicted or concurrently renewed generation never comes
+    # back with a value an old entry was cached under.
+    return uuid.uuid4().hex
+
+
+def _generations(keys):
+    cache = _cache()
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, _new_generation(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def cache_key(user, params, fields, primary=True):
+    """
+    The cache key for a ``list_tasks`` request whose reads go to the
+    primary (or not), or None when it cannot be cached (caching disabled,
+    or a ``team_id`` the view will reject).
+    """
+    if settings.TASK_LIST_CACHE_TTL <= 0:
+        return None
+    filters = {name: params.get(name) for name in FILTER_PARAMS if params.get(name)}
+    team_id = filters.get('team_id')
+    if team_id:
+        try:
+            team_id = filters['team_id'] = int(team_id)
+        except ValueError:
+            return None
+
+    # Leaders and admins see every task, so they share entries.
+    user_role = getattr(user, 'role', None)
+    scope = 'all' if user_role in ('ADMIN', 'TEAM_LEADER') else f'user:{user.id}'
+    generations = _generations([EPOCH_KEY, _team_key(team_id) if team_id else ALL_TEAMS_KEY])
+    request = json.dumps([
+        scope, primary, sorted(filters.items()), fields,
+        params.get('ordering'), params.get('limit'), params.get('cursor'),
+    ])
+    digest = hashlib.sha256(request.encode()).hexdigest()
+    return f"task_lists:{'.'.join(map(str, generations))}:{digest}"
+
+
+def get_response(key):
+    """Cached response content for ``key``, or None; counted in the metrics."""
+    content = _cache().get(key)
+    if content is None:
+        metrics.TASK_LIST_CACHE_REQUESTS.inc(result='miss')
+    else:
+        metrics.TASK_LIST_CACHE_REQUESTS.inc(result='hit')
+        metrics.TASK_LIST_CACHE_BYTES_SAVED.inc(len(content))
+    hits = metrics.TASK_LIST_CACHE_REQUESTS.value(result='hit')
+    metrics.TASK_LIST_CACHE_HIT_RATIO.set(
+        hits / (hits + metrics.TASK_LIST_CACHE_REQUESTS.value(result='miss'))
+    )
+    return content
+
+
+def set_response(key, content, primary=True):
+    """Store response content read from the primary (or a secondary)."""
+    timeout = settings.TASK_LIST_CACHE_TTL
+    if not primary and settings.TASK_LIST_READ_MAX_STALENESS > 0:
+        timeout = min(timeout, settings.TASK_LIST_READ_MAX_STALENESS)
+    _cache().set(key, content, timeout)
+
+
+def invalidate_task_lists(*team_ids):
+    """
+    Make cached lists covering ``team_ids`` unreachable, or every cached
+    list when no team is given.
+    """
+    if team_ids:
+        keys = [_team_key(team_id) for team_id in set(team_ids)] + [ALL_TEAMS_KEY]
+    else:
+        keys = [EPOCH_KEY]
+    _cache().set_many({key: _new_generation() for key in keys}, None)
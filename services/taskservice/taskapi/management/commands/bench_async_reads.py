@@ -0,0 +1,132 @@
+"""
+Django management command that benchmarks the async read path.
+
+Seeds --tasks tasks (with comments) in a throwaway team, then drives the
+ASGI application in process with 1, 50 and 500 requests in flight against
+both the sync DRF views (tasks/, tasks/<id>/) and their async versions
+(async/tasks/, async/tasks/<id>/), and reports requests/sec and p50/p95
+latency for each. The sync views run the way the ASGI server runs them,
+on Django's sync thread. Deletes what it created. Needs a reachable MongoDB.
+"""
+import asyncio
+import statistics
+import time
+from datetime import datetime, timedelta
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from taskapi.models import Task, Comment
+from taskservice.asgi import application
+
+
+async def _get(path, query, token):
+    """Issue one GET to the ASGI application and return its status code."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 8002),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+    response = {}
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+
+    await application(scope, receive, send)
+    disconnected.set()
+    return response['status']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the async list/detail reads against the sync views at several concurrencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=200, help='tasks to seed')
+        parser.add_argument('--comments', type=int, default=5, help='comments per seeded task')
+        parser.add_argument('--requests', type=int, default=1000, help='requests per measurement')
+        parser.add_argument('--concurrency', default='1,50,500',
+                            help='comma-separated numbers of requests in flight')
+        parser.add_argument('--team-id', type=int, default=999998,
+                            help='team the benchmark tasks are created in')
+
+    def handle(self, *args, **options):
+        team_id = options['team_id']
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        token = jwt.encode(
+            {'user_id': 2, 'role': 'TEAM_LEADER', 'token_type': 'access',
+             'exp': datetime.utcnow() + timedelta(hours=1)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+        )
+
+        due_date = datetime.utcnow() + timedelta(days=7)
+        tasks = Task.objects.insert([
+            Task(title=f'Async bench {i}', description='Read path benchmark', created_by_user_id=2,
+                 assigned_to_user_id=4, team_id=team_id, due_date=due_date)
+            for i in range(options['tasks'])
+        ])
+        if options['comments']:
+            Comment.objects.insert([
+                Comment(text=f'Comment {j}', task_id=task.id, created_by_user_id=4)
+                for task in tasks for j in range(options['comments'])
+            ])
+        task_ids = [str(task.id) for task in tasks]
+
+        endpoints = [
+            ('list  sync', lambda i: ('/api/tasks/tasks/', f'team_id={team_id}&limit=50')),
+            ('list  async', lambda i: ('/api/tasks/async/tasks/', f'team_id={team_id}&limit=50')),
+            ('detail sync', lambda i: (f'/api/tasks/tasks/{task_ids[i % len(task_ids)]}/', '')),
+            ('detail async', lambda i: (f'/api/tasks/async/tasks/{task_ids[i % len(task_ids)]}/', '')),
+        ]
+        try:
+            results = asyncio.run(self.measure(endpoints, levels, options['requests'], token))
+        finally:
+            Comment.objects(task_id__in=[task.id for task in tasks]).delete()
+            Task.all_objects(team_id=team_id).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'endpoint':<14} {'in flight':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8}"
+        ))
+        for name, level, rate, p50, p95 in results:
+            self.stdout.write(f'{name:<14} {level:>9} {rate:>9.0f} {p50:>8.1f} {p95:>8.1f}')
+
+    async def measure(self, endpoints, levels, requests, token):
+        results = []
+        for name, target in endpoints:
+            # Warm up connections, collections and compiled serializers.
+            for i in range(10):
+                await _get(*target(i), token)
+            for level in levels:
+                latencies = []
+                semaphore = asyncio.Semaphore(level)
+
+                async def one(i):
+                    async with semaphore:
+                        started = time.perf_counter()
+                        status = await _get(*target(i), token)
+                        latencies.append(time.perf_counter() - started)
+                        if status != 200:
+                            raise CommandError(f'{name}: HTTP {status}')
+
+                started = time.perf_counter()
+                await asyncio.gather(*(one(i) for i in range(requests)))
+                elapsed = time.perf_counter() - started
+                latencies.sort()
+                results.append((
+                    name, level, requests / elapsed,
+                    statistics.median(latencies) * 1000,
+                    latencies[int(len(latencies) * 0.95) - 1] * 1000,
+                ))
+        return results
@@ -0,0 +1,89 @@
+"""
+Django management command that benchmarks bulk task creation.
+
+Creates the same synthetic backlog twice through the API, in process: once
+with one POST to tasks/create/ per task, once with POSTs of --batch-size
+tasks to tasks/bulk/. Reports wall time and tasks/sec for both, then
+deletes every task it created. Needs a reachable MongoDB.
+"""
+import time
+from datetime import datetime, timedelta
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from rest_framework.test import APIClient
+from taskapi.models import Task
+
+
+def _make_items(count, team_id):
+    due_date = (datetime.utcnow() + timedelta(days=14)).isoformat()
+    return [
+        {
+            'title': f'Bench task {i}',
+            'description': 'Imported from the sprint backlog',
+            'assigned_to_user_id': 4,
+            'team_id': team_id,
+            'due_date': due_date,
+            'priority': ('LOW', 'MEDIUM', 'HIGH')[i % 3],
+        }
+        for i in range(count)
+    ]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark tasks/bulk/ against one create_task call per task'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=500, help='tasks to create per path')
+        parser.add_argument('--batch-size', type=int, default=None,
+                            help='TASK_BULK_BATCH_SIZE to use (defaults to the setting)')
+        parser.add_argument('--team-id', type=int, default=999999,
+                            help='team the benchmark tasks are created in')
+
+    def handle(self, *args, **options):
+        count = options['count']
+        batch_size = options['batch_size'] or settings.TASK_BULK_BATCH_SIZE
+        items = _make_items(count, options['team_id'])
+
+        token = jwt.encode(
+            {'user_id': 2, 'role': 'TEAM_LEADER', 'token_type': 'access',
+             'exp': datetime.utcnow() + timedelta(hours=1)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+        )
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        created_ids = []
+
+        try:
+            start = time.perf_counter()
+            for item in items:
+                response = client.post('/api/tasks/tasks/create/', item, format='json')
+                if response.status_code != 201:
+                    raise CommandError(f'create_task failed: {response.status_code} {response.data}')
+                created_ids.append(response.data['id'])
+            single = time.perf_counter() - start
+
+            with override_settings(TASK_BULK_BATCH_SIZE=batch_size):
+                start = time.perf_counter()
+                for offset in range(0, count, settings.TASK_BULK_MAX_ITEMS):
+                    response = client.post(
+                        '/api/tasks/tasks/bulk/', items[offset:offset + settings.TASK_BULK_MAX_ITEMS],
+                        format='json',
+                    )
+                    if response.status_code != 201:
+                        raise CommandError(f'bulk create failed: {response.status_code} {response.data}')
+                    created_ids.extend(result['id'] for result in response.data['results'])
+                bulk = time.perf_counter() - start
+        finally:
+            Task.all_objects(id__in=created_ids).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'path':<22} {'tasks':>7} {'seconds':>9} {'tasks/s':>10}"
+        ))
+        self.stdout.write(f"{'create_task x N':<22} {count:>7} {single:>9.3f} {count / single:>10.0f}")
+        self.stdout.write(
+            f"{f'bulk (batch {batch_size})':<22} {count:>7} {bulk:>9.3f} {count / bulk:>10.0f}"
+        )
+        self.stdout.write(self.style.SUCCESS(f'\nSpeedup: {single / bulk:.1f}x'))
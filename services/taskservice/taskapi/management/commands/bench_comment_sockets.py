@@ -0,0 +1,220 @@
+"""
+Django management command that load-tests the comment WebSocket.
+
+Opens --connections sockets on one task (no MongoDB: the sockets
+authenticate as a team leader, which needs no task lookup) twice:
+
+- against a real uvicorn server started on a free local port, with real
+  WebSocket clients over loopback, and reports the growth of the server
+  process's RSS per connection: the actual cost of an open socket,
+  including uvicorn's transport, protocol and websockets buffers;
+- against ``taskapi.sockets`` in process with in-memory ASGI receive/send
+  channels, and reports the memory the application itself keeps per
+  socket (tracemalloc, net of the harness) and fan-out latency: the time
+  for one published comment event to reach every socket, over --events
+  events published from a worker thread the way a view publishes them.
+
+The server run needs the ``websockets`` package (uvicorn's WebSocket
+protocol) and Linux ``/proc``; --skip-server leaves it out.
+"""
+import asyncio
+import gc
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+import jwt
+from bson.objectid import ObjectId
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+from taskapi import events
+from taskapi.events import EventBus, comment_event
+from taskapi.models import Comment
+from taskapi.sockets import comment_socket
+
+try:
+    import websockets
+except ImportError:  # Only needed for the real server run.
+    websockets = None
+
+SERVER_START_TIMEOUT = 30
+# Clients connecting at once to the real server.
+CONNECT_BATCH = 100
+
+
+class FakeSocket:
+    """In-memory ASGI WebSocket channels that count delivered frames."""
+
+    __slots__ = ('inbox', 'received', 'accepted', 'closed')
+
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.inbox.put_nowait({'type': 'websocket.connect'})
+        self.received = 0
+        self.accepted = False
+        self.closed = False
+
+    async def receive(self):
+        return await self.inbox.get()
+
+    async def send(self, message):
+        if message['type'] == 'websocket.accept':
+            self.accepted = True
+        elif message['type'] == 'websocket.send':
+            self.received += 1
+        elif message['type'] == 'websocket.close':
+            self.closed = True
+
+
+def _kib(size):
+    return f'{size / 1024:.1f} KiB'
+
+
+def _rss(pid):
+    """Resident set size of a process in bytes, from /proc."""
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    raise CommandError(f'No VmRSS for process {pid}')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = 'Measure memory per open comment WebSocket and event fan-out latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=2000, help='sockets to open')
+        parser.add_argument('--events', type=int, default=20, help='comment events to fan out')
+        parser.add_argument('--skip-server', action='store_true',
+                            help='only run the in-process measurement')
+
+    def handle(self, *args, **options):
+        token = jwt.encode(
+            {'user_id': 2, 'role': 'TEAM_LEADER', 'token_type': 'access',
+             'exp': datetime.utcnow() + timedelta(hours=1)},
+            settings.SIMPLE_JWT['SIGNING_KEY'],
+            algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+        )
+        if not options['skip_server']:
+            if websockets is None:
+                raise CommandError('The server run needs the websockets package (or pass --skip-server)')
+            asyncio.run(self.run_server(token, options['connections']))
+
+        # Queues must hold every event of the run, or sockets would resync.
+        queue_size = max(settings.TASK_EVENTS_QUEUE_SIZE, options['events'])
+        previous_bus = events._bus
+        try:
+            with override_settings(TASK_EVENTS_SOURCE='local', TASK_EVENTS_QUEUE_SIZE=queue_size):
+                events._bus = EventBus()
+                asyncio.run(self.run(token, options['connections'], options['events']))
+        finally:
+            events._bus = previous_bus
+
+    async def run_server(self, token, connections):
+        port = _free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'taskservice.asgi:application',
+             '--host', '127.0.0.1', '--port', str(port), '--ws', 'websockets',
+             '--log-level', 'warning', '--no-access-log'],
+            cwd=settings.BASE_DIR, env={**os.environ, 'TASK_EVENTS_SOURCE': 'local'},
+        )
+        clients = []
+        try:
+            deadline = time.monotonic() + SERVER_START_TIMEOUT
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                    break
+                except OSError:
+                    if server.poll() is not None or time.monotonic() > deadline:
+                        raise CommandError('uvicorn did not start')
+                    await asyncio.sleep(0.1)
+
+            url = f'ws://127.0.0.1:{port}/api/tasks/tasks/{ObjectId()}/comments/live/?token={token}'
+
+            async def connect():
+                clients.append(await websockets.connect(url, ping_interval=None))
+
+            # The first socket loads what every socket needs (event bus,
+            # token cache entry); measure from there.
+            await connect()
+            await asyncio.sleep(0.5)
+            baseline = _rss(server.pid)
+            for start in range(1, connections + 1, CONNECT_BATCH):
+                await asyncio.gather(*(connect() for _ in range(min(CONNECT_BATCH, connections + 1 - start))))
+            await asyncio.sleep(1)
+            opened = _rss(server.pid) - baseline
+        finally:
+            await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+            server.terminate()
+            server.wait(SERVER_START_TIMEOUT)
+
+        self.stdout.write(self.style.SUCCESS(f'{connections} real WebSocket connections to uvicorn'))
+        self.stdout.write(f'  server RSS per connection: {_kib(opened / connections)}'
+                          f'  (total {_kib(opened)})')
+
+    async def run(self, token, connections, event_count):
+        task_row = {'_id': ObjectId(), 'team_id': 1, 'assigned_to_user_id': 4}
+        task_id = str(task_row['_id'])
+        scope = {
+            'type': 'websocket',
+            'path': f'/api/tasks/tasks/{task_id}/comments/live/',
+            'query_string': f'token={token}'.encode(),
+        }
+        bus = events.get_bus()
+
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        sockets = [FakeSocket() for _ in range(connections)]
+        gc.collect()
+        harness = tracemalloc.get_traced_memory()[0] - baseline
+
+        tasks = [asyncio.create_task(comment_socket(scope, s.receive, s.send)) for s in sockets]
+        while bus.subscriber_count < connections:
+            await asyncio.sleep(0.01)
+        # Let every sender task reach its first queue.get().
+        await asyncio.sleep(0.1)
+        gc.collect()
+        opened = tracemalloc.get_traced_memory()[0] - baseline - harness
+        tracemalloc.stop()
+        if not all(s.accepted for s in sockets):
+            raise CommandError('Not every socket was accepted')
+
+        latencies = []
+        for number in range(event_count):
+            comment = Comment(id=ObjectId(), task_id=task_row['_id'], text=f'Comment {number}',
+                              created_by_user_id=2, created_at=datetime.utcnow())
+            event = comment_event('comment.created', comment, task_row)
+            started = time.perf_counter()
+            await asyncio.to_thread(bus.publish, event)
+            while any(s.received <= number for s in sockets):
+                await asyncio.sleep(0)
+            latencies.append(time.perf_counter() - started)
+
+        for s in sockets:
+            s.inbox.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.gather(*tasks)
+        if bus.subscriber_count:
+            raise CommandError(f'{bus.subscriber_count} subscriptions leaked')
+
+        delivered = sum(s.received for s in sockets)
+        self.stdout.write(self.style.SUCCESS(f'{connections} in-process sockets on one task'))
+        self.stdout.write(f'  app state per socket: {_kib(opened / connections)}'
+                          f'  (total {_kib(opened)}, harness {_kib(harness / connections)}/socket excluded;'
+                          f' no server buffers)')
+        self.stdout.write(f'  fan-out per event:    p50 {statistics.median(latencies) * 1000:.1f} ms,'
+                          f' max {max(latencies) * 1000:.1f} ms')
+        self.stdout.write(f'  frames delivered:     {delivered} '
+                          f'({delivered / sum(latencies):.0f}/s)')
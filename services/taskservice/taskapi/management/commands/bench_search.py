@@ -0,0 +1,129 @@
+"""
+Django management command that benchmarks task search latency.
+
+Seeds --tasks tasks (one comment each) spread over --teams teams and 500
+assignees, then issues --requests searches through the API, in process,
+for a common and a rare term as a team leader (every task), a team leader
+filtering by team and a member (their own tasks, the scope that joins
+comment matches to their task). Reports p50/p95/max latency for each and
+deletes what it created. Needs a reachable MongoDB; seeding 1M tasks takes
+a few minutes.
+"""
+import statistics
+import time
+from datetime import datetime, timedelta
+import jwt
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.test import APIClient
+from taskapi.models import Task, Comment
+
+WORDS = (
+    'invoice', 'deploy', 'release', 'review', 'migration', 'backup', 'upgrade', 'billing',
+    'onboarding', 'incident', 'report', 'refactor', 'dashboard', 'cache', 'search', 'export',
+)
+ASSIGNEES = 500
+FIRST_ASSIGNEE = 100000
+
+
+def _token(user_id, role):
+    return jwt.encode(
+        {'user_id': user_id, 'role': role, 'token_type': 'access',
+         'exp': datetime.utcnow() + timedelta(hours=1)},
+        settings.SIMPLE_JWT['SIGNING_KEY'],
+        algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Benchmark tasks/search/ latency for leaders, team filters and members'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tasks', type=int, default=100000, help='tasks to seed')
+        parser.add_argument('--teams', type=int, default=100, help='teams to spread them over')
+        parser.add_argument('--requests', type=int, default=200, help='searches per measurement')
+        parser.add_argument('--first-team-id', type=int, default=900000,
+                            help='first team the benchmark tasks are created in')
+
+    def handle(self, *args, **options):
+        first_team = options['first_team_id']
+        team_ids = list(range(first_team, first_team + options['teams']))
+        Task.ensure_indexes()
+        Comment.ensure_indexes()
+
+        self.stdout.write(f"Seeding {options['tasks']} tasks...")
+        try:
+            self.seed(options['tasks'], team_ids)
+            leader = APIClient()
+            leader.credentials(HTTP_AUTHORIZATION=f"Bearer {_token(2, 'TEAM_LEADER')}")
+            member = APIClient()
+            member.credentials(HTTP_AUTHORIZATION=f"Bearer {_token(FIRST_ASSIGNEE, 'MEMBER')}")
+            # 'invoice' is in every 16th task and comment; 'zebra7' in one task.
+            scenarios = [
+                ('leader common', leader, {'q': 'invoice'}),
+                ('leader rare', leader, {'q': 'zebra7'}),
+                ('team common', leader, {'q': 'invoice', 'team_id': team_ids[0]}),
+                ('member common', member, {'q': 'invoice'}),
+                ('member rare', member, {'q': 'zebra7'}),
+            ]
+            results = [
+                (name, *self.measure(client, params, options['requests']))
+                for name, client, params in scenarios
+            ]
+        finally:
+            task_ids = list(Task.all_objects(team_id__in=team_ids).scalar('id'))
+            for start in range(0, len(task_ids), 10000):
+                Comment.objects(task_id__in=task_ids[start:start + 10000]).delete()
+            Task.all_objects(team_id__in=team_ids).delete()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'scenario':<14} {'hits':>5} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"
+        ))
+        for name, hits, p50, p95, slowest in results:
+            self.stdout.write(f'{name:<14} {hits:>5} {p50:>8.1f} {p95:>8.1f} {slowest:>8.1f}')
+
+    def seed(self, count, team_ids, batch_size=10000):
+        due_date = datetime.utcnow() + timedelta(days=7)
+        tasks = Task._get_collection()
+        comments = Comment._get_collection()
+        for start in range(0, count, batch_size):
+            batch = []
+            for i in range(start, min(start + batch_size, count)):
+                word = WORDS[i % len(WORDS)]
+                title = f'{word} {WORDS[(i // len(WORDS)) % len(WORDS)]} item {i}'
+                if i == count // 2:
+                    title += ' zebra7'
+                batch.append(Task(
+                    title=title, description=f'Follow up on the {word} work', created_by_user_id=2,
+                    assigned_to_user_id=FIRST_ASSIGNEE + i % ASSIGNEES,
+                    team_id=team_ids[i % len(team_ids)], due_date=due_date,
+                ).to_mongo().to_dict())
+            task_ids = tasks.insert_many(batch, ordered=False).inserted_ids
+            comments.insert_many([
+                Comment(
+                    text=f'Checked the {WORDS[(i + 3) % len(WORDS)]} notes', created_by_user_id=2,
+                    task_id=task_id,
+                ).to_mongo().to_dict()
+                for i, task_id in enumerate(task_ids, start)
+            ], ordered=False)
+
+    def measure(self, client, params, requests):
+        path = '/api/tasks/tasks/search/'
+        for _ in range(5):
+            client.get(path, params)
+        latencies = []
+        hits = 0
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = client.get(path, params)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise CommandError(f'search failed: {response.status_code} {response.data}')
+            hits = len(response.data['results'])
+        latencies.sort()
+        return (
+            hits,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.95) - 1] * 1000,
+            latencies[-1] * 1000,
+        )
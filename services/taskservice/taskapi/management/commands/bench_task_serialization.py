@@ -0,0 +1,93 @@
+"""
+Django management command that benchmarks list_tasks serialization.
+
+Compares the MongoEngine + DRF path (build a Task document per raw row, then
+TaskListSerializer and JSONRenderer) with the raw pymongo fast path
+(serialize_task_rows, then JSONRenderer) on synthetic rows shaped like what
+as_pymongo() returns, and checks both produce byte-identical JSON.
+No database connection is needed.
+"""
+import random
+import time
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from taskapi.models import Task
+from taskapi.serializers import TaskListSerializer, serialize_task_rows
+
+
+def _make_rows(count, seed=0):
+    """Build ``count`` raw Task rows as pymongo would return them."""
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    rows = []
+    for i in range(count):
+        created_at = now - timedelta(minutes=i, milliseconds=rng.randrange(1000))
+        rows.append({
+            '_id': ObjectId(),
+            'title': f'Task {i}',
+            'description': 'Lorem ipsum dolor sit amet. ' * rng.randrange(1, 20),
+            'created_by_user_id': rng.randrange(1, 50),
+            'assigned_to_user_id': rng.randrange(1, 500),
+            'status': rng.choice(['TODO', 'IN_PROGRESS', 'DONE']),
+            'due_date': created_at + timedelta(days=rng.randrange(1, 30)),
+            'priority': rng.choice(['LOW', 'MEDIUM', 'HIGH']),
+            'team_id': rng.randrange(1, 40),
+            'created_at': created_at,
+        })
+    return rows
+
+
+class Command(BaseCommand):
+    help = 'Benchmark TaskListSerializer against the raw pymongo fast path'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000',
+                            help='comma-separated row counts to benchmark')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per size; the fastest run is reported')
+        parser.add_argument('--fields', default=None,
+                            help='optional comma-separated field subset, as in ?fields=')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes must be a comma-separated list of integers')
+        fields = None
+        if options['fields']:
+            fields = ['id'] + [f for f in options['fields'].split(',') if f and f != 'id']
+
+        renderer = JSONRenderer()
+
+        def drf_path(rows):
+            tasks = [Task._from_son(row) for row in rows]
+            return renderer.render(TaskListSerializer(tasks, many=True, fields=fields).data)
+
+        def fast_path(rows):
+            return renderer.render(serialize_task_rows(rows, fields))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{'rows':>8} {'drf ms':>10} {'fast ms':>10} {'speedup':>8} {'bytes':>12}"
+        ))
+        for size in sizes:
+            rows = _make_rows(size)
+            if drf_path(rows) != fast_path(rows):
+                raise CommandError(f'Output mismatch at {size} rows')
+
+            timings = {}
+            for name, path in (('drf', drf_path), ('fast', fast_path)):
+                best = float('inf')
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    body = path(rows)
+                    best = min(best, time.perf_counter() - start)
+                timings[name] = best
+
+            self.stdout.write(
+                f"{size:>8} {timings['drf'] * 1000:>10.1f} {timings['fast'] * 1000:>10.1f} "
+                f"{timings['drf'] / timings['fast']:>7.1f}x {len(body):>12}"
+            )
+
+        self.stdout.write(self.style.SUCCESS('\nOutputs were byte-identical for every size.'))
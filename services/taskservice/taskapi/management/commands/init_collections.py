@@ -5,7 +5,8 @@ Since MongoEngine doesn't use Django migrations, this command ensures that
 collections are created by importing the models (which registers them with MongoEngine).
 """
 from django.core.management.base import BaseCommand
-from taskapi.models import Task, Comment, TaskFile, CommentFile
+from pymongo.errors import OperationFailure
+from taskapi.models import Task, Comment, TaskFile, CommentFile, Blob
 
 
 class Command(BaseCommand):
@@ -24,14 +25,34 @@ class Command(BaseCommand):
             Comment.ensure_indexes()
             TaskFile.ensure_indexes()
             CommentFile.ensure_indexes()
+            Blob.ensure_indexes()
             
             self.stdout.write(self.style.SUCCESS('✓ Task collection initialized'))
             self.stdout.write(self.style.SUCCESS('✓ Comment collection initialized'))
             self.stdout.write(self.style.SUCCESS('✓ TaskFile collection initialized'))
             self.stdout.write(self.style.SUCCESS('✓ CommentFile collection initialized'))
+            self.stdout.write(self.style.SUCCESS('✓ Blob collection initialized'))
+            self.enable_pre_images()
             
             self.stdout.write(self.style.SUCCESS('\nAll collections initialized successfully!'))
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error initializing collections: {e}'))
             raise
-
+    
+    def enable_pre_images(self):
+        """
+        Keep pre-images of deleted comments and files so the task event
+        change stream can tell which task they belonged to, and of tasks
+        so a reassigned task reaches its previous assignee (replica sets,
+        MongoDB 6+).
+        """
+        for document_class in (Task, Comment, TaskFile, CommentFile):
+            name = document_class.__name__
+            try:
+                document_class._get_db().command(
+                    'collMod', document_class._get_collection_name(),
+                    changeStreamPreAndPostImages={'enabled': True},
+                )
+                self.stdout.write(self.style.SUCCESS(f'✓ {name} change stream pre-images enabled'))
+            except OperationFailure as e:
+                self.stdout.write(self.style.WARNING(f'{name} pre-images not enabled: {e}'))
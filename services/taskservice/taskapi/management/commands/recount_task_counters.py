@@ -0,0 +1,76 @@
+"""
+Django management command to rebuild the denormalized Task counters.
+
+comment_count and file_count are maintained incrementally by the API; this
+command recomputes them from the Comment, TaskFile and CommentFile
+collections with aggregations and writes back only the tasks that drifted,
+using batched bulk writes.
+"""
+from collections import Counter
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+from taskapi.list_cache import invalidate_task_lists
+from taskapi.models import Task, Comment, TaskFile, CommentFile
+
+
+class Command(BaseCommand):
+    help = 'Recompute comment_count and file_count on every task'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of updates sent per bulk write')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='report drifted tasks without writing')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Recounting task comments and files...'))
+
+        group_by_task = {'$group': {'_id': '$task_id', 'count': {'$sum': 1}}}
+        comment_counts = Counter({
+            row['_id']: row['count'] for row in Comment.objects.aggregate([group_by_task])
+        })
+        file_counts = Counter({
+            row['_id']: row['count'] for row in TaskFile.objects.aggregate([group_by_task])
+        })
+        # Comment files only know their comment; resolve the task through it.
+        comment_file_counts = CommentFile.objects.aggregate([
+            {'$group': {'_id': '$comment_id', 'count': {'$sum': 1}}},
+            {'$lookup': {
+                'from': Comment._get_collection_name(),
+                'localField': '_id',
+                'foreignField': '_id',
+                'as': 'comment',
+            }},
+            {'$unwind': '$comment'},
+            {'$group': {'_id': '$comment.task_id', 'count': {'$sum': '$count'}}},
+        ])
+        for row in comment_file_counts:
+            file_counts[row['_id']] += row['count']
+
+        collection = Task._get_collection()
+        batch = []
+        checked = drifted = 0
+        for task in collection.find({}, {'comment_count': 1, 'file_count': 1}):
+            checked += 1
+            expected = {
+                'comment_count': comment_counts.get(task['_id'], 0),
+                'file_count': file_counts.get(task['_id'], 0),
+            }
+            if all(task.get(field) == value for field, value in expected.items()):
+                continue
+            drifted += 1
+            batch.append(UpdateOne({'_id': task['_id']}, {'$set': expected}))
+            if len(batch) >= options['batch_size']:
+                if not options['dry_run']:
+                    collection.bulk_write(batch, ordered=False)
+                batch = []
+
+        if batch and not options['dry_run']:
+            collection.bulk_write(batch, ordered=False)
+        if drifted and not options['dry_run']:
+            invalidate_task_lists()
+
+        action = 'would be updated' if options['dry_run'] else 'updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Checked {checked} tasks, {drifted} {action}'
+        ))
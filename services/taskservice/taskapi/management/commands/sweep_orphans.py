@@ -0,0 +1,158 @@
+"""
+Django management command to reclaim orphaned task data.
+
+Finishes cascade deletes that never ran (tombstoned tasks), removes
+comments and files whose parent no longer exists, reconciles blob
+reference counts with the files that actually point at them, and deletes
+files on disk that no document references. Anything younger than
+--grace-seconds is left alone so in-flight requests and cascade jobs are
+not raced; for a blob that means no reference was taken on it within the
+window, since an upload adopts its blob before inserting its document.
+"""
+import os
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mongoengine.queryset.visitor import Q
+from taskapi.cascade import cascade_task, delete_file_rows
+from taskapi.models import Task, Comment, TaskFile, CommentFile, Blob
+from taskapi.previews import PREVIEW_DIR, PREVIEW_SUFFIX
+from taskapi.storage import BLOB_DIR, _remove_blob_file
+
+LEGACY_DIRS = ('task_files', 'comment_files')
+
+
+def _missing(document_class, ids, batch_size=1000):
+    """Return the subset of ``ids`` with no ``document_class`` document."""
+    ids = list(ids)
+    existing = set()
+    for start in range(0, len(ids), batch_size):
+        existing.update(
+            document_class._get_collection().distinct('_id', {'_id': {'$in': ids[start:start + batch_size]}})
+        )
+    return [object_id for object_id in ids if object_id not in existing]
+
+
+class Command(BaseCommand):
+    help = 'Finish pending cascade deletes and reclaim orphaned comments, files and blobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-seconds', type=int, default=3600,
+                            help='ignore tombstones and files younger than this')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='report what would be reclaimed without deleting')
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        self.grace = options['grace_seconds']
+        cutoff = datetime.utcnow() - timedelta(seconds=self.grace)
+        self.stdout.write(self.style.SUCCESS('Sweeping orphaned task data...'))
+
+        tombstones = list(Task.all_objects(deleted_at__lte=cutoff).scalar('id'))
+        if not self.dry_run:
+            for task_id in tombstones:
+                cascade_task(task_id)
+        self.report('tombstoned tasks', len(tombstones))
+
+        orphan_tasks = _missing(Task, Comment.objects.distinct('task_id'))
+        orphan_comments = list(
+            Comment.objects(task_id__in=orphan_tasks, created_at__lte=cutoff).scalar('id')
+        )
+        self.delete_files(CommentFile, comment_id__in=orphan_comments, uploaded_at__lte=cutoff)
+        if not self.dry_run:
+            Comment.objects(id__in=orphan_comments).delete()
+        self.report('comments without a task', len(orphan_comments))
+
+        orphan_tasks = _missing(Task, TaskFile.objects.distinct('task_id'))
+        self.report(
+            'task files without a task',
+            self.delete_files(TaskFile, task_id__in=orphan_tasks, uploaded_at__lte=cutoff),
+        )
+
+        orphan_comments = _missing(Comment, CommentFile.objects.distinct('comment_id'))
+        self.report(
+            'comment files without a comment',
+            self.delete_files(CommentFile, comment_id__in=orphan_comments, uploaded_at__lte=cutoff),
+        )
+
+        self.report('blob reference counts corrected', self.reconcile_blobs(cutoff))
+        self.report('unreferenced files on disk', self.remove_stray_files())
+
+    def report(self, label, count):
+        action = 'found' if self.dry_run else 'reclaimed'
+        self.stdout.write(f'✓ {count} {label} {action}')
+
+    def delete_files(self, document_class, **query):
+        rows = list(document_class.objects(**query).only('file', 'sha256').as_pymongo())
+        if self.dry_run:
+            return len(rows)
+        # A cascade job may be deleting the same rows; only the deleter of
+        # a row releases its storage.
+        return delete_file_rows(document_class, rows)
+
+    def reconcile_blobs(self, cutoff):
+        """
+        Set the ref_count of each blob nobody adopted since ``cutoff`` to
+        the number of files using it.
+        """
+        group_by_digest = [
+            {'$match': {'sha256': {'$ne': None}}},
+            {'$group': {'_id': '$sha256', 'count': {'$sum': 1}}},
+        ]
+        references = Counter()
+        for document_class in (TaskFile, CommentFile):
+            for row in document_class.objects.aggregate(group_by_digest):
+                references[row['_id']] += row['count']
+
+        # Blobs stored before last_adopted_at was recorded fall back to created_at.
+        settled = Blob.objects(
+            Q(last_adopted_at__lte=cutoff) | Q(last_adopted_at=None, created_at__lte=cutoff)
+        )
+        corrected = 0
+        for blob in settled.only('ref_count', 'file', 'last_adopted_at').as_pymongo():
+            actual = references.get(blob['_id'], 0)
+            if blob['ref_count'] == actual:
+                continue
+            corrected += 1
+            if self.dry_run:
+                continue
+            # Conditional on the observed count and adoption time: an upload
+            # that adopted the blob since (its document may not be inserted
+            # yet) or a delete that released it wins.
+            unchanged = Blob.objects(
+                id=blob['_id'], ref_count=blob['ref_count'],
+                last_adopted_at=blob.get('last_adopted_at'),
+            )
+            if actual:
+                unchanged.update_one(set__ref_count=actual)
+            elif unchanged.delete():
+                _remove_blob_file(blob['_id'], blob['file'])
+        return corrected
+
+    def remove_stray_files(self):
+        """Delete settled files under media/ that no document references."""
+        media_root = str(settings.MEDIA_ROOT)
+        referenced = set(Blob.objects.scalar('file'))
+        for document_class in (TaskFile, CommentFile):
+            referenced.update(document_class.objects(sha256=None).scalar('file'))
+
+        removed = 0
+        settled = time.time() - self.grace
+        for top in (BLOB_DIR, PREVIEW_DIR) + LEGACY_DIRS:
+            for directory, _, filenames in os.walk(os.path.join(media_root, top)):
+                for filename in filenames:
+                    path = os.path.join(directory, filename)
+                    relative_path = os.path.relpath(path, media_root)
+                    # A preview is kept while its original is referenced
+                    # (and evicted separately); previews stored next to
+                    # their original by older versions are stray.
+                    if top == PREVIEW_DIR:
+                        relative_path = os.path.relpath(relative_path, PREVIEW_DIR).removesuffix(PREVIEW_SUFFIX)
+                    if relative_path in referenced or os.path.getmtime(path) > settled:
+                        continue
+                    removed += 1
+                    if not self.dry_run:
+                        os.remove(path)
+        return removed
@@ -0,0 +1,121 @@
+"""
+Django management command that replays the list_tasks query shapes through
+MongoDB's explain() and reports how well the Task indexes serve them.
+
+For every filter combination the endpoint can issue it prints the winning
+plan (index name or COLLSCAN, plus any in-memory SORT stage), and the number
+of index keys and documents examined against the number of documents returned.
+"""
+from datetime import timedelta
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from taskapi.models import Task
+from taskapi.pagination import page_queryset
+from taskapi.queries import visible_tasks, filter_tasks
+
+
+def _plan_stages(stage):
+    """Flatten a winning plan tree into ``STAGE(index)`` labels, root first."""
+    labels = []
+    while stage:
+        label = stage.get('stage', '?')
+        if stage.get('indexName'):
+            label = f"{label}({stage['indexName']})"
+        labels.append(label)
+        if 'inputStage' in stage:
+            stage = stage['inputStage']
+        elif stage.get('inputStages'):
+            for child in stage['inputStages'][1:]:
+                labels.extend(_plan_stages(child))
+            stage = stage['inputStages'][0]
+        else:
+            stage = None
+    return labels
+
+
+class Command(BaseCommand):
+    help = 'Explain the list_tasks query shapes and report index usage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--team-id', type=int, help='team_id to filter on (default: sampled)')
+        parser.add_argument('--user-id', type=int, help='assignee id to filter on (default: sampled)')
+        parser.add_argument('--status', default=None, help='status to filter on (default: sampled)')
+        parser.add_argument('--limit', type=int, default=settings.TASK_LIST_DEFAULT_LIMIT,
+                            help='page size used for paginated shapes')
+        parser.add_argument('--unpaginated', action='store_true',
+                            help='explain the legacy unsorted, unlimited list instead of pages')
+
+    def handle(self, *args, **options):
+        sample = Task.objects.only('team_id', 'assigned_to_user_id', 'status', 'due_date').first()
+        if sample is None and not (options['team_id'] and options['user_id']):
+            raise CommandError('No tasks found; pass --team-id and --user-id explicitly.')
+
+        team_id = str(options['team_id'] or sample.team_id)
+        user_id = options['user_id'] or sample.assigned_to_user_id
+        task_status = options['status'] or (sample.status if sample else 'TODO')
+        anchor = sample.due_date if sample else None
+        due_from = (anchor - timedelta(days=7)).isoformat() if anchor else None
+        due_to = (anchor + timedelta(days=7)).isoformat() if anchor else None
+
+        leader = SimpleNamespace(id=0, role='TEAM_LEADER')
+        member = SimpleNamespace(id=user_id, role='MEMBER')
+        due_range = {'due_date_from': due_from, 'due_date_to': due_to}
+
+        shapes = [
+            ('leader: all', leader, {}, '-created_at'),
+            ('leader: all by due_date', leader, {}, 'due_date'),
+            ('leader: team', leader, {'team_id': team_id}, '-created_at'),
+            ('leader: team by due_date', leader, {'team_id': team_id}, 'due_date'),
+            ('leader: team+status', leader, {'team_id': team_id, 'status': task_status}, '-created_at'),
+            ('leader: team+status+due range', leader,
+             {'team_id': team_id, 'status': task_status, **due_range}, '-created_at'),
+            ('leader: team+status by due_date', leader,
+             {'team_id': team_id, 'status': task_status}, 'due_date'),
+            ('leader: team+assignee', leader,
+             {'team_id': team_id, 'assigned_to_user_id': user_id}, '-created_at'),
+            ('leader: status', leader, {'status': task_status}, '-created_at'),
+            ('leader: status by due_date', leader, {'status': task_status}, 'due_date'),
+            ('member: all', member, {}, '-created_at'),
+            ('member: all by due_date', member, {}, 'due_date'),
+            ('member: status', member, {'status': task_status}, '-created_at'),
+            ('member: status by due_date', member, {'status': task_status}, 'due_date'),
+            ('member: status+due range', member, {'status': task_status, **due_range}, '-created_at'),
+        ]
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Explaining list_tasks shapes (team_id={team_id}, user_id={user_id}, '
+            f'status={task_status}, {"unpaginated" if options["unpaginated"] else "limit=" + str(options["limit"])})\n'
+        ))
+
+        for label, user, params, ordering in shapes:
+            tasks = filter_tasks(visible_tasks(user), params)
+            if not options['unpaginated']:
+                tasks = page_queryset(tasks, ordering, options['limit'])
+
+            explain = tasks.explain()
+            stats = explain.get('executionStats', {})
+            plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+            # The slot-based engine (MongoDB 7+) nests the plan tree under queryPlan.
+            plan = plan.get('queryPlan', plan)
+            stages = _plan_stages(plan)
+
+            returned = stats.get('nReturned', 0)
+            docs = stats.get('totalDocsExamined', 0)
+            keys = stats.get('totalKeysExamined', 0)
+            ratio = docs / returned if returned else float(docs)
+
+            style = self.style.SUCCESS
+            if 'COLLSCAN' in stages or 'SORT' in stages:
+                style = self.style.ERROR
+            elif ratio > 2:
+                style = self.style.WARNING
+
+            self.stdout.write(style(f'{label}'))
+            self.stdout.write(f"    plan:     {' <- '.join(stages)}")
+            self.stdout.write(
+                f'    examined: {keys} keys, {docs} docs -> returned {returned} '
+                f'(docs/returned {ratio:.1f}, {stats.get("executionTimeMillis", 0)} ms)'
+            )
+
+        self.stdout.write(self.style.SUCCESS('\nIndex report completed.'))
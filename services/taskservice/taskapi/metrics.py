@@ -0,0 +1,209 @@
+"""
+In-process metrics, exported in the Prometheus text format at ``metrics/``.
+
+Counters, gauges and histograms are plain thread-safe objects registered
+in ``REGISTRY`` when created; ``render()`` writes them all out. Values are
+per process, so a scraper should collect from every taskservice process.
+
+``PoolMetrics`` is a pymongo connection pool listener (passed to each
+client by ``taskapi.mongo``) that records how long requests wait to check
+a connection out of the pool, checkout failures (including wait-queue
+timeouts) and how many connections are open and in use. The
+``list_tasks`` response cache (``taskapi.list_cache``) reports lookups,
+its hit ratio and the response bytes it saved.
+"""
+import bisect
+import threading
+import time
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+REGISTRY = []
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{value}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def value(self, **labels):
+        """Current value for one label set (0 if never touched)."""
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _labels(self.label_names, key), value
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, buckets, labels=()):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum.
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def value(self, **labels):
+        """``(count, sum)`` for one label set."""
+        series = self._values.get(self._key(labels))
+        if series is None:
+            return 0, 0.0
+        return sum(series[0]), series[1]
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        names = self.label_names + ('le',)
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', _labels(names, key + (bound,)), cumulative
+            yield f'{self.name}_count', _labels(self.label_names, key), cumulative
+            yield f'{self.name}_sum', _labels(self.label_names, key), total
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+POOL_CHECKOUT_WAIT = Histogram(
+    'taskservice_mongo_pool_checkout_wait_seconds',
+    'Time spent waiting to check a connection out of the MongoDB pool.',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+    labels=('client',),
+)
+POOL_CHECKOUT_FAILURES = Counter(
+    'taskservice_mongo_pool_checkout_failures_total',
+    'Connection checkouts that failed, by reason (timeout is a full wait queue).',
+    labels=('client', 'reason'),
+)
+POOL_CONNECTIONS = Gauge(
+    'taskservice_mongo_pool_connections',
+    'Open connections in the MongoDB pools.',
+    labels=('client',),
+)
+POOL_CHECKED_OUT = Gauge(
+    'taskservice_mongo_pool_checked_out',
+    'Connections currently checked out of the MongoDB pools.',
+    labels=('client',),
+)
+
+
+TASK_LIST_CACHE_REQUESTS = Counter(
+    'taskservice_task_list_cache_requests_total',
+    'list_tasks response cache lookups, by result (hit or miss).',
+    labels=('result',),
+)
+TASK_LIST_CACHE_HIT_RATIO = Gauge(
+    'taskservice_task_list_cache_hit_ratio',
+    'Share of list_tasks response cache lookups that were hits.',
+)
+TASK_LIST_CACHE_BYTES_SAVED = Counter(
+    'taskservice_task_list_cache_bytes_saved_total',
+    'Response bytes served from the list_tasks cache instead of being rebuilt.',
+)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+    """
+    Record pool checkout waits for one kind of client (``client`` label).
+
+    pymongo publishes the start and the end of a checkout from the thread
+    doing the checkout, so the start time is kept in a thread-local.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._started = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - self._started.at, client=self.client)
+        POOL_CHECKED_OUT.inc(client=self.client)
+
+    def connection_check_out_failed(self, event):
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - self._started.at, client=self.client)
+        POOL_CHECKOUT_FAILURES.inc(client=self.client, reason=event.reason)
+
+    def connection_checked_in(self, event):
+        POOL_CHECKED_OUT.dec(client=self.client)
+
+    def connection_created(self, event):
+        POOL_CONNECTIONS.inc(client=self.client)
+
+    def connection_closed(self, event):
+        POOL_CONNECTIONS.dec(client=self.client)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
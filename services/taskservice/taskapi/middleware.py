@@ -0,0 +1,30 @@
+"""
+Middleware that hands read-your-writes tokens to clients.
+
+A successful write response carries an ``X-Read-Your-Writes`` token.
+Clients send it back on later requests, and ``mongo.list_reads`` then
+reads from the primary while the token is fresh. Works under WSGI and
+ASGI, so async views stay async.
+"""
+from asgiref.sync import iscoroutinefunction
+from django.utils.decorators import sync_and_async_middleware
+from .mongo import READ_YOUR_WRITES_HEADER, write_token
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def _mark_write(request, response):
+    if request.method not in SAFE_METHODS and 200 <= response.status_code < 300:
+        response[READ_YOUR_WRITES_HEADER] = write_token()
+    return response
+
+
+@sync_and_async_middleware
+def read_your_writes_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            return _mark_write(request, await get_response(request))
+    else:
+        def middleware(request):
+            return _mark_write(request, get_response(request))
+    return middleware
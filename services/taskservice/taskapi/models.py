@@ -1,5 +1,5 @@
 from datetime import datetime
-from mongoengine import Document, StringField, IntField, DateTimeField, ObjectIdField
+from mongoengine import Document, StringField, IntField, DateTimeField, ObjectIdField, queryset_manager
 
 """
 MongoDB Document Models using MongoEngine
@@ -21,6 +21,21 @@ class Task(Document):
     - priority: Task priority (LOW, MEDIUM, HIGH)
     - created_at: Creation date (datetime)
     - team_id: ID of the team this task belongs to (from teamservice)
+    
+    Denormalized counters (kept up to date with atomic $inc by the views,
+    rebuilt by the recount_task_counters command):
+    - comment_count: Number of comments on the task
+    - file_count: Number of files attached to the task or to its comments
+    
+    version is incremented by every update of the task's own fields (the
+    update, status and bulk update endpoints) and lets clients make updates
+    conditional (If-Match); the counters and the deletion tombstone are
+    written without changing it. Documents written before it existed have
+    none, which counts as version 0.
+    
+    Deleting a task only sets deleted_at (a tombstone); taskapi.cascade
+    removes it with its comments and files in the background. Task.objects
+    hides tombstoned tasks, Task.all_objects includes them.
     """
     
     title = StringField(required=True, max_length=255)
@@ -32,12 +47,64 @@ class Task(Document):
     priority = StringField(required=True, choices=['LOW', 'MEDIUM', 'HIGH'], default='MEDIUM')
     team_id = IntField(required=True)
     created_at = DateTimeField(default=datetime.utcnow)
-    
+    comment_count = IntField(default=0)
+    file_count = IntField(default=0)
+    version = IntField(default=0)
+    deleted_at = DateTimeField()
+    
+    # Compound indexes follow the list_tasks query shapes: equality fields
+    # first, then the pagination sort key (with _id as tie-breaker), then
+    # due_date so range filters are checked on index keys, not documents.
+    # Every filter combination has a created_at and a due_date variant, so
+    # neither ordering needs an in-memory sort (descending orders scan the
+    # same index backwards). Single-field team_id/assigned_to_user_id
+    # indexes are prefixes of these.
     meta = {
         'collection': 'tasks',
-        'indexes': ['team_id', 'created_by_user_id', 'assigned_to_user_id', 'status']
+        'indexes': [
+            'created_by_user_id',
+            {'name': 'created',
+             'fields': ['-created_at', '-id']},
+            {'name': 'due',
+             'fields': ['due_date', 'id']},
+            {'name': 'team_status_created',
+             'fields': ['team_id', 'status', '-created_at', '-id', 'due_date']},
+            {'name': 'team_created',
+             'fields': ['team_id', '-created_at', '-id', 'due_date']},
+            {'name': 'team_status_due',
+             'fields': ['team_id', 'status', 'due_date', 'id']},
+            {'name': 'team_due',
+             'fields': ['team_id', 'due_date', 'id']},
+            {'name': 'assignee_status_created',
+             'fields': ['assigned_to_user_id', 'status', '-created_at', '-id', 'due_date']},
+            {'name': 'assignee_created',
+             'fields': ['assigned_to_user_id', '-created_at', '-id', 'due_date']},
+            {'name': 'assignee_status_due',
+             'fields': ['assigned_to_user_id', 'status', 'due_date', 'id']},
+            {'name': 'assignee_due',
+             'fields': ['assigned_to_user_id', 'due_date', 'id']},
+            {'name': 'status_created',
+             'fields': ['status', '-created_at', '-id']},
+            {'name': 'status_due',
+             'fields': ['status', 'due_date', 'id']},
+            # Only tombstones carry deleted_at; lets the sweeper find them.
+            {'fields': ['deleted_at'], 'sparse': True},
+            # Full-text search (taskapi.search); titles weigh more.
+            {'name': 'task_text',
+             'fields': ['$title', '$description'],
+             'weights': {'title': 10, 'description': 2},
+             'default_language': 'english'},
+        ]
     }
     
+    @queryset_manager
+    def objects(doc_cls, queryset):
+        return queryset.filter(deleted_at=None)
+    
+    @queryset_manager
+    def all_objects(doc_cls, queryset):
+        return queryset
+    
     def __str__(self):
         return f"Task: {self.title} ({self.status})"
 
@@ -60,7 +127,14 @@ class Comment(Document):
     
     meta = {
         'collection': 'comments',
-        'indexes': ['task_id', 'created_by_user_id']
+        'indexes': [
+            'created_by_user_id',
+            # Serves comment windows/pages by task, newest first; its
+            # task_id prefix replaces the former single-field index.
+            {'name': 'task_created', 'fields': ['task_id', '-created_at', '-id']},
+            # Full-text search (taskapi.search).
+            {'name': 'comment_text', 'fields': ['$text'], 'default_language': 'english'},
+        ]
     }
     
     def __str__(self):
@@ -73,19 +147,21 @@ class TaskFile(Document):
     
     Fields:
     - file: File path or reference (string)
+    - sha256: Digest of the content blob (empty for files stored before deduplication)
     - task_id: ID of the task this file belongs to (ObjectId of Task)
     - uploaded_at: Upload date (datetime)
     - uploaded_by_user_id: ID of user who uploaded the file (from userservice)
     """
     
     file = StringField(required=True)
+    sha256 = StringField()
     task_id = ObjectIdField(required=True)
     uploaded_by_user_id = IntField(required=True)
     uploaded_at = DateTimeField(default=datetime.utcnow)
     
     meta = {
         'collection': 'taskfiles',
-        'indexes': ['task_id', 'uploaded_by_user_id']
+        'indexes': ['task_id', 'uploaded_by_user_id', 'sha256']
     }
     
     def __str__(self):
@@ -98,20 +174,52 @@ class CommentFile(Document):
     
     Fields:
     - file: File path or reference (string)
+    - sha256: Digest of the content blob (empty for files stored before deduplication)
     - comment_id: ID of the comment this file belongs to (ObjectId of Comment)
     - uploaded_at: Upload date (datetime)
     - uploaded_by_user_id: ID of user who uploaded the file (from userservice)
     """
     
     file = StringField(required=True)
+    sha256 = StringField()
     comment_id = ObjectIdField(required=True)
     uploaded_by_user_id = IntField(required=True)
     uploaded_at = DateTimeField(default=datetime.utcnow)
     
     meta = {
         'collection': 'commentfiles',
-        'indexes': ['comment_id', 'uploaded_by_user_id']
+        'indexes': ['comment_id', 'uploaded_by_user_id', 'sha256']
     }
     
     def __str__(self):
         return f"CommentFile: {self.file} for comment {self.comment_id}"
+
+
+class Blob(Document):
+    """
+    Blob model representing one stored copy of attachment content in MongoDB.
+    
+    TaskFile and CommentFile documents with the same content share a blob.
+    
+    Fields:
+    - id: SHA-256 hex digest of the content
+    - file: Path of the stored bytes, relative to MEDIA_ROOT (string)
+    - size: Content length in bytes
+    - ref_count: Number of TaskFile/CommentFile documents referencing the blob
+    - created_at: Date the content was first stored (datetime)
+    - last_adopted_at: Date a reference was last taken (datetime)
+    """
+    
+    id = StringField(primary_key=True)
+    file = StringField(required=True)
+    size = IntField(required=True)
+    ref_count = IntField(default=0)
+    created_at = DateTimeField(default=datetime.utcnow)
+    last_adopted_at = DateTimeField()
+    
+    meta = {
+        'collection': 'blobs'
+    }
+    
+    def __str__(self):
+        return f"Blob: {self.id} ({self.ref_count} references)"
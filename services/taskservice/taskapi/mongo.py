@@ -0,0 +1,130 @@
+"""
+MongoDB client configuration.
+
+The MongoEngine connection is registered when the app loads
+(``TaskapiConfig.ready``), but its client is only created by the first
+query, so management commands that never touch MongoDB (``migrate``,
+``makemigrations``, ``check``) do not connect. Pool size, timeouts,
+compression and retries come from the ``MONGO_*`` settings;
+``client_options()`` is shared with the motor client in ``async_views``
+so both clients are configured alike, and both report pool checkout waits
+to ``taskapi.metrics``.
+
+List, search and count reads may be served by replica set secondaries
+(``list_reads``). A client that has just written gets a signed
+``X-Read-Your-Writes`` token (``taskapi.middleware``), and while it is
+fresh its list reads go to the primary, so users see their own changes.
+"""
+import mongoengine
+from django.conf import settings
+from django.core import signing
+from pymongo import ReadPreference
+from pymongo.read_preferences import make_read_preference, read_pref_mode_from_name
+from .metrics import PoolMetrics
+
+READ_YOUR_WRITES_HEADER = 'X-Read-Your-Writes'
+
+POOL_LISTENERS = {
+    'mongoengine': PoolMetrics('mongoengine'),
+    'motor': PoolMetrics('motor'),
+}
+
+
+def client_options(client='mongoengine', event_listeners=(), **overrides):
+    """
+    Keyword arguments for a pymongo (or motor) client built from settings.
+
+    ``client`` selects the pool metrics label; ``event_listeners`` are
+    added to the pool listener, and ``overrides`` replace any option.
+    """
+    options = {
+        'host': settings.MONGO_HOST.split(','),
+        'port': settings.MONGO_PORT,
+        'username': settings.MONGO_USERNAME,
+        'password': settings.MONGO_PASSWORD,
+        'authSource': settings.MONGO_AUTH_DATABASE,
+        'maxPoolSize': settings.MONGO_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGO_MIN_POOL_SIZE,
+        'waitQueueTimeoutMS': settings.MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        'connectTimeoutMS': settings.MONGO_CONNECT_TIMEOUT_MS,
+        'socketTimeoutMS': settings.MONGO_SOCKET_TIMEOUT_MS,
+        'retryReads': settings.MONGO_RETRY_READS,
+        'retryWrites': settings.MONGO_RETRY_WRITES,
+        'event_listeners': [POOL_LISTENERS[client], *event_listeners],
+    }
+    if settings.MONGO_SERVER_SELECTION_TIMEOUT_MS:
+        options['serverSelectionTimeoutMS'] = settings.MONGO_SERVER_SELECTION_TIMEOUT_MS
+    if settings.MONGO_REPLICA_SET:
+        options['replicaSet'] = settings.MONGO_REPLICA_SET
+    if settings.MONGO_COMPRESSORS:
+        options['compressors'] = settings.MONGO_COMPRESSORS
+    options.update(overrides)
+    return options
+
+
+def register_connection(db=None, **options):
+    """
+    (Re)register the default MongoEngine connection without connecting.
+
+    Takes ``client_options()`` arguments; ``db`` defaults to
+    ``MONGO_DATABASE``.
+    """
+    mongoengine.disconnect()
+    mongoengine.register_connection(
+        mongoengine.DEFAULT_CONNECTION_NAME,
+        db=db or settings.MONGO_DATABASE,
+        # What mongoengine.connect() fell back to, without its warning.
+        uuidRepresentation='pythonLegacy',
+        **client_options(**options),
+    )
+
+
+def list_read_preference():
+    """The read preference for list, search and count reads, from settings."""
+    mode = read_pref_mode_from_name(settings.TASK_LIST_READ_PREFERENCE)
+    if mode == ReadPreference.PRIMARY.mode:
+        return ReadPreference.PRIMARY
+    return make_read_preference(mode, None, settings.TASK_LIST_READ_MAX_STALENESS)
+
+
+def _write_signer():
+    return signing.TimestampSigner(salt='taskapi.read-your-writes')
+
+
+def write_token():
+    """A token telling later requests that this client has just written."""
+    return _write_signer().sign('write')
+
+
+def reads_own_writes(request):
+    """Whether the request carries a write token that is still fresh."""
+    token = request.headers.get(READ_YOUR_WRITES_HEADER)
+    if not token:
+        return False
+    try:
+        _write_signer().unsign(token, max_age=settings.TASK_READ_YOUR_WRITES_SECONDS)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def reads_from_primary(request):
+    """Whether ``list_reads`` sends this request's reads to the primary."""
+    return reads_own_writes(request) or list_read_preference() == ReadPreference.PRIMARY
+
+
+def list_reads(queryset, request, primary=False):
+    """
+    Route a list, search or count read.
+
+    It goes to the primary for a client that has just written (or when
+    ``primary`` is set), and otherwise to ``TASK_LIST_READ_PREFERENCE``
+    (secondaries lagging at most ``TASK_LIST_READ_MAX_STALENESS`` seconds)
+    with ``TASK_LIST_READ_CONCERN``. On a standalone server every read
+    goes to that server.
+    """
+    if primary or reads_own_writes(request):
+        return queryset.read_preference(ReadPreference.PRIMARY)
+    return queryset.read_preference(list_read_preference()).read_concern(
+        {'level': settings.TASK_LIST_READ_CONCERN}
+    )
@@ -0,0 +1,124 @@
+"""
+Keyset (cursor) pagination for MongoEngine querysets.
+
+Pages are addressed by the sort key of the row that ended the previous page
+instead of by an offset, so fetching a deep page costs the same index seek
+as fetching the first one. Ties on the sort field are broken by ``_id``.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor token is malformed or belongs to another ordering."""
+
+
+def parse_limit(raw_limit, default, maximum):
+    """Parse the ``limit`` query parameter, clamping it to ``maximum``."""
+    if raw_limit in (None, ''):
+        return default
+    limit = int(raw_limit)
+    if limit < 1:
+        raise ValueError('limit must be a positive integer')
+    return min(limit, maximum)
+
+
+def encode_cursor(ordering, value, object_id, direction):
+    """Build an opaque cursor token pointing at a single row."""
+    if isinstance(value, datetime):
+        value = {'$date': value.isoformat()}
+    payload = {'o': ordering, 'v': value, 'id': str(object_id), 'd': direction}
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token, ordering):
+    """Decode a cursor token produced by :func:`encode_cursor`."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        value = payload['v']
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value['$date'])
+        object_id = ObjectId(payload['id'])
+        direction = payload['d']
+    except (binascii.Error, ValueError, KeyError, TypeError, InvalidId):
+        raise InvalidCursor('Invalid cursor')
+    if payload.get('o') != ordering or direction not in ('next', 'prev'):
+        raise InvalidCursor('Cursor does not match the requested ordering')
+    return value, object_id, direction
+
+
+def _sort_key(item, field):
+    """Return ``(value, _id)`` of a document or a raw pymongo row."""
+    if isinstance(item, dict):
+        return item.get(field), item['_id']
+    return getattr(item, field), item.id
+
+
+def page_queryset(queryset, ordering, limit, cursor=None):
+    """
+    Return the unevaluated queryset that fetches one page (plus one
+    look-ahead row) starting at ``cursor``.
+    """
+    field = ordering.lstrip('-')
+    descending = ordering.startswith('-')
+    direction = 'next'
+
+    if cursor:
+        value, object_id, direction = decode_cursor(cursor, ordering)
+        # Walking forward on an ascending sort (or backward on a descending
+        # one) means looking for keys greater than the cursor.
+        op = 'gt' if (direction == 'next') != descending else 'lt'
+        queryset = queryset.filter(
+            Q(**{f'{field}__{op}': value}) | Q(**{field: value, f'id__{op}': object_id})
+        )
+
+    sign = '-' if descending != (direction == 'prev') else '+'
+    return queryset.order_by(f'{sign}{field}', f'{sign}id').limit(limit + 1)
+
+
+def paginate(queryset, ordering, limit, cursor=None):
+    """
+    Return one page of ``queryset`` as ``(items, next_cursor, prev_cursor)``.
+
+    ``ordering`` is a field name, optionally prefixed with ``-`` for
+    descending order. ``items`` are always returned in that ordering,
+    whichever direction the cursor walks.
+    """
+    items = list(page_queryset(queryset, ordering, limit, cursor))
+    return finish_page(items, ordering, limit, cursor)
+
+
+def finish_page(items, ordering, limit, cursor=None):
+    """
+    Turn the rows fetched by :func:`page_queryset` (by whatever driver)
+    into ``(items, next_cursor, prev_cursor)`` as :func:`paginate` returns.
+    """
+    field = ordering.lstrip('-')
+    direction = decode_cursor(cursor, ordering)[2] if cursor else 'next'
+    backwards = direction == 'prev'
+
+    has_more = len(items) > limit
+    items = items[:limit]
+    if backwards:
+        items.reverse()
+
+    if not items:
+        return items, None, None
+
+    first = _sort_key(items[0], field)
+    last = _sort_key(items[-1], field)
+    if backwards:
+        next_cursor = encode_cursor(ordering, *last, 'next')
+        prev_cursor = encode_cursor(ordering, *first, 'prev') if has_more else None
+    else:
+        next_cursor = encode_cursor(ordering, *last, 'next') if has_more else None
+        prev_cursor = encode_cursor(ordering, *first, 'prev') if cursor else None
+    return items, next_cursor, prev_cursor
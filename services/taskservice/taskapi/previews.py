@@ -0,0 +1,256 @@
+"""
+Thumbnail previews for image and PDF attachments.
+
+A preview is a small JPEG stored as ``previews/<file>.thumb.jpg`` under
+MEDIA_ROOT. Previews are rendered in a background process pool right after
+upload, or queued there when a ``?variant=thumb`` request finds none (the
+request answers 202 and the client retries); requests never wait for a
+render. Once the previews directory exceeds
+``TASK_PREVIEW_CACHE_MAX_BYTES``, the least-recently-served are evicted;
+only that directory is scanned, so the scan is bounded by the cap.
+
+Images are downscaled with Pillow and PDFs rasterized (first page) with
+poppler's ``pdftoppm``. Without either, or when rendering failed, the
+original file is served instead, marked for revalidation so a preview
+replaces it in browser caches once it exists.
+"""
+import logging
+import os
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from django.conf import settings
+from django.http import JsonResponse
+
+from .downloads import REVALIDATE_CACHE_CONTROL, serve_file
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; image previews are skipped without it.
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_DIR = 'previews'
+PREVIEW_SUFFIX = '.thumb.jpg'
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+PDF_EXTENSIONS = {'.pdf'}
+PDF_RENDER_TIMEOUT = 30
+
+# Stands in for a TaskFile/CommentFile when serving its preview.
+PreviewFile = namedtuple('PreviewFile', ['id', 'file', 'sha256'])
+
+_executor = None
+_executor_lock = threading.Lock()
+_last_eviction = 0.0
+# Renders queued by this process (relative path -> Future), and files whose
+# preview could not be rendered, so they are served as originals.
+_pending = {}
+_failed = set()
+_renders_lock = threading.Lock()
+
+
+def preview_path(relative_path):
+    """MEDIA_ROOT-relative path of the preview for an attachment."""
+    return f'{PREVIEW_DIR}/{relative_path}{PREVIEW_SUFFIX}'
+
+
+def can_preview(relative_path):
+    extension = os.path.splitext(relative_path)[1].lower()
+    return (extension in IMAGE_EXTENSIONS and Image is not None) or extension in PDF_EXTENSIONS
+
+
+def render_preview(media_root, relative_path, size):
+    """
+    Render the preview for ``relative_path``, replacing any existing one.
+
+    Runs in worker processes, so it takes everything it needs as arguments
+    rather than reading Django settings. Returns the preview's relative
+    path, or None when the file cannot be previewed.
+    """
+    source = os.path.join(media_root, relative_path)
+    target = os.path.join(media_root, preview_path(relative_path))
+    extension = os.path.splitext(relative_path)[1].lower()
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix='.part')
+    os.close(fd)
+    try:
+        # mkstemp creates the file 0600; give the preview its original's mode.
+        os.chmod(temp_path, stat.S_IMODE(os.stat(source).st_mode))
+        if extension in PDF_EXTENSIONS:
+            rendered = _render_pdf(source, temp_path, size)
+        elif extension in IMAGE_EXTENSIONS and Image is not None:
+            rendered = _render_image(source, temp_path, size)
+        else:
+            rendered = False
+        if not rendered:
+            return None
+        os.replace(temp_path, target)
+        return preview_path(relative_path)
+    except Exception:
+        logger.exception('Could not render preview for %s', relative_path)
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _render_image(source, target, size):
+    with Image.open(source) as image:
+        # Let the JPEG decoder downscale while decoding.
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image.convert('RGB').save(target, 'JPEG', quality=80, optimize=True)
+    return True
+
+
+def _render_pdf(source, target, size):
+    output_prefix = target[:-len('.part')]
+    try:
+        subprocess.run(
+            ['pdftoppm', '-jpeg', '-f', '1', '-l', '1', '-singlefile',
+             '-scale-to', str(size), source, output_prefix],
+            check=True, capture_output=True, timeout=PDF_RENDER_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return False
+    os.replace(f'{output_prefix}.jpg', target)
+    return True
+
+
+def evict_previews(media_root, max_bytes):
+    """
+    Delete least-recently-served previews until their total size fits
+    ``max_bytes``. Serving a preview bumps its access time.
+    """
+    previews = []
+    total = 0
+    for directory, _, filenames in os.walk(os.path.join(media_root, PREVIEW_DIR)):
+        for filename in filenames:
+            if not filename.endswith(PREVIEW_SUFFIX):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                file_stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            previews.append((file_stat.st_atime, file_stat.st_size, path))
+            total += file_stat.st_size
+
+    evicted = 0
+    for _, file_size, path in sorted(previews):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= file_size
+        evicted += 1
+    return evicted
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawned, not forked: the parent holds MongoDB client threads.
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.TASK_PREVIEW_WORKERS,
+                mp_context=get_context('spawn'),
+            )
+        return _executor
+
+
+def _rendered(relative_path, future):
+    with _renders_lock:
+        _pending.pop(relative_path, None)
+        if future.exception() is not None or future.result() is None:
+            _failed.add(relative_path)
+
+
+def render_in_background(relative_path):
+    """
+    Queue the preview of ``relative_path`` in the process pool unless it
+    is already queued. Returns False when no preview can be produced.
+    """
+    if not can_preview(relative_path):
+        return False
+    with _renders_lock:
+        if relative_path in _failed:
+            return False
+        if relative_path in _pending:
+            return True
+        future = _get_executor().submit(
+            render_preview, str(settings.MEDIA_ROOT), relative_path, settings.TASK_PREVIEW_SIZE,
+        )
+        _pending[relative_path] = future
+    future.add_done_callback(lambda done: _rendered(relative_path, done))
+    return True
+
+
+def schedule_previews(relative_paths):
+    """Render previews for freshly stored files in the background pool."""
+    global _last_eviction
+    relative_paths = [path for path in relative_paths if can_preview(path)]
+    if not relative_paths:
+        return
+    media_root = str(settings.MEDIA_ROOT)
+    for relative_path in relative_paths:
+        if not os.path.exists(os.path.join(media_root, preview_path(relative_path))):
+            render_in_background(relative_path)
+
+    now = time.monotonic()
+    if now - _last_eviction >= settings.TASK_PREVIEW_EVICT_INTERVAL:
+        _last_eviction = now
+        _get_executor().submit(evict_previews, media_root, settings.TASK_PREVIEW_CACHE_MAX_BYTES)
+
+
+def get_preview(file_document):
+    """
+    Return a PreviewFile to serve for a TaskFile/CommentFile, or None when
+    its preview is not on disk.
+    """
+    relative_path = preview_path(file_document.file)
+    file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    try:
+        # Record the hit for LRU eviction without changing Last-Modified.
+        os.utime(file_path, ns=(time.time_ns(), os.stat(file_path).st_mtime_ns))
+    except FileNotFoundError:
+        return None
+
+    sha256 = None
+    if file_document.sha256:
+        sha256 = f'{file_document.sha256}-thumb{settings.TASK_PREVIEW_SIZE}'
+    return PreviewFile(id=f'{file_document.id}-thumb', file=relative_path, sha256=sha256)
+
+
+def serve_preview(request, file_document, download=False):
+    """
+    Serve the preview of a TaskFile/CommentFile. A missing preview is
+    queued and answered with 202 (retry shortly); a file that cannot be
+    previewed is served as is.
+    """
+    preview = get_preview(file_document)
+    if preview is not None:
+        return serve_file(request, preview, download)
+    if render_in_background(file_document.file):
+        response = JsonResponse({'status': 'rendering'}, status=202)
+        response['Retry-After'] = '1'
+        response['Cache-Control'] = 'no-store'
+        return response
+    return serve_file(request, file_document, download, cache_control=REVALIDATE_CACHE_CONTROL)
+
+
+def remove_preview(relative_path):
+    with _renders_lock:
+        _failed.discard(relative_path)
+    file_path = os.path.join(settings.MEDIA_ROOT, preview_path(relative_path))
+    if os.path.exists(file_path):
+        os.remove(file_path)
@@ -0,0 +1,95 @@
+"""
+Task query builders shared by the list endpoint and the management commands
+that need to reproduce its query shapes.
+"""
+from datetime import datetime
+from .models import Task
+
+
+def visible_tasks(user):
+    """Return the base Task queryset the given token user may list."""
+    user_role = getattr(user, 'role', None)
+    
+    if user_role == 'ADMIN':
+        return Task.objects.all()
+    elif user_role == 'TEAM_LEADER':
+        return Task.objects.all()
+    return Task.objects.filter(assigned_to_user_id=user.id)
+
+
+FILTER_PARAMS = ('team_id', 'assigned_to_user_id', 'status', 'due_date_from', 'due_date_to')
+
+
+def filter_tasks(tasks, params, strict=False):
+    """
+    Apply the ``list_tasks`` query-string filters to a Task queryset.
+
+    Unparseable dates are ignored unless ``strict``, in which case they
+    raise ValueError (bulk updates must never widen their match).
+    """
+    team_id = params.get('team_id')
+    if team_id:
+        tasks = tasks.filter(team_id=int(team_id))
+    
+    assigned_to_user_id = params.get('assigned_to_user_id')
+    if assigned_to_user_id:
+        tasks = tasks.filter(assigned_to_user_id=int(assigned_to_user_id))
+    
+    status_filter = params.get('status')
+    if status_filter:
+        tasks = tasks.filter(status=status_filter)
+    
+    due_date_from = params.get('due_date_from')
+    if due_date_from:
+        try:
+            due_date_from_dt = datetime.fromisoformat(due_date_from.replace('Z', '+00:00'))
+            tasks = tasks.filter(due_date__gte=due_date_from_dt)
+        except Exception:
+            if strict:
+                raise ValueError(f'Invalid due_date_from: {due_date_from}')
+    
+    due_date_to = params.get('due_date_to')
+    if due_date_to:
+        try:
+            due_date_to_dt = datetime.fromisoformat(due_date_to.replace('Z', '+00:00'))
+            tasks = tasks.filter(due_date__lte=due_date_to_dt)
+        except Exception:
+            if strict:
+                raise ValueError(f'Invalid due_date_to: {due_date_to}')
+    
+    return tasks
+
+
+def parse_fields(raw_fields, allowed):
+    """
+    Parse a comma-separated ``fields`` parameter against the ``allowed`` names.
+    
+    Returns None when it is empty; otherwise the requested names with
+    ``id`` first. Raises ValueError on unknown names.
+    """
+    if not raw_fields:
+        return None
+    
+    fields = ['id']
+    for field in raw_fields.split(','):
+        field = field.strip()
+        if field and field not in fields:
+            fields.append(field)
+    
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def find_args(queryset):
+    """
+    The pymongo ``find()`` arguments of a MongoEngine queryset (filter,
+    projection, sort and limit), so another driver can run the same query.
+    """
+    return {
+        'filter': queryset._query,
+        'projection': queryset._cursor_args.get('projection'),
+        'sort': queryset._ordering or None,
+        'limit': queryset._limit or 0,
+    }
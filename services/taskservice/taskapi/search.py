@@ -0,0 +1,176 @@
+"""
+Full-text search over tasks and their comments.
+
+Backed by the ``task_text`` (title, description) and ``comment_text``
+MongoDB text indexes. One aggregation on ``tasks`` scores matching tasks,
+pulls in matching comments with ``$unionWith``, combines both scores per
+task, re-applies the caller's task scope to tasks found only through a
+comment, and pages the result by ``(score, _id)`` with an opaque cursor.
+When the scope is narrower than every task (members, filters), the best
+``TASK_SEARCH_MAX_COMMENT_SCAN`` comment matches are joined to their task
+and filtered by the scope before the best candidates are taken, so other
+users' comments cannot crowd out the caller's.
+Highlights are computed in Python on the returned page only.
+"""
+import re
+from django.conf import settings
+from .models import Comment
+from .pagination import decode_cursor, encode_cursor
+
+SEARCH_ORDERING = 'relevance'
+SNIPPET_LENGTH = 160
+
+_TERM = re.compile(r'"([^"]+)"|(-?)([\w]+)')
+
+
+def search_terms(query):
+    """Positive words and phrases of a $text search string, for highlighting."""
+    terms = []
+    for phrase, negated, word in _TERM.findall(query):
+        if phrase:
+            terms.append(phrase)
+        elif not negated:
+            terms.append(word)
+    return terms
+
+
+def highlight(text, terms):
+    """
+    Return ``{'snippet', 'offsets'}`` around the first match of any term in
+    ``text`` (offsets are ``[start, end)`` pairs within the snippet), or
+    None when nothing matches. Words match on their prefix, roughly in line
+    with the text index's stemming.
+    """
+    if not text or not terms:
+        return None
+    pattern = re.compile(
+        '|'.join(rf'\b{re.escape(term)}\w*' for term in sorted(terms, key=len, reverse=True)),
+        re.IGNORECASE,
+    )
+    first = pattern.search(text)
+    if first is None:
+        return None
+    start = max(0, first.start() - SNIPPET_LENGTH // 4)
+    end = min(len(text), start + SNIPPET_LENGTH)
+    snippet = text[start:end]
+    offsets = [[match.start(), match.end()] for match in pattern.finditer(snippet)]
+    return {
+        'snippet': snippet,
+        'offsets': offsets,
+        'truncated_start': start > 0,
+        'truncated_end': end < len(text),
+    }
+
+
+def _comment_scope(scope, tasks_collection):
+    """Stages keeping only comments whose task is in ``scope``."""
+    return [
+        {'$limit': settings.TASK_SEARCH_MAX_COMMENT_SCAN},
+        {'$lookup': {
+            'from': tasks_collection,
+            'localField': 'task_id',
+            'foreignField': '_id',
+            'pipeline': [{'$match': scope}, {'$project': {'_id': 1}}],
+            'as': 'in_scope',
+        }},
+        {'$match': {'in_scope': {'$ne': []}}},
+    ]
+
+
+def _pipeline(query, scope, limit, after, projection, tasks_collection, scoped_comments=False):
+    candidates = settings.TASK_SEARCH_MAX_CANDIDATES
+    text_match = {'$text': {'$search': query}}
+    comment_pipeline = [
+        {'$match': text_match},
+        {'$project': {'task_id': 1, 'comment_score': {'$meta': 'textScore'}}},
+        {'$sort': {'comment_score': -1}},
+    ]
+    if scoped_comments:
+        comment_pipeline += _comment_scope(scope, tasks_collection)
+    pipeline = [
+        {'$match': {**text_match, **scope}},
+        {'$project': {'task_score': {'$meta': 'textScore'}}},
+        {'$sort': {'task_score': -1}},
+        {'$limit': candidates},
+        {'$project': {'_id': 0, 'task_id': '$_id', 'task_score': 1}},
+        {'$unionWith': {
+            'coll': Comment._get_collection_name(),
+            'pipeline': [
+                *comment_pipeline,
+                {'$limit': candidates},
+                # Sorted by score, so $first keeps each task's best comment.
+                {'$group': {
+                    '_id': '$task_id',
+                    'comment_score': {'$first': '$comment_score'},
+                    'comment_id': {'$first': '$_id'},
+                }},
+                {'$project': {'_id': 0, 'task_id': '$_id', 'comment_score': 1, 'comment_id': 1}},
+            ],
+        }},
+        {'$group': {
+            '_id': '$task_id',
+            'task_score': {'$max': '$task_score'},
+            'comment_score': {'$max': '$comment_score'},
+            'comment_id': {'$max': '$comment_id'},
+        }},
+        {'$addFields': {'score': {'$add': [
+            {'$ifNull': ['$task_score', 0]},
+            {'$multiply': [{'$ifNull': ['$comment_score', 0]}, settings.TASK_SEARCH_COMMENT_WEIGHT]},
+        ]}}},
+    ]
+    if after is not None:
+        score, object_id = after
+        pipeline.append({'$match': {'$or': [
+            {'score': {'$lt': score}},
+            {'score': score, '_id': {'$lt': object_id}},
+        ]}})
+    pipeline += [
+        {'$sort': {'score': -1, '_id': -1}},
+        # Comment-only hits still have to be visible to the caller; the
+        # lookup applies the same scope and fetches the listed fields.
+        {'$lookup': {
+            'from': tasks_collection,
+            'localField': '_id',
+            'foreignField': '_id',
+            'pipeline': [{'$match': scope}, {'$project': projection}],
+            'as': 'task',
+        }},
+        {'$unwind': '$task'},
+        {'$limit': limit + 1},
+    ]
+    return pipeline
+
+
+def run_search(tasks, query, limit, cursor=None, fields=()):
+    """
+    Run a relevance-ranked search within the ``tasks`` queryset's scope
+    (its filter, e.g. from visible_tasks/filter_tasks, not its ordering).
+
+    ``fields`` are the task fields to fetch. Returns ``(hits, next_cursor)``
+    where each hit has ``task`` (raw row), ``score``, ``task_score``,
+    ``comment_score`` and ``comment_id``. Raises InvalidCursor.
+    """
+    after = None
+    if cursor:
+        score, object_id, _ = decode_cursor(cursor, SEARCH_ORDERING)
+        after = (score, object_id)
+
+    projection = {field: 1 for field in fields if field != 'id'} or {'_id': 1}
+    document = tasks._document
+    # $text must open the pipeline, so the scope is merged into that first
+    # $match rather than prepended by QuerySet.aggregate().
+    pipeline = _pipeline(
+        query, tasks._query, limit, after, projection, document._get_collection_name(),
+        scoped_comments=tasks._query != document.objects._query,
+    )
+    # Apply the queryset's read routing (see mongo.list_reads).
+    collection = document._get_collection().with_options(
+        read_preference=tasks._read_preference, read_concern=tasks._read_concern,
+    )
+    rows = list(collection.aggregate(pipeline))
+    hits, extra = rows[:limit], rows[limit:]
+    next_cursor = None
+    if extra:
+        last = hits[-1]
+        next_cursor = encode_cursor(SEARCH_ORDERING, last['score'], last['_id'], 'next')
+    return hits, next_cursor
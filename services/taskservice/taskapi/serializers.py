@@ -1,9 +1,28 @@
-from rest_framework import serializers
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Task, Comment, TaskFile, CommentFile
 from bson.objectid import ObjectId
 
 
-class TaskSerializer(serializers.Serializer):
+class DynamicFieldsMixin:
+    """
+    Accept a ``fields`` argument listing which declared fields to keep.
+    
+    Used for sparse field selection (``?fields=``) so the response only
+    carries what the client asked for.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class TaskSerializer(DynamicFieldsMixin, serializers.Serializer):
     """Serializer for Task model."""
     id = serializers.SerializerMethodField()
     title = serializers.CharField(max_length=255)
@@ -15,6 +34,9 @@ class TaskSerializer(serializers.Serializer):
     assigned_to_user_id = serializers.IntegerField()
     team_id = serializers.IntegerField()
     created_at = serializers.DateTimeField(read_only=True)
+    comment_count = serializers.IntegerField(read_only=True)
+    file_count = serializers.IntegerField(read_only=True)
+    version = serializers.IntegerField(read_only=True)
     
     def get_id(self, obj):
         """Convert ObjectId to string."""
@@ -37,7 +59,7 @@ class TaskSerializer(serializers.Serializer):
         return instance
 
 
-class TaskListSerializer(serializers.Serializer):
+class TaskListSerializer(DynamicFieldsMixin, serializers.Serializer):
     """Serializer for listing tasks (simplified)."""
     id = serializers.SerializerMethodField()
     title = serializers.CharField()
@@ -48,6 +70,9 @@ class TaskListSerializer(serializers.Serializer):
     assigned_to_user_id = serializers.IntegerField()
     team_id = serializers.IntegerField()
     created_at = serializers.DateTimeField()
+    comment_count = serializers.IntegerField()
+    file_count = serializers.IntegerField()
+    version = serializers.IntegerField()
     
     def get_id(self, obj):
         """Convert ObjectId to string."""
@@ -175,3 +200,69 @@ class TaskDetailSerializer(serializers.Serializer):
             return str(obj.id)
         return None
 
+
+def _utc_isoformat(value):
+    """DRF's ISO 8601 rendering of a (naive UTC) datetime, without the field machinery."""
+    if value.tzinfo is None:
+        return value.isoformat() + 'Z'
+    value = value.astimezone(dt_timezone.utc).isoformat()
+    return value[:-6] + 'Z'
+
+
+def _field_converter(field):
+    """Return a plain function equivalent to ``field.to_representation``."""
+    if isinstance(field, serializers.DateTimeField):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        current_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+        utc_output = (
+            output_format is not None
+            and output_format.lower() == ISO_8601
+            and str(current_timezone) == 'UTC'
+        )
+        if utc_output:
+            return lambda value: _utc_isoformat(value) if value else None
+        return field.to_representation
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.CharField):
+        return str
+    raise TypeError(f'No fast path for {type(field).__name__} {field.field_name!r}')
+
+
+@lru_cache(maxsize=None)
+def compile_row_serializer(serializer_class, document_class, fields=None):
+    """
+    Compile a function that turns raw pymongo rows (``as_pymongo()``) into
+    the same dicts ``serializer_class(..., many=True)`` would produce from
+    MongoEngine documents, skipping document construction and DRF fields.
+    
+    ``id`` (a ``get_id`` method field) is rendered as ``str(_id)``. Missing
+    keys fall back to the document field default, as MongoEngine would.
+    """
+    serializer = serializer_class(fields=list(fields) if fields else None)
+    plan = []
+    for name, field in serializer.fields.items():
+        if name == 'id':
+            plan.append((name, '_id', str, None))
+            continue
+        document_field = document_class._fields[field.source]
+        plan.append((name, document_field.db_field, _field_converter(field), document_field.default))
+    
+    def serialize_rows(rows):
+        data = []
+        for row in rows:
+            item = {}
+            for name, key, convert, default in plan:
+                value = row.get(key)
+                if value is None and key not in row and default is not None:
+                    value = default() if callable(default) else default
+                item[name] = None if value is None else convert(value)
+            data.append(item)
+        return data
+    
+    return serialize_rows
+
+
+def serialize_task_rows(rows, fields=None):
+    """Fast-path equivalent of ``TaskListSerializer(tasks, many=True, fields=fields).data``."""
+    return compile_row_serializer(TaskListSerializer, Task, tuple(fields) if fields else None)(rows)
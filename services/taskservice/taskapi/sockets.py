@@ -0,0 +1,100 @@
+"""
+Live comment threads over WebSocket.
+
+``/api/tasks/tasks/<task_id>/comments/live/`` is a raw ASGI WebSocket
+endpoint (routed in ``taskservice/asgi.py``) that pushes the task's
+``comment.created``, ``comment.deleted``, ``file.created`` and
+``file.deleted`` events, and ``task.deleted``, as JSON text frames of
+``{"id", "type", "data"}``. Events come from the same ``EventBus`` as the
+Server-Sent Events feed, which indexes streams by task, so an event is
+only matched against the sockets following that task.
+
+A socket is one Subscription (a bounded queue) plus one sender task; no
+thread is held. Browsers cannot set headers on a WebSocket, so the access
+token is passed as ``?token=``; ``?last_event_id=`` replays missed
+events. A socket that falls behind is sent ``resync`` and closed with
+code 4000, after which the client should refetch the thread.
+"""
+import asyncio
+import re
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from bson.objectid import ObjectId
+from .authentication import user_from_token
+from .events import RESYNC, event_json, get_bus
+from .models import Task
+
+SOCKET_PATH = re.compile(r'^/api/tasks/tasks/(?P<task_id>[0-9a-f]{24})/comments/live/$')
+COMMENT_EVENT_TYPES = frozenset(
+    ('comment.created', 'comment.deleted', 'file.created', 'file.deleted', 'task.deleted')
+)
+
+# Close codes (4000-4999 are application-defined).
+CLOSE_RESYNC = 4000
+CLOSE_UNAUTHORIZED = 4401
+CLOSE_FORBIDDEN = 4403
+CLOSE_NOT_FOUND = 4404
+
+
+def is_assignee(user, task_id):
+    """Whether the task exists and is assigned to ``user``."""
+    return Task.objects(id=ObjectId(task_id), assigned_to_user_id=user.id).only('id').first() is not None
+
+
+def _message(event):
+    if event['type'] == RESYNC:
+        return f'{{"type": "{RESYNC}"}}'
+    return f'{{"id": "{event["id"]}", "type": "{event["type"]}", "data": {event_json(event)}}}'
+
+
+async def _send_events(subscription, send):
+    while True:
+        event = await subscription.queue.get()
+        await send({'type': 'websocket.send', 'text': _message(event)})
+        if event['type'] == RESYNC:
+            await send({'type': 'websocket.close', 'code': CLOSE_RESYNC})
+            return
+
+
+async def comment_socket(scope, receive, send):
+    """ASGI application for the per-task comment WebSocket."""
+    message = await receive()
+    if message['type'] != 'websocket.connect':
+        return
+
+    match = SOCKET_PATH.match(scope['path'])
+    if match is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_NOT_FOUND})
+        return
+    params = parse_qs(scope.get('query_string', b'').decode())
+    token = params.get('token', [''])[0]
+    user = user_from_token(token) if token else None
+    if user is None:
+        await send({'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+        return
+    task_id = match['task_id']
+    # Mirrors visible_tasks: leaders and admins may follow any task without
+    # a lookup, members only the tasks assigned to them.
+    if getattr(user, 'role', None) not in ('ADMIN', 'TEAM_LEADER'):
+        if not await sync_to_async(is_assignee)(user, task_id):
+            await send({'type': 'websocket.close', 'code': CLOSE_FORBIDDEN})
+            return
+
+    bus = get_bus()
+    if bus.source is None:
+        await sync_to_async(bus.start)()
+    subscription = bus.subscribe(
+        user, task_id=task_id, last_event_id=params.get('last_event_id', [None])[0],
+        types=COMMENT_EVENT_TYPES,
+    )
+    sender = None
+    try:
+        await send({'type': 'websocket.accept'})
+        sender = asyncio.create_task(_send_events(subscription, send))
+        # Client frames are not used; wait for the socket to go away.
+        while (await receive())['type'] != 'websocket.disconnect':
+            pass
+    finally:
+        bus.unsubscribe(subscription)
+        if sender is not None:
+            sender.cancel()
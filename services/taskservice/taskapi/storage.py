@@ -0,0 +1,204 @@
+"""
+Content-addressed storage for task and comment attachments.
+
+Uploads are stored once per distinct content under
+``MEDIA_ROOT/blobs/<aa>/<sha256><ext>``. A ``Blob`` document per digest
+keeps a reference count of the TaskFile/CommentFile documents that point at
+it, so attaching the same file many times costs one copy on disk, and the
+copy is removed only when its last reference is deleted.
+"""
+import hashlib
+import os
+import tempfile
+import uuid
+from datetime import datetime
+from django.conf import settings
+from .models import Blob
+from .previews import remove_preview
+
+BLOB_DIR = 'blobs'
+
+
+def _process_umask():
+    """
+    The process umask from /proc (Linux), or None where it is not exposed.
+    os.umask() can only be queried by setting it, which would briefly
+    change the mode of files other threads create.
+    """
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    return None
+
+
+# What a file created with open() would get (Django's default without /proc).
+_umask = _process_umask()
+UMASK_FILE_MODE = 0o644 if _umask is None else 0o666 & ~_umask
+
+
+def stored_file_mode():
+    """
+    Permissions for files moved into MEDIA_ROOT: FILE_UPLOAD_PERMISSIONS,
+    or the umask's when unset. Temp files are created 0600, which the web
+    server serving X-Accel-Redirect/X-Sendfile downloads could not read.
+    """
+    return settings.FILE_UPLOAD_PERMISSIONS or UMASK_FILE_MODE
+
+
+def blob_path(digest, extension=''):
+    """Return the MEDIA_ROOT-relative path for a blob."""
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{extension.lower()}'
+
+
+def _write_atomically(relative_path, chunks):
+    """Write chunks to a temp file next to the target, then rename into place."""
+    file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    directory = os.path.dirname(file_path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as destination:
+            for chunk in chunks:
+                destination.write(chunk)
+            os.fchmod(destination.fileno(), stored_file_mode())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _move_into_place(staged_path, relative_path):
+    """Rename an already-written staging file onto its blob path."""
+    file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    os.replace(staged_path, file_path)
+
+
+def store_upload(uploaded_file):
+    """
+    Store an uploaded file by content and take a reference on its blob.
+
+    Returns ``(relative_path, sha256)``. When a blob with the same digest
+    already exists on disk, nothing is written. Files staged by
+    ``uploads.BlobUploadHandler`` arrive already hashed and are renamed
+    into place instead of being copied.
+    """
+    extension = os.path.splitext(uploaded_file.name)[1]
+    sha256 = getattr(uploaded_file, 'sha256', None)
+    if sha256:
+        staged_path = uploaded_file.temporary_file_path()
+        relative_path = adopt_blob(
+            sha256, uploaded_file.size, extension,
+            lambda path: _move_into_place(staged_path, path),
+        )
+        return relative_path, sha256
+
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in uploaded_file.chunks():
+        digest.update(chunk)
+        size += len(chunk)
+    sha256 = digest.hexdigest()
+    relative_path = adopt_blob(
+        sha256, size, extension,
+        lambda path: _write_atomically(path, uploaded_file.chunks()),
+    )
+    return relative_path, sha256
+
+
+def adopt_blob(sha256, size, extension, write_blob):
+    """
+    Take a reference on the blob ``sha256``, creating it if needed.
+
+    ``write_blob(relative_path)`` is only called when the blob's bytes are
+    not on disk yet. Returns the blob's MEDIA_ROOT-relative path, which keeps
+    the extension of the first upload of that content.
+
+    ``last_adopted_at`` records the reference, so ``sweep_orphans`` leaves
+    the count alone until the document that holds it has been inserted.
+    """
+    now = datetime.utcnow()
+    previous = Blob.objects(id=sha256).modify(
+        upsert=True,
+        new=False,
+        inc__ref_count=1,
+        set__last_adopted_at=now,
+        set_on_insert__file=blob_path(sha256, extension),
+        set_on_insert__size=size,
+        set_on_insert__created_at=now,
+    )
+    relative_path = previous.file if previous else blob_path(sha256, extension)
+    if previous is None or not os.path.exists(os.path.join(settings.MEDIA_ROOT, relative_path)):
+        write_blob(relative_path)
+    return relative_path
+
+
+def release_blob(sha256, count=1):
+    """
+    Drop ``count`` references to a blob; delete it from disk when none remain.
+
+    The document is removed with a ``ref_count <= 0`` condition, so a
+    concurrent upload of the same content that re-referenced the blob in
+    the meantime keeps it alive.
+    """
+    blob = Blob.objects(id=sha256).modify(new=True, dec__ref_count=count)
+    if blob is None or blob.ref_count > 0:
+        return
+    if Blob.objects(id=sha256, ref_count__lte=0).delete():
+        _remove_blob_file(sha256, blob.file)
+
+
+def _remove_blob_file(sha256, relative_path):
+    """
+    Remove the bytes of a blob whose document was just deleted.
+
+    An upload of the same content may re-create the document meanwhile and
+    (re)write the same path. The file is first renamed to a unique
+    tombstone name, then the document re-checked: if the blob was adopted
+    again, the tombstone (identical content) is moved back.
+    """
+    file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    tombstone = f'{file_path}.{uuid.uuid4().hex}.released'
+    try:
+        os.rename(file_path, tombstone)
+    except FileNotFoundError:
+        tombstone = None
+    adopted = Blob.objects(id=sha256).only('file').first()
+    if adopted is not None and adopted.file == relative_path:
+        if tombstone:
+            os.replace(tombstone, file_path)
+        return
+    try:
+        if tombstone:
+            os.remove(tombstone)
+        remove_preview(relative_path)
+    except OSError:
+        pass
+
+
+def remove_file(relative_path):
+    file_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    try:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        remove_preview(relative_path)
+    except Exception:
+        pass
+
+
+def delete_stored_file(file_document):
+    """
+    Release the storage behind a TaskFile/CommentFile document.
+
+    Content-addressed files drop a blob reference; files stored before
+    deduplication (no ``sha256``) are removed directly.
+    """
+    if file_document.sha256:
+        release_blob(file_document.sha256)
+    else:
+        remove_file(file_document.file)
@@ -1,3 +1,1931 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import unittest
+from io import StringIO
+from unittest import mock
+from concurrent.futures import Future
+from types import SimpleNamespace
+from datetime import datetime, timedelta
 
-# Create your tests here.
+import jwt
+import mongoengine
+import pymongo
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, override_settings
+from bson.objectid import ObjectId
+from mongoengine.queryset import QuerySet
+from pymongo import ReadPreference, monitoring
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import authentication
+from .authentication import JWTAuthenticationFromUserService, TokenUser, user_from_token
+from .downloads import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, serve_file
+from . import events
+from .events import RESYNC, EventBus, comment_event, events_from_change, format_event, task_event
+from .sockets import CLOSE_UNAUTHORIZED, comment_socket
+from . import previews
+from .previews import Image, evict_previews, get_preview, preview_path, serve_preview
+from .cascade import cascade_task, delete_file_rows
+from .models import Task, Comment, TaskFile, CommentFile, Blob
+from .list_cache import cache_key, get_response, invalidate_task_lists, set_response
+from .middleware import read_your_writes_middleware
+from .mongo import (
+    READ_YOUR_WRITES_HEADER, client_options, list_reads, reads_own_writes, register_connection,
+    write_token,
+)
+from . import metrics
+from .queries import parse_fields
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, finish_page, parse_limit
+from .search import highlight, search_terms
+from .serializers import TaskListSerializer, serialize_task_rows
+from . import storage
+from .storage import release_blob, store_upload
+from .uploads import StagedUpload, UploadTooLarge, save_uploads
+from .views import TASK_LIST_FIELDS, _bump_task_counters
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Record the name of every command sent to MongoDB."""
+
+    def __init__(self):
+        self.commands = []
+
+    def started(self, event):
+        self.commands.append(event.command_name)
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+class ServerRecorder(CommandCounter):
+    """Record the name and server address of every command."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def started(self, event):
+        self.calls.append((event.command_name, event.connection_id))
+
+
+def make_token(user_id, role):
+    """Sign an access token the way userservice does."""
+    payload = {
+        'user_id': user_id,
+        'role': role,
+        'token_type': 'access',
+        'exp': datetime.utcnow() + timedelta(minutes=5),
+    }
+    return jwt.encode(
+        payload,
+        settings.SIMPLE_JWT['SIGNING_KEY'],
+        algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+    )
+
+
+class MongoTestCase(SimpleTestCase):
+    """
+    Run against a throwaway database on the configured MongoDB server,
+    with a command listener attached. Skipped when no server is reachable.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.counter = CommandCounter()
+        cls.db_name = f'test_{settings.MONGO_DATABASE}'
+        register_connection(
+            db=cls.db_name, serverSelectionTimeoutMS=2000, event_listeners=[cls.counter],
+        )
+        try:
+            mongoengine.get_connection().admin.command('ping')
+        except Exception as e:
+            cls._restore_connection()
+            raise unittest.SkipTest(f'MongoDB is not reachable: {e}')
+
+    @classmethod
+    def tearDownClass(cls):
+        mongoengine.get_connection().drop_database(cls.db_name)
+        cls._restore_connection()
+        super().tearDownClass()
+
+    @classmethod
+    def _restore_connection(cls):
+        register_connection()
+
+    def setUp(self):
+        for document in (Task, Comment, TaskFile, CommentFile, Blob):
+            document.drop_collection()
+        caches['task_lists'].clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(2, 'TEAM_LEADER')}")
+
+    def count_commands(self, url):
+        """Issue a GET and return the number of Mongo commands it caused."""
+        self.counter.commands.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(self.counter.commands)
+
+
+class TaskFixtureTestCase(MongoTestCase):
+    """A task with comments (two files each) added on demand."""
+
+    def setUp(self):
+        super().setUp()
+        self.task = Task(
+            title='Query count', description='N+1 regression', created_by_user_id=2,
+            assigned_to_user_id=4, due_date=datetime.utcnow(), team_id=1,
+        )
+        self.task.save()
+
+    def add_comments(self, count):
+        for i in range(count):
+            comment = Comment(text=f'comment {i}', created_by_user_id=4, task_id=self.task.id)
+            comment.save()
+            for j in range(2):
+                CommentFile(
+                    file=f'comment_files/{i}-{j}.pdf', comment_id=comment.id, uploaded_by_user_id=4,
+                ).save()
+
+
+class CommentQueryCountTests(TaskFixtureTestCase):
+    """Loading comments must not issue one CommentFile query per comment."""
+
+    def assert_constant_query_count(self, url):
+        self.add_comments(1)
+        # First request creates indexes lazily; do not count it.
+        self.count_commands(url)
+        few = self.count_commands(url)
+        # 50 comments with 100 files: both fit the server's first batch of
+        # 101 documents, so no getMore is counted.
+        self.add_comments(49)
+        many = self.count_commands(url)
+        self.assertEqual(few, many)
+
+    def test_task_details_query_count_is_constant(self):
+        self.assert_constant_query_count(f'/api/tasks/tasks/{self.task.id}/')
+
+    def test_list_comments_query_count_is_constant(self):
+        self.assert_constant_query_count(f'/api/tasks/tasks/{self.task.id}/comments/')
+
+    def test_comment_files_are_grouped_per_comment(self):
+        self.add_comments(3)
+        response = self.client.get(f'/api/tasks/tasks/{self.task.id}/comments/')
+        for comment in response.json():
+            index = comment['text'].split()[-1]
+            self.assertEqual(
+                sorted(f['file'] for f in comment['files']),
+                [f'comment_files/{index}-0.pdf', f'comment_files/{index}-1.pdf'],
+            )
+
+
+@override_settings(TASK_DETAIL_COMMENTS_LIMIT=3)
+class CommentWindowTests(TaskFixtureTestCase):
+    """Task details embed the newest comments; comments/ pages through the rest."""
+
+    def setUp(self):
+        super().setUp()
+        self.add_comments(5)
+
+    def texts(self, comments):
+        return [comment['text'] for comment in comments]
+
+    def comments_page(self, **params):
+        response = self.client.get(f'/api/tasks/tasks/{self.task.id}/comments/', params)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return self.texts(data['results']), data['next'], data['prev']
+
+    def test_details_embed_the_newest_comments_oldest_first(self):
+        data = self.client.get(f'/api/tasks/tasks/{self.task.id}/').json()
+        self.assertEqual(self.texts(data['comments']), ['comment 2', 'comment 3', 'comment 4'])
+        self.assertEqual(data['comments_count'], 5)
+        older, next_cursor, _ = self.comments_page(cursor=data['comments_next'], limit=3)
+        self.assertEqual(older, ['comment 1', 'comment 0'])
+        self.assertIsNone(next_cursor)
+
+    @override_settings(TASK_DETAIL_COMMENTS_LIMIT=5)
+    def test_details_without_older_comments_have_no_cursor(self):
+        data = self.client.get(f'/api/tasks/tasks/{self.task.id}/').json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertIsNone(data['comments_next'])
+
+    def test_list_comments_pages_newest_first(self):
+        first, next_cursor, prev_cursor = self.comments_page(limit=2)
+        self.assertEqual(first, ['comment 4', 'comment 3'])
+        self.assertIsNone(prev_cursor)
+        second, next_cursor, prev_cursor = self.comments_page(limit=2, cursor=next_cursor)
+        self.assertEqual(second, ['comment 2', 'comment 1'])
+        self.assertEqual(self.comments_page(limit=2, cursor=next_cursor)[0], ['comment 0'])
+        self.assertEqual(self.comments_page(limit=2, cursor=prev_cursor)[0], first)
+
+    def test_list_comments_without_paging_returns_all(self):
+        response = self.client.get(f'/api/tasks/tasks/{self.task.id}/comments/')
+        self.assertEqual(len(response.json()), 5)
+
+    def test_list_comments_rejects_bad_cursor_or_limit(self):
+        for params in ({'cursor': 'garbage'}, {'limit': 0}, {'limit': 'ten'}):
+            response = self.client.get(f'/api/tasks/tasks/{self.task.id}/comments/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class TaskCounterTests(TaskFixtureTestCase):
+    """Denormalized comment_count/file_count: kept by the API, rebuilt by recount."""
+
+    def counters(self):
+        row = Task.objects(id=self.task.id).only('comment_count', 'file_count').as_pymongo().first()
+        return row.get('comment_count', 0), row.get('file_count', 0)
+
+    def test_bump_adjusts_counters_and_invalidates_lists(self):
+        self.client.get('/api/tasks/tasks/')
+        _bump_task_counters(self.task, comments=2, files=3)
+        _bump_task_counters(self.task, comments=-1)
+        self.assertEqual(self.counters(), (1, 3))
+        listed = self.client.get('/api/tasks/tasks/').json()[0]
+        self.assertEqual((listed['comment_count'], listed['file_count']), (1, 3))
+
+        self.counter.commands.clear()
+        _bump_task_counters(self.task)
+        self.assertEqual(self.counter.commands, [])
+
+    def test_adding_and_deleting_a_comment_keeps_counts(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        response = self.client.post(
+            f'/api/tasks/tasks/{self.task.id}/comments/add/', {'text': 'hello'}, format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.counters(), (1, 0))
+        comment = Comment.objects.get(task_id=self.task.id)
+        for i in range(2):
+            CommentFile(file=f'comment_files/{i}.pdf', comment_id=comment.id, uploaded_by_user_id=4).save()
+        _bump_task_counters(self.task, files=2)
+
+        response = self.client.delete(f'/api/tasks/tasks/{self.task.id}/comments/{comment.id}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counters(), (0, 0))
+
+    def recount(self, *args):
+        out = StringIO()
+        call_command('recount_task_counters', *args, stdout=out)
+        return out.getvalue()
+
+    def test_recount_repairs_drifted_tasks(self):
+        self.add_comments(2)
+        TaskFile(file='task_files/a.pdf', task_id=self.task.id, uploaded_by_user_id=2).save()
+        untouched = Task(
+            title='Quiet', description='No activity', created_by_user_id=2, assigned_to_user_id=4,
+            due_date=datetime.utcnow(), team_id=1,
+        )
+        untouched.save()
+        Task.objects(id=self.task.id).update_one(set__comment_count=7, set__file_count=0)
+
+        self.assertIn('2 tasks, 1 would be updated', self.recount('--dry-run'))
+        self.assertEqual(self.counters(), (7, 0))
+
+        self.assertIn('2 tasks, 1 updated', self.recount('--batch-size', '1'))
+        # Two comments with two files each, plus one task file.
+        self.assertEqual(self.counters(), (2, 5))
+        self.assertIn('2 tasks, 0 updated', self.recount())
+
+
+class CascadeDeleteTests(TaskFixtureTestCase):
+    """Deleting a task tombstones it; the cascade removes everything it owns."""
+
+    def test_delete_tombstones_then_cascades(self):
+        self.add_comments(3)
+        TaskFile(file='task_files/a.pdf', task_id=self.task.id, uploaded_by_user_id=2).save()
+        comment_ids = list(Comment.objects(task_id=self.task.id).scalar('id'))
+
+        response = self.client.delete(f'/api/tasks/tasks/{self.task.id}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects(id=self.task.id).count(), 0)
+        self.assertEqual(
+            self.client.get(f'/api/tasks/tasks/{self.task.id}/').status_code, 404,
+        )
+
+        cascade_task(self.task.id)
+        self.assertEqual(Task.all_objects(id=self.task.id).count(), 0)
+        self.assertEqual(Comment.objects(task_id=self.task.id).count(), 0)
+        self.assertEqual(CommentFile.objects(comment_id__in=comment_ids).count(), 0)
+        self.assertEqual(TaskFile.objects(task_id=self.task.id).count(), 0)
+
+    def test_delete_twice_is_not_found(self):
+        self.client.delete(f'/api/tasks/tasks/{self.task.id}/delete/')
+        response = self.client.delete(f'/api/tasks/tasks/{self.task.id}/delete/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_concurrent_deleters_release_a_file_once(self):
+        sha256 = 'ab' * 32
+        Blob(id=sha256, file=f'blobs/ab/{sha256}.pdf', size=1, ref_count=2).save()
+        CommentFile(file=f'blobs/ab/{sha256}.pdf', sha256=sha256, comment_id=ObjectId(), uploaded_by_user_id=4).save()
+        rows = list(CommentFile.objects.only('file', 'sha256').as_pymongo())
+
+        # A cascade job and the sweeper read the same rows.
+        self.assertEqual(delete_file_rows(CommentFile, rows), 1)
+        self.assertEqual(delete_file_rows(CommentFile, rows), 0)
+        self.assertEqual(Blob.objects.get(id=sha256).ref_count, 1)
+
+
+class BlobStorageTests(TaskFixtureTestCase):
+    """Identical uploads share a blob that is removed with its last reference."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root.name
+
+    def store(self):
+        return store_upload(SimpleUploadedFile('report.pdf', b'%PDF same bytes'))
+
+    def exists(self, relative_path):
+        return os.path.exists(os.path.join(self.media_root, relative_path))
+
+    def test_references_are_counted_and_last_release_removes_bytes(self):
+        relative_path, sha256 = self.store()
+        self.assertEqual(self.store(), (relative_path, sha256))
+        self.assertEqual(Blob.objects.get(id=sha256).ref_count, 2)
+
+        release_blob(sha256)
+        self.assertEqual(Blob.objects.get(id=sha256).ref_count, 1)
+        self.assertTrue(self.exists(relative_path))
+
+        release_blob(sha256)
+        self.assertEqual(Blob.objects(id=sha256).count(), 0)
+        self.assertFalse(self.exists(relative_path))
+        self.assertEqual(os.listdir(os.path.dirname(os.path.join(self.media_root, relative_path))), [])
+
+    def test_removal_keeps_bytes_of_a_blob_adopted_again(self):
+        relative_path, sha256 = self.store()
+        # The document is back (a concurrent upload) when the remover
+        # reaches the file.
+        storage._remove_blob_file(sha256, relative_path)
+        self.assertTrue(self.exists(relative_path))
+        Blob.objects(id=sha256).delete()
+        storage._remove_blob_file(sha256, relative_path)
+        self.assertFalse(self.exists(relative_path))
+
+    def upload_request(self, **files):
+        request = RequestFactory().post('/upload/', {
+            name: SimpleUploadedFile(f'{name}.pdf', content) for name, content in files.items()
+        })
+        request.user = SimpleNamespace(id=2)
+        return request
+
+    def test_failed_insert_releases_adopted_blobs(self):
+        request = self.upload_request(first=b'%PDF one', second=b'%PDF two', third=b'%PDF one')
+        with mock.patch.object(QuerySet, 'insert', side_effect=pymongo.errors.OperationFailure('boom')):
+            with self.assertRaises(pymongo.errors.OperationFailure):
+                save_uploads(request, TaskFile, task_id=self.task.id)
+        self.assertEqual(Blob.objects.count(), 0)
+        self.assertEqual(TaskFile.objects.count(), 0)
+        stored = [
+            name for directory, _, names in os.walk(os.path.join(self.media_root, 'blobs'))
+            if os.path.basename(directory) != 'tmp' for name in names
+        ]
+        self.assertEqual(stored, [])
+
+    def test_failed_store_releases_earlier_files(self):
+        request = self.upload_request(first=b'%PDF one', second=b'%PDF two')
+        with mock.patch('taskapi.uploads.store_upload', side_effect=[store_upload(request.FILES['first']), OSError]):
+            with self.assertRaises(OSError):
+                save_uploads(request, TaskFile, task_id=self.task.id)
+        self.assertEqual(Blob.objects.count(), 0)
+
+    def test_deleting_a_file_twice_releases_it_once(self):
+        relative_path, sha256 = self.store()
+        self.store()
+        task_file = TaskFile(file=relative_path, sha256=sha256, task_id=self.task.id, uploaded_by_user_id=2)
+        task_file.save()
+        Task.objects(id=self.task.id).update_one(set__file_count=2)
+        url = f'/api/tasks/tasks/{self.task.id}/files/{task_file.id}/delete/'
+        self.assertEqual(self.client.delete(url).status_code, 200)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(Blob.objects.get(id=sha256).ref_count, 1)
+        self.assertEqual(Task.objects.get(id=self.task.id).file_count, 1)
+        self.assertTrue(self.exists(relative_path))
+
+
+class SweepOrphansTests(TaskFixtureTestCase):
+    """sweep_orphans only reclaims what nobody touched within the grace window."""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.media_root = media_root.name
+        self.old = datetime.utcnow() - timedelta(hours=2)
+
+    def sweep(self):
+        call_command('sweep_orphans', stdout=StringIO())
+
+    def blob(self, digit, ref_count, **fields):
+        sha256 = digit * 64
+        relative_path = f'blobs/{digit * 2}/{sha256}.pdf'
+        path = os.path.join(self.media_root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(b'%PDF')
+        Blob(id=sha256, file=relative_path, size=4, ref_count=ref_count, created_at=self.old, **fields).save()
+        return sha256, path
+
+    def test_recently_adopted_blob_is_left_alone(self):
+        # Adopted by an upload whose TaskFile is not inserted yet.
+        sha256, path = self.blob('a', 2, last_adopted_at=datetime.utcnow())
+        self.sweep()
+        self.assertEqual(Blob.objects.get(id=sha256).ref_count, 2)
+        self.assertTrue(os.path.exists(path))
+
+    def test_settled_blobs_are_reconciled(self):
+        unused, unused_path = self.blob('b', 1, last_adopted_at=self.old)
+        legacy, legacy_path = self.blob('c', 3)
+        TaskFile(file=os.path.relpath(legacy_path, self.media_root), sha256=legacy,
+                 task_id=self.task.id, uploaded_by_user_id=2, uploaded_at=self.old).save()
+        self.sweep()
+        self.assertEqual(Blob.objects(id=unused).count(), 0)
+        self.assertFalse(os.path.exists(unused_path))
+        self.assertEqual(Blob.objects.get(id=legacy).ref_count, 1)
+        self.assertTrue(os.path.exists(legacy_path))
+
+    def test_orphan_comments_respect_the_grace_window(self):
+        task_id = ObjectId()
+        young = Comment(text='in flight', created_by_user_id=4, task_id=task_id)
+        young.save()
+        settled = Comment(text='orphan', created_by_user_id=4, task_id=task_id, created_at=self.old)
+        settled.save()
+        self.sweep()
+        self.assertEqual(list(Comment.objects(task_id=task_id).scalar('id')), [young.id])
+
+
+class BulkCreateTests(MongoTestCase):
+    """tasks/bulk/ validates every item and reports per-item results."""
+
+    def item(self, **overrides):
+        item = {
+            'title': 'Imported', 'description': 'From backlog', 'assigned_to_user_id': 4,
+            'team_id': 1, 'due_date': '2030-01-01T00:00:00Z',
+        }
+        item.update(overrides)
+        return item
+
+    @override_settings(TASK_BULK_BATCH_SIZE=2)
+    def test_all_created_in_batches(self):
+        response = self.client.post('/api/tasks/tasks/bulk/', [self.item() for _ in range(5)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(Task.objects(team_id=1).count(), 5)
+        self.assertEqual(Task.objects(created_by_user_id=2).count(), 5)
+
+    def test_partial_failure_maps_errors_to_items(self):
+        items = [self.item(), self.item(status='NOPE'), 'not an object', self.item(title='Last')]
+        response = self.client.post('/api/tasks/tasks/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result['status'] for result in response.data['results']],
+            ['created', 'error', 'error', 'created'],
+        )
+        self.assertIn('status', response.data['results'][1]['errors'])
+        self.assertEqual(Task.objects.get(id=response.data['results'][3]['id']).title, 'Last')
+
+    def test_all_invalid_is_bad_request(self):
+        response = self.client.post('/api/tasks/tasks/bulk/', [{'title': 'x'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects.count(), 0)
+
+
+class BulkUpdateTests(MongoTestCase):
+    """tasks/bulk/update/ patches matching tasks with one update_many."""
+
+    def setUp(self):
+        super().setUp()
+        self.tasks = []
+        for assignee, team_id in ((4, 1), (4, 1), (5, 1), (5, 2)):
+            task = Task(
+                title='Sprint', description='Close me', created_by_user_id=2,
+                assigned_to_user_id=assignee, due_date=datetime.utcnow(), team_id=team_id,
+            )
+            task.save()
+            self.tasks.append(task)
+
+    def patch(self, body):
+        return self.client.patch('/api/tasks/tasks/bulk/update/', body, format='json')
+
+    def test_leader_updates_by_filter(self):
+        response = self.patch({'filter': {'team_id': 1}, 'patch': {'status': 'DONE', 'assigned_to_user_id': 6}})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'matched': 3, 'modified': 3})
+        self.assertEqual(Task.objects(team_id=1, status='DONE', assigned_to_user_id=6).count(), 3)
+
+    def test_member_only_updates_own_tasks(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        ids = [str(task.id) for task in self.tasks]
+        response = self.patch({'ids': ids, 'patch': {'status': 'DONE'}})
+        self.assertEqual(response.data, {'matched': 2, 'modified': 2})
+        self.assertEqual(Task.objects(status='DONE', assigned_to_user_id__ne=4).count(), 0)
+
+    def test_member_cannot_reassign(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        response = self.patch({'ids': [str(self.tasks[0].id)], 'patch': {'assigned_to_user_id': 4}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_requires_ids_or_filter(self):
+        response = self.patch({'patch': {'status': 'DONE'}})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects(status='DONE').count(), 0)
+
+    def test_invalid_filter_does_not_widen_match(self):
+        response = self.patch({'filter': {'due_date_to': 'soon'}, 'patch': {'status': 'DONE'}})
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_filter_values_are_rejected(self):
+        for empty in ({'team_id': None}, {'status': ''}):
+            response = self.patch({'filter': empty, 'patch': {'status': 'DONE'}})
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Task.objects(status='DONE').count(), 0)
+
+    def test_admin_only_updates_tasks_assigned_to_them(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'ADMIN')}")
+        response = self.patch({'filter': {'team_id': 1}, 'patch': {'status': 'DONE'}})
+        self.assertEqual(response.data, {'matched': 2, 'modified': 2})
+        self.assertEqual(Task.objects(status='DONE', assigned_to_user_id__ne=4).count(), 0)
+
+    def test_non_object_body_is_rejected(self):
+        response = self.patch([{'patch': {'status': 'DONE'}}])
+        self.assertEqual(response.status_code, 400)
+
+
+class CursorTests(SimpleTestCase):
+    """Cursor tokens and page assembly, without a database."""
+
+    def test_cursor_round_trips(self):
+        object_id = ObjectId()
+        created = datetime(2024, 5, 1, 12, 30)
+        token = encode_cursor('-created_at', created, object_id, 'next')
+        self.assertNotIn('=', token)
+        self.assertEqual(decode_cursor(token, '-created_at'), (created, object_id, 'next'))
+        self.assertEqual(
+            decode_cursor(encode_cursor('due_date', None, object_id, 'prev'), 'due_date'),
+            (None, object_id, 'prev'),
+        )
+
+    def test_invalid_cursors_are_rejected(self):
+        token = encode_cursor('-created_at', datetime(2024, 5, 1), ObjectId(), 'next')
+        with self.assertRaises(InvalidCursor):
+            decode_cursor(token, 'due_date')
+        for bad in ('garbage', token[:-4], encode_cursor('-created_at', 1, 'not-an-id', 'next'),
+                    encode_cursor('-created_at', 1, ObjectId(), 'sideways')):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(bad, '-created_at')
+
+    def test_parse_limit(self):
+        self.assertEqual(parse_limit(None, 50, 200), 50)
+        self.assertEqual(parse_limit('', 50, 200), 50)
+        self.assertEqual(parse_limit('10', 50, 200), 10)
+        self.assertEqual(parse_limit('1000', 50, 200), 200)
+        for bad in ('0', '-1', 'ten'):
+            with self.assertRaises(ValueError):
+                parse_limit(bad, 50, 200)
+
+    def test_finish_page_sets_cursors_by_direction(self):
+        rows = [{'_id': ObjectId(), 'created_at': datetime(2024, 5, day)} for day in (5, 4, 3)]
+        items, next_cursor, prev_cursor = finish_page(list(rows), '-created_at', 2)
+        self.assertEqual(items, rows[:2])
+        self.assertIsNone(prev_cursor)
+        self.assertEqual(decode_cursor(next_cursor, '-created_at')[1], rows[1]['_id'])
+
+        # Walking back, rows arrive in reverse and are flipped into ordering.
+        cursor = encode_cursor('-created_at', datetime(2024, 5, 2), ObjectId(), 'prev')
+        items, next_cursor, prev_cursor = finish_page(rows[::-1], '-created_at', 2, cursor)
+        self.assertEqual(items, rows[1:])
+        self.assertEqual(decode_cursor(next_cursor, '-created_at')[1], rows[2]['_id'])
+        self.assertEqual(decode_cursor(prev_cursor, '-created_at')[1:], (rows[1]['_id'], 'prev'))
+
+        self.assertEqual(finish_page([], '-created_at', 2), ([], None, None))
+
+
+class TaskListPaginationTests(MongoTestCase):
+    """list_tasks walks pages with next/prev cursors and rejects bad ones."""
+
+    def setUp(self):
+        super().setUp()
+        base = datetime(2024, 5, 1)
+        # Two tasks share a created_at to exercise the _id tie-break.
+        for minutes in (0, 1, 1, 2, 3):
+            Task(
+                title='Page', description='Walk me', created_by_user_id=2, assigned_to_user_id=4,
+                due_date=base, team_id=1, created_at=base + timedelta(minutes=minutes),
+            ).save()
+        self.expected = [
+            str(task.id) for task in Task.objects.order_by('-created_at', '-id')
+        ]
+
+    def page(self, **params):
+        response = self.client.get('/api/tasks/tasks/', {'limit': 2, **params})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return [task['id'] for task in data['results']], data['next'], data['prev']
+
+    def test_next_and_prev_walk_every_task_once(self):
+        first, next_cursor, prev_cursor = self.page()
+        self.assertIsNone(prev_cursor)
+        second, next_cursor, prev_cursor = self.page(cursor=next_cursor)
+        third, last_cursor, _ = self.page(cursor=next_cursor)
+        self.assertEqual(first + second + third, self.expected)
+        self.assertIsNone(last_cursor)
+        self.assertEqual(self.page(cursor=prev_cursor)[0], first)
+
+    def test_ascending_ordering(self):
+        ids, next_cursor, _ = self.page(ordering='created_at', limit=3)
+        rest, _, _ = self.page(ordering='created_at', limit=3, cursor=next_cursor)
+        self.assertEqual(ids + rest, self.expected[::-1])
+
+    def test_bad_cursor_or_limit_is_rejected(self):
+        _, next_cursor, _ = self.page()
+        for params in (
+            {'cursor': 'garbage'},
+            {'cursor': next_cursor, 'ordering': 'due_date'},
+            {'limit': 0},
+            {'limit': 'ten'},
+            {'ordering': 'title'},
+        ):
+            response = self.client.get('/api/tasks/tasks/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class TaskCountsTests(MongoTestCase):
+    """tasks/counts/ groups by team and status in one aggregation and caches it."""
+
+    def setUp(self):
+        super().setUp()
+        caches['default'].clear()
+        for team_id, assignee, task_status in (
+            (1, 4, 'TODO'), (1, 4, 'DONE'), (1, 5, 'DONE'), (2, 5, 'IN_PROGRESS'), (3, 4, 'TODO'),
+        ):
+            Task(
+                title='Count', description='me', created_by_user_id=2, assigned_to_user_id=assignee,
+                due_date=datetime.utcnow(), team_id=team_id, status=task_status,
+            ).save()
+
+    def counts(self, **params):
+        response = self.client.get('/api/tasks/tasks/counts/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['teams']
+
+    def test_counts_per_team_and_status(self):
+        teams = self.counts(team_ids='2,1,9')
+        self.assertEqual(sorted(teams), ['1', '2', '9'])
+        self.assertEqual(teams['1'], {'total': 3, 'by_status': {'TODO': 1, 'IN_PROGRESS': 0, 'DONE': 2}})
+        self.assertEqual(teams['2'], {'total': 1, 'by_status': {'TODO': 0, 'IN_PROGRESS': 1, 'DONE': 0}})
+        self.assertEqual(teams['9'], {'total': 0, 'by_status': {'TODO': 0, 'IN_PROGRESS': 0, 'DONE': 0}})
+
+    @override_settings(TASK_COUNTS_MAX_TEAMS=2)
+    def test_duplicate_team_ids_count_once(self):
+        self.assertEqual(sorted(self.counts(team_ids='1,2,1, 2')), ['1', '2'])
+
+    def test_counts_by_assignee(self):
+        by_assignee = self.counts(team_ids='1', by_assignee='true')['1']['by_assignee']
+        self.assertEqual(by_assignee['4'], {'total': 2, 'by_status': {'TODO': 1, 'IN_PROGRESS': 0, 'DONE': 1}})
+        self.assertEqual(by_assignee['5']['total'], 1)
+
+    def test_member_counts_only_own_tasks(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        teams = self.counts(team_ids='1,2')
+        self.assertEqual(teams['1']['total'], 2)
+        self.assertEqual(teams['2']['total'], 0)
+
+    @override_settings(TASK_COUNTS_CACHE_TTL=60)
+    def test_counts_are_cached_per_scope(self):
+        self.counts(team_ids='1')
+        Task(
+            title='Late', description='arrival', created_by_user_id=2, assigned_to_user_id=4,
+            due_date=datetime.utcnow(), team_id=1,
+        ).save()
+        self.counter.commands.clear()
+        self.assertEqual(self.counts(team_ids='1')['1']['total'], 3)
+        self.assertNotIn('aggregate', self.counter.commands)
+        # Another member's scope is not served from the leaders' entry.
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        self.assertEqual(self.counts(team_ids='1')['1']['total'], 3)
+        self.assertIn('aggregate', self.counter.commands)
+
+
+class TaskCountsValidationTests(SimpleTestCase):
+    """Requests tasks/counts/ rejects before touching MongoDB."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(2, 'TEAM_LEADER')}")
+
+    def test_rejects_bad_team_ids(self):
+        for params in ({}, {'team_ids': ''}, {'team_ids': '1,two'}):
+            response = self.client.get('/api/tasks/tasks/counts/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    @override_settings(TASK_COUNTS_MAX_TEAMS=2)
+    def test_rejects_too_many_teams(self):
+        response = self.client.get('/api/tasks/tasks/counts/', {'team_ids': '1,2,3'})
+        self.assertEqual(response.status_code, 400)
+
+
+class FieldSelectionTests(TaskFixtureTestCase):
+    """``fields`` limits what the task list and detail views fetch and return."""
+
+    def test_list_returns_only_requested_fields(self):
+        response = self.client.get('/api/tasks/tasks/', {'fields': 'title,status'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [{'id': str(self.task.id), 'title': 'Query count', 'status': 'TODO'}])
+
+    def test_paged_list_keeps_cursors_without_the_sort_field(self):
+        Task(
+            title='Second', description='task', created_by_user_id=2, assigned_to_user_id=4,
+            due_date=datetime.utcnow(), team_id=1,
+        ).save()
+        data = self.client.get('/api/tasks/tasks/', {'fields': 'title', 'limit': 1}).json()
+        self.assertEqual(list(data['results'][0]), ['id', 'title'])
+        self.assertIsNotNone(data['next'])
+        rest = self.client.get('/api/tasks/tasks/', {'fields': 'title', 'limit': 1, 'cursor': data['next']})
+        self.assertEqual(rest.json()['results'][0]['title'], 'Query count')
+
+    def test_detail_only_queries_requested_relations(self):
+        self.add_comments(1)
+        url = f'/api/tasks/tasks/{self.task.id}/'
+        self.counter.commands.clear()
+        data = self.client.get(url, {'fields': 'title'}).json()
+        self.assertEqual(data, {'id': str(self.task.id), 'title': 'Query count'})
+        self.assertEqual(self.counter.commands.count('find'), 1)
+
+        data = self.client.get(url, {'fields': 'comments'}).json()
+        self.assertEqual(len(data['comments']), 1)
+        self.assertNotIn('files', data)
+        self.assertNotIn('title', data)
+
+
+class FieldSelectionValidationTests(SimpleTestCase):
+    """``fields`` parsing, and views rejecting unknown fields before querying."""
+
+    def test_parse_fields(self):
+        self.assertIsNone(parse_fields(None, TASK_LIST_FIELDS))
+        self.assertIsNone(parse_fields('', TASK_LIST_FIELDS))
+        self.assertEqual(parse_fields('title, status,title,', TASK_LIST_FIELDS), ['id', 'title', 'status'])
+        with self.assertRaisesMessage(ValueError, 'Unknown fields: comments, secret'):
+            parse_fields('title,comments,secret', TASK_LIST_FIELDS)
+
+    def test_views_reject_unknown_fields(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(2, 'TEAM_LEADER')}")
+        for url in ('/api/tasks/tasks/', f'/api/tasks/tasks/{ObjectId()}/', '/api/tasks/tasks/search/'):
+            response = client.get(url, {'fields': 'secret', 'q': 'x'})
+            self.assertEqual(response.status_code, 400, url)
+            self.assertEqual(response.json(), {'error': 'Unknown fields: secret'})
+
+
+class ConditionalUpdateTests(TaskFixtureTestCase):
+    """Task writes are single conditional updates that bump the version."""
+
+    def url(self, suffix='update/'):
+        return f'/api/tasks/tasks/{self.task.id}/{suffix}'
+
+    def test_update_bumps_version_and_sets_only_sent_fields(self):
+        self.counter.commands.clear()
+        response = self.client.patch(self.url(), {'title': 'Renamed'}, format='json', HTTP_IF_MATCH='"0"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counter.commands, ['findAndModify'])
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(response['ETag'], '"1"')
+        task = Task.objects.get(id=self.task.id)
+        self.assertEqual((task.title, task.description), ('Renamed', 'N+1 regression'))
+
+    def test_stale_version_conflicts(self):
+        self.client.patch(self.url(), {'title': 'First'}, format='json', HTTP_IF_MATCH='"0"')
+        response = self.client.patch(self.url(), {'title': 'Second'}, format='json', HTTP_IF_MATCH='"0"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['version'], 1)
+        self.assertEqual(Task.objects.get(id=self.task.id).title, 'First')
+
+    def test_legacy_document_without_version_matches_zero(self):
+        Task._get_collection().update_one({'_id': self.task.id}, {'$unset': {'version': ''}})
+        response = self.client.patch(self.url('status/'), {'status': 'DONE', 'version': 0}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['version'], 1)
+
+    def test_status_update_by_other_member_is_forbidden(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(5, 'MEMBER')}")
+        response = self.client.patch(self.url('status/'), {'status': 'DONE'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_missing_task_is_not_found(self):
+        response = self.client.patch(f'/api/tasks/tasks/{ObjectId()}/status/', {'status': 'DONE'}, format='json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ListCacheTests(TaskFixtureTestCase):
+    """Repeated list_tasks calls are served from the cache until a write."""
+
+    def test_hit_skips_mongo_until_a_write(self):
+        url = '/api/tasks/tasks/?team_id=1&status=TODO'
+        first = self.client.get(url)
+        self.assertEqual(self.count_commands(url), 0)
+        self.assertEqual(self.client.get(url).content, first.content)
+
+        response = self.client.patch(
+            f'/api/tasks/tasks/{self.task.id}/status/', {'status': 'DONE'}, format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(url).json(), [])
+
+    def test_comment_counts_invalidate(self):
+        url = '/api/tasks/tasks/?team_id=1'
+        self.assertEqual(self.client.get(url).json()[0]['comment_count'], 0)
+        self.client.post(f'/api/tasks/tasks/{self.task.id}/comments/add/', {'text': 'Hi'}, format='json')
+        self.assertEqual(self.client.get(url).json()[0]['comment_count'], 1)
+
+
+@override_settings(TASK_LIST_CACHE_TTL=60)
+class ListCacheKeyTests(SimpleTestCase):
+    """Cache keys follow the caller's scope, the parameters and the generations."""
+
+    leader = SimpleNamespace(id=2, role='TEAM_LEADER')
+    member = SimpleNamespace(id=4, role='MEMBER')
+
+    def setUp(self):
+        caches['task_lists'].clear()
+
+    def key(self, user=leader, fields=None, **params):
+        return cache_key(user, params, fields)
+
+    def test_equivalent_requests_share_a_key(self):
+        self.assertEqual(
+            self.key(team_id='1', status='TODO', ignored='x'),
+            self.key(status='TODO', team_id='01'),
+        )
+        self.assertEqual(self.key(), self.key(SimpleNamespace(id=1, role='ADMIN')))
+
+    def test_scope_and_parameters_change_the_key(self):
+        keys = {
+            self.key(team_id='1'),
+            self.key(self.member, team_id='1'),
+            self.key(SimpleNamespace(id=5, role='MEMBER'), team_id='1'),
+            self.key(team_id='1', cursor='abc'),
+            self.key(team_id='1', limit='10'),
+            self.key(team_id='1', ordering='due_date'),
+            self.key(fields=['id', 'title'], team_id='1'),
+        }
+        self.assertEqual(len(keys), 7)
+
+    def test_writes_bump_only_the_lists_they_cover(self):
+        team_one, team_two, unscoped = self.key(team_id='1'), self.key(team_id='2'), self.key()
+        invalidate_task_lists(1)
+        self.assertNotEqual(self.key(team_id='1'), team_one)
+        self.assertEqual(self.key(team_id='2'), team_two)
+        self.assertNotEqual(self.key(), unscoped)
+
+        team_two = self.key(team_id='2')
+        invalidate_task_lists()
+        self.assertNotEqual(self.key(team_id='2'), team_two)
+
+    def test_primary_and_secondary_reads_are_cached_apart(self):
+        self.assertNotEqual(self.key(team_id='1'), cache_key(self.leader, {'team_id': '1'}, None, primary=False))
+
+    @override_settings(TASK_LIST_READ_MAX_STALENESS=5)
+    def test_secondary_reads_live_at_most_the_staleness_limit(self):
+        with mock.patch.object(caches['task_lists'], 'set') as store:
+            set_response('k', b'[]', primary=False)
+            set_response('k', b'[]')
+        self.assertEqual([call.args[2] for call in store.call_args_list], [5, 60])
+
+    def test_uncacheable_requests(self):
+        self.assertIsNone(self.key(team_id='abc'))
+        with override_settings(TASK_LIST_CACHE_TTL=0):
+            self.assertIsNone(self.key())
+
+    def test_hits_and_bytes_saved_are_counted(self):
+        hits = metrics.TASK_LIST_CACHE_REQUESTS.value(result='hit')
+        misses = metrics.TASK_LIST_CACHE_REQUESTS.value(result='miss')
+        saved = metrics.TASK_LIST_CACHE_BYTES_SAVED.value()
+        key = self.key(team_id='1')
+        self.assertIsNone(get_response(key))
+        set_response(key, b'[]')
+        self.assertEqual(get_response(key), b'[]')
+        self.assertEqual(metrics.TASK_LIST_CACHE_REQUESTS.value(result='hit'), hits + 1)
+        self.assertEqual(metrics.TASK_LIST_CACHE_REQUESTS.value(result='miss'), misses + 1)
+        self.assertEqual(metrics.TASK_LIST_CACHE_BYTES_SAVED.value(), saved + 2)
+
+
+class AsyncReadTests(TaskFixtureTestCase):
+    """The async read endpoints return exactly what the sync views return."""
+
+    def setUp(self):
+        super().setUp()
+        override = override_settings(MONGO_DATABASE=self.db_name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.headers = {'Authorization': f"Bearer {make_token(2, 'TEAM_LEADER')}"}
+        Task(title='Second', description='', created_by_user_id=2, assigned_to_user_id=5,
+             due_date=datetime.utcnow(), team_id=1).save()
+        self.add_comments(3)
+
+    def assert_same(self, path, params=None):
+        expected = self.client.get(f'/api/tasks/{path}', params)
+        actual = asyncio.run(AsyncClient().get(f'/api/tasks/async/{path}', params, headers=self.headers))
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(json.loads(actual.content), json.loads(expected.content))
+        return json.loads(actual.content)
+
+    def test_list_tasks(self):
+        self.assert_same('tasks/')
+        self.assert_same('tasks/', {'fields': 'title,status', 'team_id': 1})
+        page = self.assert_same('tasks/', {'limit': 1, 'ordering': 'due_date'})
+        self.assert_same('tasks/', {'limit': 1, 'ordering': 'due_date', 'cursor': page['next']})
+
+    def test_task_details(self):
+        self.assert_same(f'tasks/{self.task.id}/')
+        self.assert_same(f'tasks/{self.task.id}/', {'fields': 'title,files'})
+        self.assert_same(f'tasks/{ObjectId()}/')
+
+
+class AsyncReadValidationTests(SimpleTestCase):
+    """Requests the async reads reject before touching MongoDB."""
+
+    def test_requires_token(self):
+        response = asyncio.run(AsyncClient().get('/api/tasks/async/tasks/'))
+        self.assertEqual(response.status_code, 401)
+
+    def test_rejects_unknown_fields(self):
+        response = asyncio.run(AsyncClient().get(
+            '/api/tasks/async/tasks/', {'fields': 'secret'},
+            headers={'Authorization': f"Bearer {make_token(2, 'TEAM_LEADER')}"},
+        ))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'Unknown fields: secret'})
+
+
+class CorsTests(SimpleTestCase):
+    """The SPA (another origin) may send and read the headers the API uses."""
+
+    def test_preflight_allows_conditional_update_headers(self):
+        response = self.client.options(
+            f'/api/tasks/tasks/{ObjectId()}/update/',
+            HTTP_ORIGIN='http://localhost:3000',
+            HTTP_ACCESS_CONTROL_REQUEST_METHOD='PATCH',
+            HTTP_ACCESS_CONTROL_REQUEST_HEADERS='authorization,content-type,if-match,x-read-your-writes',
+        )
+        self.assertEqual(response.status_code, 200)
+        allowed = response['Access-Control-Allow-Headers'].split(', ')
+        self.assertIn('if-match', allowed)
+        self.assertIn('x-read-your-writes', allowed)
+
+    def test_etag_is_exposed(self):
+        response = self.client.get('/api/tasks/tasks/', HTTP_ORIGIN='http://localhost:3000')
+        exposed = response['Access-Control-Expose-Headers'].split(', ')
+        self.assertIn('ETag', exposed)
+
+
+class MongoConnectionTests(SimpleTestCase):
+    """Client options come from settings and connecting waits for first use."""
+
+    def tearDown(self):
+        register_connection()
+
+    @override_settings(MONGO_MAX_POOL_SIZE=7, MONGO_WAIT_QUEUE_TIMEOUT_MS=250,
+                       MONGO_COMPRESSORS=['zstd', 'snappy'], MONGO_RETRY_WRITES=False)
+    def test_client_options_follow_settings(self):
+        options = client_options('motor', event_listeners=[CommandCounter()])
+        self.assertEqual(options['maxPoolSize'], 7)
+        self.assertEqual(options['waitQueueTimeoutMS'], 250)
+        self.assertEqual(options['compressors'], ['zstd', 'snappy'])
+        self.assertFalse(options['retryWrites'])
+        listeners = options['event_listeners']
+        self.assertIsInstance(listeners[0], metrics.PoolMetrics)
+        self.assertEqual(listeners[0].client, 'motor')
+        self.assertIsInstance(listeners[1], CommandCounter)
+
+    def test_compression_is_off_unless_configured(self):
+        with override_settings(MONGO_COMPRESSORS=[]):
+            self.assertNotIn('compressors', client_options())
+
+    def test_server_selection_timeout_zero_uses_pymongo_default(self):
+        with override_settings(MONGO_SERVER_SELECTION_TIMEOUT_MS=None):
+            self.assertNotIn('serverSelectionTimeoutMS', client_options())
+        with override_settings(MONGO_SERVER_SELECTION_TIMEOUT_MS=2500):
+            self.assertEqual(client_options()['serverSelectionTimeoutMS'], 2500)
+
+    def test_register_connection_does_not_connect(self):
+        register_connection(db='lazy_test')
+        self.assertNotIn(mongoengine.DEFAULT_CONNECTION_NAME, mongoengine.connection._connections)
+        client = mongoengine.get_connection()
+        self.assertEqual(client.options.pool_options.max_pool_size, settings.MONGO_MAX_POOL_SIZE)
+        self.assertEqual(mongoengine.connection.get_db().name, 'lazy_test')
+
+
+class ReadRoutingTests(SimpleTestCase):
+    """List reads prefer secondaries unless the client has just written."""
+
+    def setUp(self):
+        self.tasks = QuerySet(Task, None)
+        self.factory = RequestFactory()
+
+    def route(self, **headers):
+        return list_reads(self.tasks, self.factory.get('/api/tasks/tasks/', headers=headers))
+
+    def test_list_reads_prefer_fresh_enough_secondaries(self):
+        tasks = self.route()
+        self.assertEqual(tasks._read_preference.mongos_mode, 'secondaryPreferred')
+        self.assertEqual(tasks._read_preference.max_staleness, settings.TASK_LIST_READ_MAX_STALENESS)
+        self.assertEqual(tasks._read_concern.level, settings.TASK_LIST_READ_CONCERN)
+
+    def test_fresh_write_token_reads_from_primary(self):
+        tasks = self.route(**{READ_YOUR_WRITES_HEADER: write_token()})
+        self.assertEqual(tasks._read_preference, ReadPreference.PRIMARY)
+
+    def test_expired_or_forged_tokens_are_ignored(self):
+        with override_settings(TASK_READ_YOUR_WRITES_SECONDS=-1):
+            tasks = self.route(**{READ_YOUR_WRITES_HEADER: write_token()})
+        self.assertEqual(tasks._read_preference.mongos_mode, 'secondaryPreferred')
+        tasks = self.route(**{READ_YOUR_WRITES_HEADER: 'write:forged:token'})
+        self.assertEqual(tasks._read_preference.mongos_mode, 'secondaryPreferred')
+
+    @override_settings(TASK_LIST_READ_PREFERENCE='primary')
+    def test_primary_setting_keeps_reads_on_primary(self):
+        self.assertEqual(self.route()._read_preference, ReadPreference.PRIMARY)
+
+    def test_successful_writes_get_a_token(self):
+        def respond(request_status):
+            return read_your_writes_middleware(lambda request: HttpResponse(status=request_status))
+
+        response = respond(201)(self.factory.post('/api/tasks/tasks/create/'))
+        self.assertTrue(reads_own_writes(self.factory.get(
+            '/', headers={READ_YOUR_WRITES_HEADER: response[READ_YOUR_WRITES_HEADER]},
+        )))
+        self.assertNotIn(READ_YOUR_WRITES_HEADER, respond(400)(self.factory.post('/')))
+        self.assertNotIn(READ_YOUR_WRITES_HEADER, respond(200)(self.factory.get('/')))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class ReplicaSetTestCase(SimpleTestCase):
+    """
+    Start a throwaway three-node replica set with the local ``mongod`` and
+    point MongoEngine at it (no auth). The first member is the primary.
+    Skipped when ``mongod`` is not installed.
+    """
+
+    replica_set = 'taskapi_test'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        mongod = shutil.which('mongod')
+        if mongod is None:
+            raise unittest.SkipTest('mongod is not installed')
+        cls.data_dir = tempfile.TemporaryDirectory()
+        cls.hosts = [f'127.0.0.1:{_free_port()}' for _ in range(3)]
+        cls.processes = []
+        for number, host in enumerate(cls.hosts):
+            db_path = os.path.join(cls.data_dir.name, str(number))
+            os.mkdir(db_path)
+            cls.processes.append(subprocess.Popen(
+                [mongod, '--replSet', cls.replica_set, '--bind_ip', '127.0.0.1',
+                 '--port', host.rsplit(':', 1)[1], '--dbpath', db_path],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            ))
+        try:
+            with pymongo.MongoClient(cls.hosts[0], directConnection=True,
+                                     serverSelectionTimeoutMS=30000) as seed:
+                seed.admin.command('replSetInitiate', {'_id': cls.replica_set, 'members': [
+                    {'_id': number, 'host': host, 'priority': 0 if number else 1}
+                    for number, host in enumerate(cls.hosts)
+                ]})
+            cls.servers = ServerRecorder()
+            register_connection(
+                db='test_replica_set', host=cls.hosts, username=None, password=None,
+                authSource=None, replicaSet=cls.replica_set, event_listeners=[cls.servers],
+            )
+            client = mongoengine.get_connection()
+            deadline = time.monotonic() + 60
+            while client.primary is None or len(client.secondaries) < 2:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('replica set did not come up')
+                time.sleep(0.5)
+        except Exception:
+            cls._stop()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._stop()
+        super().tearDownClass()
+
+    @classmethod
+    def _stop(cls):
+        register_connection()
+        for process in cls.processes:
+            process.terminate()
+        for process in cls.processes:
+            process.wait(30)
+        cls.data_dir.cleanup()
+
+    def setUp(self):
+        Task.drop_collection()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(2, 'TEAM_LEADER')}")
+
+    def servers_for(self, command_name):
+        return {address for name, address in self.servers.calls if name == command_name}
+
+
+class ReplicaSetReadTests(ReplicaSetTestCase):
+    """list_tasks reads from secondaries, except right after the client wrote."""
+
+    def setUp(self):
+        super().setUp()
+        caches['task_lists'].clear()
+
+    def list_servers(self):
+        Task(title='Replicated', description='', created_by_user_id=2, assigned_to_user_id=4,
+             due_date=datetime.utcnow(), team_id=1).save()
+        self.servers.calls.clear()
+        response = self.client.get('/api/tasks/tasks/', {'team_id': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.servers_for('find'))
+        return self.servers_for('find')
+
+    @override_settings(TASK_LIST_CACHE_TTL=0)
+    def test_uncached_list_reads_go_to_secondaries(self):
+        self.assertLessEqual(self.list_servers(), mongoengine.get_connection().secondaries)
+
+    def test_cached_list_misses_are_read_from_primary(self):
+        self.assertEqual(self.list_servers(), {mongoengine.get_connection().primary})
+
+    @override_settings(TASK_LIST_CACHE_SECONDARY_READS=True)
+    def test_secondary_reads_are_cached_when_allowed(self):
+        self.assertLessEqual(self.list_servers(), mongoengine.get_connection().secondaries)
+
+    def test_writer_reads_its_write_from_primary(self):
+        task = Task(title='Mine', description='', created_by_user_id=2, assigned_to_user_id=4,
+                    due_date=datetime.utcnow(), team_id=1)
+        task.save()
+        self.servers.calls.clear()
+        response = self.client.get(
+            '/api/tasks/tasks/', {'team_id': 1}, headers={READ_YOUR_WRITES_HEADER: write_token()},
+        )
+        self.assertEqual([row['id'] for row in response.json()], [str(task.id)])
+        self.assertEqual(self.servers_for('find'), {mongoengine.get_connection().primary})
+
+
+class MetricsTests(SimpleTestCase):
+    """Pool listener bookkeeping and the Prometheus endpoint."""
+
+    def test_pool_checkout_wait_and_failures(self):
+        listener = metrics.PoolMetrics('test')
+        event = SimpleNamespace(address=('localhost', 27017), reason='timeout')
+        listener.connection_created(event)
+        listener.connection_check_out_started(event)
+        listener.connection_checked_out(event)
+        self.assertEqual(metrics.POOL_CHECKED_OUT.value(client='test'), 1)
+        listener.connection_checked_in(event)
+        listener.connection_check_out_started(event)
+        listener.connection_check_out_failed(event)
+
+        count, total = metrics.POOL_CHECKOUT_WAIT.value(client='test')
+        self.assertEqual(count, 2)
+        self.assertGreaterEqual(total, 0)
+        self.assertEqual(metrics.POOL_CHECKED_OUT.value(client='test'), 0)
+        self.assertEqual(metrics.POOL_CONNECTIONS.value(client='test'), 1)
+        self.assertEqual(metrics.POOL_CHECKOUT_FAILURES.value(client='test', reason='timeout'), 1)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', buckets=(1, 5))
+        metrics.REGISTRY.remove(histogram)
+        for value in (0.5, 3, 3, 10):
+            histogram.observe(value)
+        self.assertEqual(list(histogram.samples()), [
+            ('test_seconds_bucket', '{le="1"}', 1),
+            ('test_seconds_bucket', '{le="5"}', 3),
+            ('test_seconds_bucket', '{le="+Inf"}', 4),
+            ('test_seconds_count', '', 4),
+            ('test_seconds_sum', '', 16.5),
+        ])
+
+    @override_settings(TASK_METRICS_TOKEN='scrape')
+    def test_endpoint_requires_the_token(self):
+        self.assertEqual(self.client.get('/api/tasks/metrics/').status_code, 401)
+        response = self.client.get('/api/tasks/metrics/', HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, 401)
+        with override_settings(TASK_METRICS_TOKEN=''):
+            response = self.client.get('/api/tasks/metrics/', HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, 404)
+
+    @override_settings(TASK_METRICS_TOKEN='scrape')
+    def test_endpoint_renders_registry(self):
+        metrics.PoolMetrics('endpoint').connection_created(None)
+        response = self.client.get('/api/tasks/metrics/', HTTP_AUTHORIZATION='Bearer scrape')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('# TYPE taskservice_mongo_pool_checkout_wait_seconds histogram', body)
+        self.assertIn('taskservice_mongo_pool_connections{client="endpoint"} 1', body)
+
+
+class SearchTests(MongoTestCase):
+    """tasks/search/ ranks task and comment matches within the caller's scope."""
+
+    def setUp(self):
+        super().setUp()
+        Task.ensure_indexes()
+        Comment.ensure_indexes()
+        self.tasks = {}
+        for key, title, description, assignee in (
+            ('title', 'Invoice export broken', 'CSV download fails', 4),
+            ('body', 'Billing cleanup', 'The invoice totals are rounded twice', 4),
+            ('other', 'Invoice layout', 'Belongs to someone else', 5),
+            ('none', 'Unrelated', 'Nothing to see', 4),
+        ):
+            task = Task(
+                title=title, description=description, created_by_user_id=2,
+                assigned_to_user_id=assignee, due_date=datetime.utcnow(), team_id=1,
+            )
+            task.save()
+            self.tasks[key] = task
+        Comment(text='Customer sent another invoice sample', created_by_user_id=4,
+                task_id=self.tasks['none'].id).save()
+
+    def search(self, **params):
+        response = self.client.get('/api/tasks/tasks/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_ranks_title_matches_first_and_includes_comment_hits(self):
+        results = self.search(q='invoice')['results']
+        ids = [result['task']['id'] for result in results]
+        self.assertEqual(len(ids), 4)
+        self.assertIn(ids[0], (str(self.tasks['title'].id), str(self.tasks['other'].id)))
+        self.assertEqual(ids[-1], str(self.tasks['none'].id))
+        self.assertIn('comment', results[-1]['highlights'])
+
+    def test_member_only_sees_own_tasks(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        ids = {result['task']['id'] for result in self.search(q='invoice')['results']}
+        self.assertNotIn(str(self.tasks['other'].id), ids)
+        self.assertEqual(len(ids), 3)
+
+    @override_settings(TASK_SEARCH_MAX_CANDIDATES=1)
+    def test_other_users_comments_do_not_crowd_out_members_hits(self):
+        Comment(text='invoice invoice invoice', created_by_user_id=5, task_id=self.tasks['other'].id).save()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {make_token(4, 'MEMBER')}")
+        ids = {result['task']['id'] for result in self.search(q='sample')['results']}
+        self.assertEqual(ids, {str(self.tasks['none'].id)})
+        ids = {result['task']['id'] for result in self.search(q='invoice')['results']}
+        self.assertIn(str(self.tasks['none'].id), ids)
+
+    def test_cursor_pages_without_overlap(self):
+        first = self.search(q='invoice', limit=2)
+        second = self.search(q='invoice', limit=2, cursor=first['next'])
+        ids = [r['task']['id'] for r in first['results'] + second['results']]
+        self.assertEqual(len(set(ids)), 4)
+        self.assertIsNone(second['next'])
+
+
+class TokenCacheTests(SimpleTestCase):
+    """Verified tokens are cached until their exp, and invalid ones never are."""
+
+    def setUp(self):
+        authentication.verified_tokens.clear()
+        self.decode = mock.patch.object(authentication.jwt, 'decode', wraps=jwt.decode)
+        self.decode_calls = self.decode.start()
+        self.addCleanup(self.decode.stop)
+
+    def authenticate(self, token):
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return JWTAuthenticationFromUserService().authenticate(request)
+
+    def test_repeated_token_is_verified_once(self):
+        token = make_token(4, 'MEMBER')
+        user, _ = self.authenticate(token)
+        self.assertIs(self.authenticate(token)[0], user)
+        self.assertEqual(self.decode_calls.call_count, 1)
+        self.assertEqual((user.id, user.user_id, user.role), (4, 4, 'MEMBER'))
+        self.assertTrue(user.is_authenticated)
+
+    def test_token_user_has_no_instance_dict(self):
+        self.assertFalse(hasattr(TokenUser(1), '__dict__'))
+
+    def test_entries_expire_with_the_token(self):
+        token = jwt.encode(
+            {'user_id': 4, 'exp': datetime.utcnow() + timedelta(seconds=30)},
+            settings.SIMPLE_JWT['SIGNING_KEY'], algorithm=settings.SIMPLE_JWT['ALGORITHM'],
+        )
+        self.assertIsNotNone(user_from_token(token))
+        with mock.patch.object(authentication.time, 'time', return_value=time.time() + 29):
+            user_from_token(token)
+        self.assertEqual(self.decode_calls.call_count, 1)
+        # Past exp the entry is gone and the token is verified (here, as
+        # PyJWT's clock is not moved, successfully) again.
+        with mock.patch.object(authentication.time, 'time', return_value=time.time() + 31):
+            user_from_token(token)
+        self.assertEqual(self.decode_calls.call_count, 2)
+
+    @override_settings(AUTH_TOKEN_CACHE_TTL=0)
+    def test_ttl_caps_entries(self):
+        token = make_token(4, 'MEMBER')
+        user_from_token(token)
+        user_from_token(token)
+        self.assertEqual(self.decode_calls.call_count, 2)
+
+    def test_invalid_tokens_are_not_cached(self):
+        forged = jwt.encode({'user_id': 1, 'role': 'ADMIN'}, 'not-the-key', algorithm='HS256')
+        self.assertIsNone(user_from_token(forged))
+        self.assertIsNone(user_from_token(forged))
+        self.assertEqual(len(authentication.verified_tokens), 0)
+
+    @override_settings(AUTH_TOKEN_CACHE_SIZE=2)
+    def test_least_recently_used_token_is_evicted(self):
+        first, second, third = (make_token(user_id, 'MEMBER') for user_id in (1, 2, 3))
+        user_from_token(first)
+        user_from_token(second)
+        user_from_token(first)
+        user_from_token(third)
+        self.assertEqual(len(authentication.verified_tokens), 2)
+        self.decode_calls.reset_mock()
+        user_from_token(first)
+        self.assertEqual(self.decode_calls.call_count, 0)
+        user_from_token(second)
+        self.assertEqual(self.decode_calls.call_count, 1)
+
+
+class HighlightTests(SimpleTestCase):
+    """Highlights give a snippet with match offsets relative to it."""
+
+    def test_offsets_point_at_matches(self):
+        match = highlight('Fix the Invoices export; invoice totals', search_terms('invoice -export'))
+        self.assertEqual(
+            [match['snippet'][start:end] for start, end in match['offsets']],
+            ['Invoices', 'invoice'],
+        )
+
+    def test_phrases_and_no_match(self):
+        self.assertEqual(search_terms('"due date" -draft owner'), ['due date', 'owner'])
+        self.assertIsNone(highlight('Nothing here', ['invoice']))
+
+    def test_long_text_is_windowed(self):
+        text = 'x ' * 200 + 'invoice' + ' y' * 200
+        match = highlight(text, ['invoice'])
+        self.assertTrue(match['truncated_start'] and match['truncated_end'])
+        start, end = match['offsets'][0]
+        self.assertEqual(match['snippet'][start:end], 'invoice')
+
+
+class TaskRowSerializerTests(SimpleTestCase):
+    """serialize_task_rows must render exactly what TaskListSerializer renders."""
+
+    rows = [
+        {
+            '_id': ObjectId(), 'title': 'Full', 'description': 'All fields set',
+            'created_by_user_id': 1, 'assigned_to_user_id': 4, 'status': 'IN_PROGRESS',
+            'due_date': datetime(2025, 3, 1), 'priority': 'HIGH', 'team_id': 2,
+            'created_at': datetime(2025, 1, 2, 3, 4, 5, 678000), 'version': 3,
+        },
+        {
+            # Legacy document without status/priority: defaults apply.
+            '_id': ObjectId(), 'title': 'Sparse', 'description': '',
+            'created_by_user_id': 1, 'assigned_to_user_id': 5,
+            'due_date': datetime(2025, 3, 1, 12), 'team_id': 2,
+            'created_at': datetime(2025, 1, 2),
+        },
+    ]
+
+    def assert_same_json(self, fields=None):
+        tasks = [Task._from_son(row) for row in self.rows]
+        expected = JSONRenderer().render(TaskListSerializer(tasks, many=True, fields=fields).data)
+        actual = JSONRenderer().render(serialize_task_rows(self.rows, fields))
+        self.assertEqual(actual, expected)
+
+    def test_all_fields(self):
+        self.assert_same_json()
+
+    def test_field_subset(self):
+        self.assert_same_json(['id', 'title', 'due_date'])
+
+
+def task_row(**fields):
+    row = {
+        '_id': ObjectId(), 'title': 'Row', 'description': '', 'created_by_user_id': 1,
+        'assigned_to_user_id': 4, 'status': 'TODO', 'priority': 'LOW', 'team_id': 2,
+        'due_date': datetime(2025, 3, 1), 'created_at': datetime(2025, 1, 2), 'version': 1,
+    }
+    row.update(fields)
+    return row
+
+
+class EventBusTests(SimpleTestCase):
+    """Events reach only the streams allowed to see them, and can be replayed."""
+
+    leader = SimpleNamespace(id=2, role='TEAM_LEADER')
+    member = SimpleNamespace(id=4, role='MEMBER')
+
+    async def drain(self, subscription):
+        await asyncio.sleep(0)
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return events
+
+    def test_filters_by_visibility_team_and_task(self):
+        async def scenario():
+            bus = EventBus()
+            leader = bus.subscribe(self.leader)
+            member = bus.subscribe(self.member)
+            other_team = bus.subscribe(self.leader, team_ids={3})
+            mine, theirs = task_row(), task_row(assigned_to_user_id=5)
+            one_task = bus.subscribe(self.leader, task_id=str(theirs['_id']))
+            bus.publish(task_event('task.updated', mine))
+            bus.publish(task_event('task.updated', theirs))
+            return [
+                [event['task_id'] for event in await self.drain(subscription)]
+                for subscription in (leader, member, other_team, one_task)
+            ], mine, theirs
+
+        received, mine, theirs = asyncio.run(scenario())
+        self.assertEqual(received, [
+            [str(mine['_id']), str(theirs['_id'])],
+            [str(mine['_id'])],
+            [],
+            [str(theirs['_id'])],
+        ])
+
+    def test_reassigned_task_reaches_previous_assignee_and_team(self):
+        async def scenario():
+            bus = EventBus()
+            member = bus.subscribe(self.member)
+            old_team = bus.subscribe(self.leader, team_ids={2})
+            before = task_row()
+            after = dict(before, assigned_to_user_id=5, team_id=3)
+            bus.publish(task_event('task.updated', after, before))
+            return await self.drain(member), await self.drain(old_team)
+
+        member, old_team = asyncio.run(scenario())
+        self.assertEqual(len(member), 1)
+        self.assertEqual(member[0]['data']['task']['assigned_to_user_id'], 5)
+        self.assertEqual(len(old_team), 1)
+
+    def test_replays_missed_events_after_last_event_id(self):
+        async def scenario():
+            bus = EventBus()
+            bus.publish(task_event('task.created', task_row()))
+            first_id = bus._recent[0]['id']
+            bus.publish(task_event('task.status', task_row()))
+            resumed = bus.subscribe(self.leader, last_event_id=first_id)
+            stale = bus.subscribe(self.leader, last_event_id='0-1')
+            return await self.drain(resumed), await self.drain(stale)
+
+        resumed, stale = asyncio.run(scenario())
+        self.assertEqual([event['type'] for event in resumed], ['task.status'])
+        self.assertEqual([event['type'] for event in stale], [RESYNC])
+
+    @override_settings(TASK_EVENTS_QUEUE_SIZE=2)
+    def test_slow_stream_is_told_to_resync(self):
+        async def scenario():
+            bus = EventBus()
+            subscription = bus.subscribe(self.leader)
+            for _ in range(5):
+                bus.publish(task_event('task.updated', task_row()))
+            return await self.drain(subscription)
+
+        self.assertEqual([event['type'] for event in asyncio.run(scenario())], [RESYNC])
+
+    def test_format_event(self):
+        row = task_row()
+        event = task_event('task.status', row)
+        event['id'] = 'abc-7'
+        message = format_event(event)
+        self.assertTrue(message.startswith('id: abc-7\nevent: task.status\ndata: {'))
+        self.assertIn(f'"task_id": "{row["_id"]}"', message)
+        self.assertTrue(message.endswith('\n\n'))
+
+
+class ChangeStreamEventTests(SimpleTestCase):
+    """Change stream documents map to the same events the views publish."""
+
+    def change(self, operation, document, updated=()):
+        return {
+            'ns': {'coll': Task._get_collection_name()},
+            'operationType': operation,
+            'fullDocument': document,
+            'updateDescription': {'updatedFields': dict.fromkeys(updated, None)},
+        }
+
+    def event_types(self, change):
+        return [event['type'] for event in events_from_change(change)]
+
+    def test_task_changes(self):
+        row = task_row()
+        self.assertEqual(self.event_types(self.change('insert', row)), ['task.created'])
+        self.assertEqual(self.event_types(self.change('update', row, ['status', 'version'])), ['task.status'])
+        self.assertEqual(self.event_types(self.change('update', row, ['title', 'version'])), ['task.updated'])
+        self.assertEqual(self.event_types(self.change('update', row, ['comment_count'])), [])
+
+    def test_reassignment_carries_previous_assignee(self):
+        before = task_row()
+        change = self.change('update', dict(before, assigned_to_user_id=5), ['assigned_to_user_id', 'version'])
+        change['fullDocumentBeforeChange'] = before
+        [event] = events_from_change(change)
+        self.assertEqual((event['assigned_to_user_id'], event['previous_assigned_to_user_id']), (5, 4))
+
+    def test_reassignment_without_pre_image_resyncs(self):
+        change = self.change('update', task_row(team_id=3), ['team_id', 'version'])
+        self.assertEqual(self.event_types(change), ['task.updated', RESYNC])
+
+    def test_tombstone_is_a_delete(self):
+        row = task_row(deleted_at=datetime(2025, 1, 3))
+        self.assertEqual(self.event_types(self.change('update', row, ['deleted_at'])), ['task.deleted'])
+        self.assertEqual(self.event_types(self.change('delete', None)), [])
+
+
+@override_settings(TASK_EVENTS_SOURCE='local', TASK_EVENTS_HEARTBEAT=1)
+class TaskEventStreamTests(SimpleTestCase):
+    """tasks/events/ streams Server-Sent Events to token-authenticated clients."""
+
+    url = '/api/tasks/tasks/events/'
+
+    def setUp(self):
+        bus = events._bus
+        self.addCleanup(setattr, events, '_bus', bus)
+        events._bus = None
+
+    def test_requires_token(self):
+        response = asyncio.run(AsyncClient().get(self.url))
+        self.assertEqual(response.status_code, 401)
+
+    def test_streams_local_events(self):
+        async def scenario():
+            response = await AsyncClient().get(self.url, {'token': make_token(2, 'TEAM_LEADER')})
+            chunks = aiter(response.streaming_content)
+            first = await anext(chunks)
+            # The stream subscribes when it starts; publish from a view thread.
+            await asyncio.to_thread(
+                events.publish_local, 'task.created', Task._from_son(task_row(title='Live')),
+            )
+            second = await anext(chunks)
+            await chunks.aclose()
+            return response, first, second
+
+        response, first, second = asyncio.run(scenario())
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(first, b'retry: 5000\n\n')
+        self.assertIn(b'event: task.created', second)
+        self.assertIn(b'"title": "Live"', second)
+        self.assertEqual(events._bus.subscriber_count, 0)
+
+
+@override_settings(TASK_EVENTS_SOURCE='local')
+class CommentSocketTests(SimpleTestCase):
+    """The per-task comment WebSocket pushes that task's comment events only."""
+
+    def setUp(self):
+        bus = events._bus
+        self.addCleanup(setattr, events, '_bus', bus)
+        events._bus = None
+        self.row = task_row()
+
+    async def connect(self, token):
+        inbox, outbox = asyncio.Queue(), asyncio.Queue()
+        inbox.put_nowait({'type': 'websocket.connect'})
+        scope = {
+            'type': 'websocket',
+            'path': f'/api/tasks/tasks/{self.row["_id"]}/comments/live/',
+            'query_string': f'token={token}'.encode(),
+        }
+        app = asyncio.create_task(comment_socket(scope, inbox.get, outbox.put))
+        return app, inbox, outbox
+
+    def test_rejects_missing_token(self):
+        async def scenario():
+            app, _, outbox = await self.connect('')
+            await app
+            return await outbox.get()
+
+        self.assertEqual(asyncio.run(scenario()), {'type': 'websocket.close', 'code': CLOSE_UNAUTHORIZED})
+
+    def test_pushes_comment_events_for_its_task(self):
+        async def scenario():
+            app, inbox, outbox = await self.connect(make_token(2, 'TEAM_LEADER'))
+            accepted = await outbox.get()
+            comment = Comment(id=ObjectId(), task_id=self.row['_id'], text='Live', created_by_user_id=2)
+            bus = events._bus
+            await asyncio.to_thread(bus.publish, task_event('task.updated', self.row))
+            await asyncio.to_thread(bus.publish, comment_event('comment.created', comment, task_row()))
+            await asyncio.to_thread(bus.publish, comment_event('comment.created', comment, self.row))
+            frame = await outbox.get()
+            inbox.put_nowait({'type': 'websocket.disconnect'})
+            await app
+            return accepted, frame, outbox.empty(), bus.subscriber_count
+
+        accepted, frame, drained, subscribers = asyncio.run(scenario())
+        self.assertEqual(accepted, {'type': 'websocket.accept'})
+        message = json.loads(frame['text'])
+        self.assertEqual(message['type'], 'comment.created')
+        self.assertEqual(message['data']['comment']['text'], 'Live')
+        self.assertTrue(drained)
+        self.assertEqual(subscribers, 0)
+
+
+class BlobFileModeTests(SimpleTestCase):
+    """Stored blobs are readable by a web server running as another user."""
+
+    def test_written_blob_gets_upload_permissions(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            storage._write_atomically('blobs/ab/abc.pdf', [b'%PDF'])
+            mode = os.stat(os.path.join(media_root, 'blobs/ab/abc.pdf')).st_mode & 0o777
+        self.assertEqual(mode, settings.FILE_UPLOAD_PERMISSIONS)
+
+    @override_settings(FILE_UPLOAD_PERMISSIONS=None)
+    def test_without_upload_permissions_the_umask_applies(self):
+        self.assertEqual(storage.stored_file_mode(), storage.UMASK_FILE_MODE)
+        if os.path.exists('/proc/self/status'):
+            umask = storage._process_umask()
+            self.assertIsNotNone(umask)
+            self.assertEqual(storage.UMASK_FILE_MODE, 0o666 & ~umask)
+
+    def test_umask_is_unknown_without_proc(self):
+        with mock.patch('builtins.open', side_effect=FileNotFoundError):
+            self.assertIsNone(storage._process_umask())
+
+
+class BlobUploadHandlerTests(SimpleTestCase):
+    """Uploads are staged in the blob store, hashed, and size-limited while streaming."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        self.override = override_settings(
+            MEDIA_ROOT=self.media_root,
+            FILE_UPLOAD_MAX_MEMORY_SIZE=0,
+            TASK_UPLOAD_MAX_FILE_SIZE=1024,
+            TASK_UPLOAD_MAX_REQUEST_SIZE=1536,
+        )
+        self.override.enable()
+        self.addCleanup(self.override.disable)
+
+    def post(self, **files):
+        data = {name: SimpleUploadedFile(f'{name}.txt', content) for name, content in files.items()}
+        return RequestFactory().post('/upload/', data)
+
+    def staged_files(self):
+        staging_dir = os.path.join(self.media_root, 'blobs', 'tmp')
+        return os.listdir(staging_dir) if os.path.isdir(staging_dir) else []
+
+    def test_file_is_staged_with_digest(self):
+        content = b'hello world' * 10
+        request = self.post(attachment=content)
+        uploaded = request.FILES['attachment']
+        self.assertIsInstance(uploaded, StagedUpload)
+        self.assertEqual(uploaded.sha256, hashlib.sha256(content).hexdigest())
+        self.assertEqual(uploaded.size, len(content))
+        with open(uploaded.temporary_file_path(), 'rb') as staged:
+            self.assertEqual(staged.read(), content)
+        self.assertEqual(request.upload_stats['bytes'], len(content))
+        mode = os.stat(uploaded.temporary_file_path()).st_mode & 0o777
+        self.assertEqual(mode, settings.FILE_UPLOAD_PERMISSIONS)
+        uploaded.close()
+        self.assertEqual(self.staged_files(), [])
+
+    def test_file_over_limit_is_rejected(self):
+        request = self.post(attachment=b'x' * 2048)
+        with self.assertRaises(UploadTooLarge):
+            request.FILES
+        self.assertEqual(self.staged_files(), [])
+
+    def test_request_over_limit_is_rejected(self):
+        request = self.post(first=b'x' * 1000, second=b'y' * 1000)
+        with self.assertRaises(UploadTooLarge):
+            request.FILES
+        self.assertEqual(self.staged_files(), [])
+
+
+class ServeFileTests(SimpleTestCase):
+    """Attachment downloads honour conditional and Range requests."""
+
+    content = bytes(range(256)) * 4
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        override = override_settings(MEDIA_ROOT=media_root.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        digest = hashlib.sha256(self.content).hexdigest()
+        relative_path = f'blobs/{digest[:2]}/{digest}.pdf'
+        os.makedirs(os.path.join(media_root.name, os.path.dirname(relative_path)))
+        with open(os.path.join(media_root.name, relative_path), 'wb') as blob:
+            blob.write(self.content)
+        self.document = SimpleNamespace(id=ObjectId(), file=relative_path, sha256=digest)
+        self.etag = f'"{digest}"'
+
+    def get(self, **headers):
+        response = serve_file(RequestFactory().get('/download/', **headers), self.document)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_response_headers(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Last-Modified', response)
+
+    def test_if_none_match_returns_304(self):
+        response, body = self.get(HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+
+    def test_if_modified_since_returns_304(self):
+        last_modified = self.get()[0]['Last-Modified']
+        response, _ = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_single_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.content)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+    def test_suffix_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.content[-5:])
+
+    def test_multiple_ranges(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-3,100-')
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        self.assertEqual(int(response['Content-Length']), len(body))
+        self.assertIn(self.content[0:4], body)
+        self.assertIn(self.content[100:], body)
+        self.assertIn(f'Content-Range: bytes 100-{len(self.content) - 1}/{len(self.content)}'.encode(), body)
+
+    def test_unsatisfiable_range(self):
+        response, _ = self.get(HTTP_RANGE=f'bytes={len(self.content)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_stale_if_range_sends_whole_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.content)
+
+    @override_settings(TASK_FILE_SERVING='nginx', TASK_FILE_ACCEL_PREFIX='/protected-media/')
+    def test_nginx_offload(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file}')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['ETag'], self.etag)
+
+    @override_settings(TASK_FILE_SERVING='sendfile')
+    def test_sendfile_offload(self):
+        response, body = self.get()
+        self.assertEqual(body, b'')
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(settings.MEDIA_ROOT, self.document.file),
+        )
+
+    @override_settings(TASK_FILE_SERVING='nginx')
+    def test_offload_still_revalidates(self):
+        response, _ = self.get(HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+
+class InlineExecutor:
+    """Runs submitted work at once, standing in for the preview process pool."""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, function, *args):
+        self.submitted.append(args)
+        future = Future()
+        future.set_result(function(*args))
+        return future
+
+
+class PreviewTests(SimpleTestCase):
+    """Previews are rendered off the request and evicted least-recently-served first."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.media_root = media_root.name
+        override = override_settings(MEDIA_ROOT=self.media_root, TASK_PREVIEW_SIZE=64)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.executor = InlineExecutor()
+        patcher = mock.patch.object(previews, '_get_executor', return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(previews._failed.clear)
+        self.addCleanup(previews._pending.clear)
+
+    def write(self, relative_path, content, atime=None):
+        path = os.path.join(self.media_root, relative_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        if atime is not None:
+            os.utime(path, (atime, atime))
+        return path
+
+    def serve(self, relative_path):
+        document = SimpleNamespace(id=ObjectId(), file=relative_path, sha256='ab')
+        response = serve_preview(RequestFactory().get('/'), document)
+        self.addCleanup(response.close)
+        return response
+
+    def test_evicts_least_recently_served(self):
+        # Originals are neither scanned nor counted.
+        self.write('blobs/ab/big.pdf', b'x' * 1000)
+        for name, atime in (('old', 100), ('mid', 200), ('new', 300)):
+            self.write(preview_path(f'blobs/ab/{name}.jpg'), b'x' * 100, atime)
+        self.assertEqual(evict_previews(self.media_root, 250), 1)
+        remaining = sorted(os.listdir(os.path.join(self.media_root, 'previews', 'blobs', 'ab')))
+        self.assertEqual(remaining, ['mid.jpg.thumb.jpg', 'new.jpg.thumb.jpg'])
+
+    def test_unsupported_type_has_no_preview(self):
+        self.write('blobs/ab/notes.txt', b'text')
+        document = SimpleNamespace(id=ObjectId(), file='blobs/ab/notes.txt', sha256='ab')
+        self.assertIsNone(get_preview(document))
+
+    def test_original_served_in_place_of_a_preview_is_revalidated(self):
+        self.write('blobs/ab/notes.txt', b'text')
+        response = self.serve('blobs/ab/notes.txt')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+        self.assertEqual(response['ETag'], '"ab"')
+        self.assertEqual(self.executor.submitted, [])
+
+    def test_missing_preview_is_queued_once_without_waiting(self):
+        self.write('blobs/ab/scan.pdf', b'%PDF')
+        pool = mock.Mock()
+        pool.submit.return_value = Future()
+        with mock.patch.object(previews, '_get_executor', return_value=pool):
+            for _ in range(2):
+                response = self.serve('blobs/ab/scan.pdf')
+                self.assertEqual(response.status_code, 202)
+                self.assertEqual(response['Retry-After'], '1')
+                self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertEqual(pool.submit.call_count, 1)
+
+    def test_failed_render_serves_the_original(self):
+        self.write('blobs/ab/broken.pdf', b'not a pdf')
+        self.assertEqual(self.serve('blobs/ab/broken.pdf').status_code, 202)
+        response = self.serve('blobs/ab/broken.pdf')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], REVALIDATE_CACHE_CONTROL)
+
+    @unittest.skipIf(Image is None, 'Pillow is not installed')
+    def test_rendered_preview_is_immutable_with_its_original_mode(self):
+        path = self.write('blobs/ab/photo.png', b'')
+        Image.new('RGB', (640, 480), 'red').save(path)
+        os.chmod(path, 0o644)
+        self.assertEqual(self.serve('blobs/ab/photo.png').status_code, 202)
+
+        response = self.serve('blobs/ab/photo.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        self.assertEqual(response['ETag'], '"ab-thumb64"')
+        thumb = os.path.join(self.media_root, preview_path('blobs/ab/photo.png'))
+        self.assertEqual(os.stat(thumb).st_mode & 0o777, 0o644)
+        with Image.open(thumb) as image:
+            self.assertEqual(image.size, (64, 48))
@@ -0,0 +1,188 @@
+"""
+Streaming upload pipeline for task and comment attachments.
+
+``BlobUploadHandler`` is installed as the only Django upload handler. It
+streams each multipart file straight into a staging file inside the blob
+store while hashing it, enforcing per-file and per-request size limits as
+bytes arrive, so uploads are neither buffered in memory nor spooled to a
+system temp file and copied again. ``save_uploads`` then moves the staged
+files into their content-addressed location, inserts all metadata
+documents with a single ``insert_many`` and queues preview rendering.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import time
+from bson.objectid import ObjectId
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from .previews import schedule_previews
+from .storage import BLOB_DIR, release_blob, store_upload, stored_file_mode
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Upload is too large.'
+    default_code = 'upload_too_large'
+
+
+class StagedUpload(UploadedFile):
+    """
+    An uploaded file already written to the blob store's staging area,
+    with its SHA-256 computed. Closing it removes the staged bytes unless
+    they were moved into the store.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, content_type_extra, sha256):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        staged_path = self.file.name
+        try:
+            return self.file.close()
+        finally:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """Stream multipart files into the blob store's staging directory."""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.staged = []
+        self.request_bytes = 0
+        self.started_at = None
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        self.started_at = time.perf_counter()
+        # Reject oversized requests from the declared length, before reading.
+        if content_length and content_length > settings.TASK_UPLOAD_MAX_REQUEST_SIZE:
+            raise UploadTooLarge(
+                f'Request exceeds {settings.TASK_UPLOAD_MAX_REQUEST_SIZE} bytes.'
+            )
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        staging_dir = os.path.join(settings.MEDIA_ROOT, BLOB_DIR, 'tmp')
+        os.makedirs(staging_dir, exist_ok=True)
+        self.file = tempfile.NamedTemporaryFile(dir=staging_dir, suffix='.upload', delete=False)
+        # Staged files are renamed into the blob store as they are.
+        os.fchmod(self.file.fileno(), stored_file_mode())
+        self.staged.append(self.file)
+        self.digest = hashlib.sha256()
+        self.file_bytes = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.file_bytes += len(raw_data)
+        self.request_bytes += len(raw_data)
+        if self.file_bytes > settings.TASK_UPLOAD_MAX_FILE_SIZE:
+            self.abort()
+            raise UploadTooLarge(
+                f'"{self.file_name}" exceeds {settings.TASK_UPLOAD_MAX_FILE_SIZE} bytes.'
+            )
+        if self.request_bytes > settings.TASK_UPLOAD_MAX_REQUEST_SIZE:
+            self.abort()
+            raise UploadTooLarge(
+                f'Request exceeds {settings.TASK_UPLOAD_MAX_REQUEST_SIZE} bytes.'
+            )
+        self.digest.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        return StagedUpload(
+            self.file, self.file_name, self.content_type, file_size,
+            self.charset, self.content_type_extra, self.digest.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        self.abort()
+
+    def upload_complete(self):
+        if self.request is None or self.started_at is None or not self.staged:
+            return
+        elapsed = max(time.perf_counter() - self.started_at, 1e-6)
+        self.request.upload_stats = {
+            'files': len(self.staged),
+            'bytes': self.request_bytes,
+            'seconds': elapsed,
+            'bytes_per_second': self.request_bytes / elapsed,
+        }
+
+    def abort(self):
+        """Close and remove every file staged by this request so far."""
+        for staged_file in self.staged:
+            staged_file.close()
+            if os.path.exists(staged_file.name):
+                os.remove(staged_file.name)
+
+
+def save_uploads(request, document_class, **fields):
+    """
+    Store every file in ``request.FILES`` and create one ``document_class``
+    (TaskFile or CommentFile) per file with a single ``insert_many``.
+
+    ``fields`` are set on every document, alongside ``file``, ``sha256``
+    and ``uploaded_by_user_id``. Returns the inserted documents. If a file
+    cannot be stored or the insert fails, the blob references already
+    taken are released before the error propagates.
+    """
+    started_at = time.perf_counter()
+    documents = []
+    try:
+        for file_key in request.FILES:
+            for uploaded_file in request.FILES.getlist(file_key):
+                relative_path, digest = store_upload(uploaded_file)
+                documents.append(document_class(
+                    # Set up front, so a failed insert can be undone by id.
+                    id=ObjectId(),
+                    file=relative_path,
+                    sha256=digest,
+                    uploaded_by_user_id=request.user.id,
+                    **fields
+                ))
+        if documents:
+            document_class.objects.insert(documents, load_bulk=False)
+    except Exception:
+        _abandon(document_class, documents)
+        raise
+
+    if documents:
+        schedule_previews([document.file for document in documents])
+
+        stats = getattr(request, 'upload_stats', None)
+        if stats:
+            logger.info(
+                'Received %d file(s), %d bytes in %.3fs (%.1f KiB/s); stored in %.3fs',
+                stats['files'], stats['bytes'], stats['seconds'],
+                stats['bytes_per_second'] / 1024, time.perf_counter() - started_at,
+            )
+    return documents
+
+
+def _abandon(document_class, documents):
+    """
+    Undo a failed ``save_uploads``: remove any of ``documents`` the insert
+    wrote, then release their blob references. If the cleanup fails too,
+    the references are kept (a leak ``sweep_orphans`` reclaims) rather than
+    released under documents that may exist.
+    """
+    try:
+        document_class.objects(id__in=[document.id for document in documents]).delete()
+    except Exception:
+        logger.exception('Could not remove documents of a failed upload')
+        return
+    for document in documents:
+        release_blob(document.sha256)
@@ -1,10 +1,15 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     # Task CRUD operations
     path('tasks/', views.list_tasks, name='list_tasks'),
     path('tasks/create/', views.create_task, name='create_task'),
+    path('tasks/bulk/', views.bulk_create_tasks, name='bulk_create_tasks'),
+    path('tasks/bulk/update/', views.bulk_update_tasks, name='bulk_update_tasks'),
+    path('tasks/counts/', views.task_counts, name='task_counts'),
+    path('tasks/search/', views.search_tasks, name='search_tasks'),
+    path('tasks/events/', views.task_events, name='task_events'),
     path('tasks/<str:task_id>/', views.task_details, name='task_details'),
     path('tasks/<str:task_id>/update/', views.update_task, name='update_task'),
     path('tasks/<str:task_id>/delete/', views.delete_task, name='delete_task'),
@@ -23,5 +28,12 @@ urlpatterns = [
     path('tasks/<str:task_id>/files/attach/', views.attach_file, name='attach_file'),
     path('tasks/<str:task_id>/files/<str:file_id>/', views.download_file, name='download_file'),
     path('tasks/<str:task_id>/files/<str:file_id>/delete/', views.delete_file, name='delete_file'),
+    
+    # Async (ASGI) reads, same output as the views above
+    path('async/tasks/', async_views.list_tasks, name='async_list_tasks'),
+    path('async/tasks/<str:task_id>/', async_views.task_details, name='async_task_details'),
+
+    # Prometheus metrics
+    path('metrics/', views.metrics, name='metrics'),
 ]
 
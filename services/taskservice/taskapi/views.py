@@ -3,21 +3,155 @@ from rest_framework.permissions import AllowAny
 from rest_framework.decorators import api_view, permission_classes, parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.response import Response
-from django.http import FileResponse, Http404
-from datetime import datetime
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from asgiref.sync import sync_to_async
 from bson.objectid import ObjectId
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import hmac
 import os
-import uuid
-import mimetypes
 from django.conf import settings
+from django.core.cache import cache
 from pathlib import Path
 from .models import Task, Comment, TaskFile, CommentFile
 from .serializers import (
     TaskSerializer, TaskListSerializer, TaskDetailSerializer,
-    CommentSerializer, TaskFileSerializer, CommentFileSerializer
+    CommentSerializer, TaskFileSerializer, CommentFileSerializer,
+    serialize_task_rows
 )
-from .authentication import JWTAuthenticationFromUserService
-from .permissions import IsTeamLeader, IsTeamLeaderOrAssignedUser
+from .authentication import JWTAuthenticationFromUserService, user_from_token
+from .permissions import IsTeamLeader
+from .pagination import InvalidCursor, paginate, parse_limit
+from .queries import visible_tasks, filter_tasks, parse_fields
+from .storage import delete_stored_file
+from .bulk import create_tasks, update_tasks
+from .cascade import schedule_comment_cascade, schedule_task_cascade
+from .downloads import serve_file
+from .list_cache import cache_key, get_response, invalidate_task_lists, set_response
+from .mongo import list_reads, reads_from_primary
+from . import metrics as task_metrics
+from .events import RESYNC, format_event, get_bus, publish_local
+from .previews import serve_preview
+from .search import highlight, run_search, search_terms
+from .uploads import save_uploads
+
+
+TASK_LIST_ORDERINGS = ('-created_at', 'created_at', '-due_date', 'due_date')
+TASK_STATUSES = ('TODO', 'IN_PROGRESS', 'DONE')
+COMMENT_ORDERING = '-created_at'
+TASK_FIELDS = tuple(TaskSerializer().fields)
+TASK_LIST_FIELDS = tuple(TaskListSerializer().fields)
+TASK_DETAIL_FIELDS = TASK_FIELDS + ('comments', 'files')
+# Fields deciding who sees a task (visible_tasks and event streams).
+VISIBILITY_FIELDS = ('team_id', 'assigned_to_user_id')
+
+
+def _requested_fields(request, allowed):
+    """
+    Parse the ``fields`` query parameter against the ``allowed`` names.
+    
+    Returns None when the parameter is absent; otherwise the requested
+    names with ``id`` first. Raises ValueError on unknown names.
+    """
+    return parse_fields(request.query_params.get('fields'), allowed)
+
+
+def _bump_task_counters(task, comments=0, files=0):
+    """Atomically adjust a task's denormalized comment/file counters."""
+    increments = {}
+    if comments:
+        increments['inc__comment_count'] = comments
+    if files:
+        increments['inc__file_count'] = files
+    if increments:
+        Task.objects(id=task.id).update_one(**increments)
+        invalidate_task_lists(task.team_id)
+
+
+def _expected_version(request):
+    """
+    The task version a write is conditioned on, from ``If-Match`` or the
+    body's ``version``; None when the client sent neither (or ``*``).
+    Raises ValueError when it is not an integer.
+    """
+    if_match = request.META.get('HTTP_IF_MATCH', '').strip()
+    if if_match:
+        if if_match == '*':
+            return None
+        return int(if_match.removeprefix('W/').strip('"'))
+    version = request.data.get('version')
+    return None if version in (None, '') else int(version)
+
+
+def _conditional_update(task_id, updates, expected_version=None, assignee_id=None, unchanged=None):
+    """
+    Apply ``updates`` and bump the version with one find_one_and_update.
+
+    The write only matches when the task is at ``expected_version`` (if
+    given), assigned to ``assignee_id`` (if given) and still has the
+    values in ``unchanged`` (a raw row, if given). Returns ``(task, None)``
+    on success or ``(None, error_response)`` with 404, 403 or 409,
+    determined by re-reading the task only after a miss.
+    """
+    query = {'id': ObjectId(task_id)}
+    if expected_version is not None:
+        # Documents written before versioning have no version field.
+        query['version__in'] = [0, None] if expected_version == 0 else [expected_version]
+    if unchanged is not None:
+        query.update((field, value) for field, value in unchanged.items() if field != '_id')
+    if assignee_id is not None:
+        query['assigned_to_user_id'] = assignee_id
+    
+    task = Task.objects(**query).modify(new=True, inc__version=1, **updates)
+    if task is not None:
+        return task, None
+    
+    current = Task.objects(id=ObjectId(task_id)).only('version', 'assigned_to_user_id').first()
+    if current is None:
+        return None, Response(
+            {'error': 'Task not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    if assignee_id is not None and current.assigned_to_user_id != assignee_id:
+        return None, Response(
+            {'error': 'You do not have permission to update this task'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    return None, Response(
+        {'error': 'Task was modified by someone else', 'version': current.version or 0},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def _task_response(task, response_status=status.HTTP_200_OK):
+    """Serialize a task, with its version as the ETag for If-Match."""
+    response = Response(TaskSerializer(task).data, status=response_status)
+    response['ETag'] = f'"{task.version or 0}"'
+    return response
+
+
+def _serialize_comments(comments):
+    """
+    Serialize comments with their attached files.
+    
+    Files for all comments are fetched with a single ``$in`` query and
+    grouped in memory, so the query count does not grow with the number
+    of comments.
+    """
+    comments = list(comments)
+    files_by_comment = defaultdict(list)
+    if comments:
+        comment_files = CommentFile.objects.filter(comment_id__in=[comment.id for comment in comments])
+        for comment_file in comment_files:
+            files_by_comment[comment_file.comment_id].append(comment_file)
+    
+    comments_data = []
+    for comment in comments:
+        comment_data = CommentSerializer(comment).data
+        comment_data['files'] = CommentFileSerializer(files_by_comment[comment.id], many=True).data
+        comments_data.append(comment_data)
+    return comments_data
 
 
 @api_view(['POST'])
@@ -31,32 +165,14 @@ def create_task(request):
     if serializer.is_valid():
         task = serializer.save()
         
-        uploaded_files = []
-        if request.FILES:
-            media_root = settings.MEDIA_ROOT
-            uploads_dir = os.path.join(media_root, 'task_files')
-            os.makedirs(uploads_dir, exist_ok=True)
-            
-            for file_key in request.FILES:
-                file_list = request.FILES.getlist(file_key)
-                for uploaded_file in file_list:
-                    file_ext = os.path.splitext(uploaded_file.name)[1]
-                    unique_filename = f"{uuid.uuid4()}{file_ext}"
-                    file_path = os.path.join(uploads_dir, unique_filename)
-                    
-                    with open(file_path, 'wb+') as destination:
-                        for chunk in uploaded_file.chunks():
-                            destination.write(chunk)
-                    
-                    relative_path = f"task_files/{unique_filename}"
-                    
-                    task_file = TaskFile(
-                        file=relative_path,
-                        task_id=task.id,
-                        uploaded_by_user_id=request.user.id
-                    )
-                    task_file.save()
-                    uploaded_files.append(task_file)
+        uploaded_files = save_uploads(request, TaskFile, task_id=task.id)
+        
+        if uploaded_files:
+            _bump_task_counters(task, files=len(uploaded_files))
+            task.file_count += len(uploaded_files)
+        
+        invalidate_task_lists(task.team_id)
+        publish_local('task.created', task)
         
         response_data = TaskSerializer(task).data
         if uploaded_files:
@@ -66,24 +182,101 @@ def create_task(request):
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsTeamLeader])
+@parser_classes([JSONParser])
+def bulk_create_tasks(request):
+    """
+    Create many tasks from a JSON array (Team Leader only).
+    
+    Every item is validated independently and valid items are written with
+    unordered insert_many batches. Returns one result per item; the status
+    is 201 when all were created, 207 when some failed, 400 when none were.
+    """
+    items = request.data
+    if not isinstance(items, list) or not items:
+        return Response(
+            {'error': 'Expected a non-empty JSON array of tasks'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > settings.TASK_BULK_MAX_ITEMS:
+        return Response(
+            {'error': f'At most {settings.TASK_BULK_MAX_ITEMS} tasks can be created at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    results = create_tasks(items, request.user)
+    created = sum(1 for result in results if result['status'] == 'created')
+    if created == len(results):
+        response_status = status.HTTP_201_CREATED
+    elif created:
+        response_status = status.HTTP_207_MULTI_STATUS
+    else:
+        response_status = status.HTTP_400_BAD_REQUEST
+    return Response(
+        {'created': created, 'failed': len(results) - created, 'results': results},
+        status=response_status
+    )
+
+
+@api_view(['PATCH'])
+@parser_classes([JSONParser])
+def bulk_update_tasks(request):
+    """
+    Apply one field patch to many tasks with a single update_many.
+    
+    Body: ``{"ids": [...]}`` and/or ``{"filter": {...list_tasks filters}}``,
+    plus ``{"patch": {...}}``. Team leaders may set status, priority,
+    assignee, due date and team; other users may only change the status of
+    tasks assigned to them. Returns the matched and modified counts.
+    """
+    if not isinstance(request.data, dict):
+        return Response(
+            {'error': 'Expected a JSON object'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    matched, modified = update_tasks(
+        request.user,
+        request.data.get('patch'),
+        ids=request.data.get('ids'),
+        filters=request.data.get('filter'),
+    )
+    return Response({'matched': matched, 'modified': modified}, status=status.HTTP_200_OK)
+
+
 @api_view(['DELETE'])
 @permission_classes([IsTeamLeader])
 def delete_task(request, task_id):
     """
     Delete a task (Team Leader only).
+    
+    Only a tombstone is written here; the task's comments, files and
+    stored attachments are removed by a background cascade job.
     """
     try:
-        task = Task.objects.get(id=ObjectId(task_id))
-        task.delete()
-        return Response(
-            {'message': 'Task deleted successfully'},
-            status=status.HTTP_200_OK
-        )
-    except (Task.DoesNotExist, Exception):
+        task = Task.objects(id=ObjectId(task_id)).modify(new=True, set__deleted_at=datetime.utcnow())
+    except Exception:
+        task = None
+    if task is None:
         return Response(
             {'error': 'Task not found'},
             status=status.HTTP_404_NOT_FOUND
         )
+    schedule_task_cascade(task.id)
+    invalidate_task_lists(task.team_id)
+    publish_local('task.deleted', task)
+    return Response(
+        {'message': 'Task deleted successfully'},
+        status=status.HTTP_200_OK
+    )
+
+
+def _cached_list(key, data, primary):
+    """A list response, stored under ``key`` (if any) once rendered."""
+    response = Response(data)
+    if key is not None:
+        response.add_post_render_callback(lambda rendered: set_response(key, rendered.content, primary))
+    return response
 
 
 @api_view(['GET'])
@@ -91,47 +284,276 @@ def delete_task(request, task_id):
 def list_tasks(request):
     """
     List tasks with filtering options.
+    
+    Passing ``limit`` and/or ``cursor`` switches to keyset pagination ordered
+    by ``ordering`` (``created_at`` or ``due_date``, ``-`` for descending) and
+    returns ``{"results", "next", "prev"}`` instead of a bare list.
+    
+    ``fields`` (comma-separated) limits both the Mongo projection and the
+    serialized output to the requested fields; ``id`` is always included.
+    
+    Rows are read with ``as_pymongo()`` and rendered by
+    ``serialize_task_rows``, which produces the same output as
+    ``TaskListSerializer`` without building a Task document per row.
+    
+    JSON responses are cached per caller scope and parameters, and
+    invalidated by writes to the teams they cover (see ``list_cache``).
+    """
+    try:
+        fields = _requested_fields(request, TASK_LIST_FIELDS)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    key = None
+    primary = reads_from_primary(request)
+    if request.accepted_renderer.format == 'json':
+        # Unless secondary reads may be cached, a miss that will be cached
+        # is read from the primary, so no hit predates a covered write.
+        cached_primary = primary or not settings.TASK_LIST_CACHE_SECONDARY_READS
+        key = cache_key(request.user, request.query_params, fields, cached_primary)
+        if key is not None:
+            primary = cached_primary
+    if key is not None:
+        content = get_response(key)
+        if content is not None:
+            return HttpResponse(content, content_type='application/json')
+    tasks = list_reads(filter_tasks(visible_tasks(request.user), request.query_params), request, primary)
+    
+    limit = request.query_params.get('limit')
+    cursor = request.query_params.get('cursor')
+    if limit is None and cursor is None:
+        if fields:
+            tasks = tasks.only(*fields)
+        return _cached_list(key, serialize_task_rows(tasks.as_pymongo(), fields), primary)
+    
+    ordering = request.query_params.get('ordering', '-created_at')
+    if ordering not in TASK_LIST_ORDERINGS:
+        return Response(
+            {'error': f"ordering must be one of: {', '.join(TASK_LIST_ORDERINGS)}"},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    if fields:
+        # The sort key is needed to build cursors even when not requested.
+        tasks = tasks.only(*fields, ordering.lstrip('-'))
+    
+    try:
+        limit = parse_limit(limit, settings.TASK_LIST_DEFAULT_LIMIT, settings.TASK_LIST_MAX_LIMIT)
+        tasks, next_cursor, prev_cursor = paginate(tasks.as_pymongo(), ordering, limit, cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response(
+            {'error': 'limit must be a positive integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return _cached_list(key, {
+        'results': serialize_task_rows(tasks, fields),
+        'next': next_cursor,
+        'prev': prev_cursor,
+    }, primary)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def search_tasks(request):
+    """
+    Relevance-ranked full-text search over task titles, descriptions and
+    comments (``q``), scoped like ``list_tasks`` (role and the same filters).
+    
+    Returns ``{"results": [{"task", "score", "highlights"}], "next"}``;
+    pass ``next`` back as ``cursor`` for the following page. ``fields``
+    limits the task output as in ``list_tasks``.
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query or len(query) > settings.TASK_SEARCH_MAX_QUERY_LENGTH:
+        return Response(
+            {'error': f'q must be 1 to {settings.TASK_SEARCH_MAX_QUERY_LENGTH} characters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        fields = _requested_fields(request, TASK_LIST_FIELDS)
+        limit = parse_limit(
+            request.query_params.get('limit'),
+            settings.TASK_SEARCH_DEFAULT_LIMIT,
+            settings.TASK_SEARCH_MAX_LIMIT,
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    tasks = list_reads(filter_tasks(visible_tasks(request.user), request.query_params), request)
+    # Title and description are always fetched for highlighting.
+    fetch_fields = set(fields or TASK_LIST_FIELDS) | {'title', 'description'}
+    try:
+        hits, next_cursor = run_search(
+            tasks, query, limit, request.query_params.get('cursor'), fetch_fields,
+        )
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    comment_ids = [hit['comment_id'] for hit in hits if hit.get('comment_id')]
+    comment_texts = {}
+    if comment_ids:
+        comment_texts = {
+            row['_id']: row['text']
+            for row in list_reads(Comment.objects(id__in=comment_ids), request).only('text').as_pymongo()
+        }
+    
+    terms = search_terms(query)
+    task_data = serialize_task_rows([hit['task'] for hit in hits], fields)
+    results = []
+    for hit, task in zip(hits, task_data):
+        highlights = {}
+        for field in ('title', 'description'):
+            match = highlight(hit['task'].get(field), terms)
+            if match:
+                highlights[field] = match
+        comment_id = hit.get('comment_id')
+        match = highlight(comment_texts.get(comment_id), terms)
+        if match:
+            highlights['comment'] = dict(match, comment_id=str(comment_id))
+        results.append({'task': task, 'score': round(hit['score'], 4), 'highlights': highlights})
+    
+    return Response({'results': results, 'next': next_cursor})
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def task_counts(request):
+    """
+    Count tasks per team and status for many teams in one aggregation.
+    
+    Takes ``team_ids`` as a comma-separated list and an optional
+    ``by_assignee=true`` to also break counts down per assigned user.
+    Counts are scoped like ``list_tasks`` and cached for a few seconds.
     """
-    user_id = request.user.id
+    try:
+        team_ids = sorted({
+            int(team_id) for team_id in request.query_params.get('team_ids', '').split(',')
+            if team_id.strip()
+        })
+    except ValueError:
+        return Response(
+            {'error': 'team_ids must be a comma-separated list of integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if not team_ids:
+        return Response(
+            {'error': 'team_ids is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(team_ids) > settings.TASK_COUNTS_MAX_TEAMS:
+        return Response(
+            {'error': f'At most {settings.TASK_COUNTS_MAX_TEAMS} team_ids are allowed'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    by_assignee = request.query_params.get('by_assignee', 'false').lower() == 'true'
+    
+    # Leaders and admins see every task, so they can share cache entries.
     user_role = getattr(request.user, 'role', None)
+    scope = 'all' if user_role in ('ADMIN', 'TEAM_LEADER') else f'user:{request.user.id}'
+    cache_key = f"task_counts:{scope}:{by_assignee:d}:{','.join(map(str, team_ids))}"
+    counts = cache.get(cache_key)
+    if counts is not None:
+        return Response(counts, status=status.HTTP_200_OK)
     
-    if user_role == 'ADMIN':
-        tasks = Task.objects.all()
-    elif user_role == 'TEAM_LEADER':
-        tasks = Task.objects.all()
-    else:
-        tasks = Task.objects.filter(assigned_to_user_id=user_id)
+    group_id = {'team_id': '$team_id', 'status': '$status'}
+    if by_assignee:
+        group_id['assignee'] = '$assigned_to_user_id'
+    pipeline = [{'$group': {'_id': group_id, 'count': {'$sum': 1}}}]
+    rows = list_reads(visible_tasks(request.user).filter(team_id__in=team_ids), request).aggregate(pipeline)
     
-    team_id = request.query_params.get('team_id')
-    if team_id:
-        tasks = tasks.filter(team_id=int(team_id))
+    teams = {
+        str(team_id): {'total': 0, 'by_status': {choice: 0 for choice in TASK_STATUSES}}
+        for team_id in team_ids
+    }
+    if by_assignee:
+        for team in teams.values():
+            team['by_assignee'] = {}
     
-    assigned_to_user_id = request.query_params.get('assigned_to_user_id')
-    if assigned_to_user_id:
-        tasks = tasks.filter(assigned_to_user_id=int(assigned_to_user_id))
+    for row in rows:
+        key, count = row['_id'], row['count']
+        team = teams[str(key['team_id'])]
+        team['total'] += count
+        team['by_status'][key['status']] = team['by_status'].get(key['status'], 0) + count
+        if by_assignee:
+            assignee = team['by_assignee'].setdefault(
+                str(key.get('assignee')),
+                {'total': 0, 'by_status': {choice: 0 for choice in TASK_STATUSES}}
+            )
+            assignee['total'] += count
+            assignee['by_status'][key['status']] = assignee['by_status'].get(key['status'], 0) + count
     
-    status_filter = request.query_params.get('status')
-    if status_filter:
-        tasks = tasks.filter(status=status_filter)
+    counts = {'teams': teams}
+    cache.set(cache_key, counts, settings.TASK_COUNTS_CACHE_TTL)
+    return Response(counts, status=status.HTTP_200_OK)
+
+
+async def _event_stream(bus, user, team_ids, task_id, last_event_id):
+    subscription = bus.subscribe(user, team_ids, task_id, last_event_id)
+    try:
+        yield 'retry: 5000\n\n'
+        while True:
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), settings.TASK_EVENTS_HEARTBEAT
+                )
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            yield format_event(event)
+            if event['type'] == RESYNC:
+                return
+    finally:
+        bus.unsubscribe(subscription)
+
+
+async def task_events(request):
+    """
+    Server-Sent Events stream of changes to the tasks the user may see.
     
-    due_date_from = request.query_params.get('due_date_from')
-    if due_date_from:
-        try:
-            due_date_from_dt = datetime.fromisoformat(due_date_from.replace('Z', '+00:00'))
-            tasks = tasks.filter(due_date__gte=due_date_from_dt)
-        except Exception:
-            pass
+    A plain Django async view rather than a DRF one, so that under ASGI an
+    open stream holds a queue instead of a worker thread. EventSource cannot
+    send headers, so the access token may be passed as ``token``.
+    ``team_ids`` (comma-separated) and ``task_id`` narrow the stream, and a
+    reconnect with ``Last-Event-ID`` replays missed events. On ``resync``
+    the stream ends and the client should refetch before reconnecting.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
     
-    due_date_to = request.query_params.get('due_date_to')
-    if due_date_to:
-        try:
-            due_date_to_dt = datetime.fromisoformat(due_date_to.replace('Z', '+00:00'))
-            tasks = tasks.filter(due_date__lte=due_date_to_dt)
-        except Exception:
-            pass
+    token = request.GET.get('token') or request.headers.get('Authorization', '').removeprefix('Bearer ')
+    user = user_from_token(token) if token else None
+    if user is None:
+        return JsonResponse(
+            {'error': 'Authentication credentials were not provided or are invalid'},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    try:
+        team_ids = {
+            int(team_id) for team_id in request.GET.get('team_ids', '').split(',') if team_id.strip()
+        }
+    except ValueError:
+        return JsonResponse(
+            {'error': 'team_ids must be a comma-separated list of integers'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
-    serializer = TaskListSerializer(tasks, many=True)
-    return Response(serializer.data)
+    bus = get_bus()
+    if bus.source is None:
+        await sync_to_async(bus.start)()
+    response = StreamingHttpResponse(
+        _event_stream(
+            bus, user, team_ids, request.GET.get('task_id'), request.headers.get('Last-Event-ID'),
+        ),
+        content_type='text/event-stream',
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Keep nginx from buffering the stream.
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 @api_view(['GET'])
@@ -139,29 +561,47 @@ def list_tasks(request):
 def task_details(request, task_id):
     """
     Get detailed task information including comments and files.
+    
+    Only the latest ``TASK_DETAIL_COMMENTS_LIMIT`` comments are embedded
+    (oldest first), together with ``comments_count`` and a
+    ``comments_next`` cursor that ``list_comments`` accepts to load older ones.
+    
+    ``fields`` (comma-separated) limits the task projection and output;
+    ``comments`` and ``files`` are only queried when requested.
     """
     try:
-        task = Task.objects.get(id=ObjectId(task_id))
+        fields = _requested_fields(request, TASK_DETAIL_FIELDS)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    task_fields = None
+    if fields:
+        task_fields = [field for field in fields if field in TASK_FIELDS]
+    
+    try:
+        tasks = Task.objects.only(*task_fields) if task_fields else Task.objects
+        task = tasks.get(id=ObjectId(task_id))
     except (Task.DoesNotExist, Exception):
         return Response(
             {'error': 'Task not found'},
             status=status.HTTP_404_NOT_FOUND
         )
     
-    comments = Comment.objects.filter(task_id=ObjectId(task_id))
-    comments_data = []
-    for comment in comments:
-        comment_data = CommentSerializer(comment).data
-        comment_files = CommentFile.objects.filter(comment_id=comment.id)
-        comment_data['files'] = CommentFileSerializer(comment_files, many=True).data
-        comments_data.append(comment_data)
+    task_data = TaskSerializer(task, fields=task_fields).data
     
-    files = TaskFile.objects.filter(task_id=ObjectId(task_id))
-    files_data = TaskFileSerializer(files, many=True).data
+    if not fields or 'comments' in fields:
+        comments = Comment.objects.filter(task_id=ObjectId(task_id))
+        comments_count = comments.count()
+        latest_comments, comments_next, _ = paginate(
+            comments, COMMENT_ORDERING, settings.TASK_DETAIL_COMMENTS_LIMIT
+        )
+        task_data['comments'] = _serialize_comments(reversed(latest_comments))
+        task_data['comments_count'] = comments_count
+        task_data['comments_next'] = comments_next
     
-    task_data = TaskSerializer(task).data
-    task_data['comments'] = comments_data
-    task_data['files'] = files_data
+    if not fields or 'files' in fields:
+        files = TaskFile.objects.filter(task_id=ObjectId(task_id))
+        task_data['files'] = TaskFileSerializer(files, many=True).data
     
     return Response(task_data, status=status.HTTP_200_OK)
 
@@ -171,55 +611,85 @@ def task_details(request, task_id):
 def update_task(request, task_id):
     """
     Update a task (Team Leader only).
+    
+    Only the fields sent are written, in one atomic find_one_and_update.
+    Send the task's version (If-Match header or "version" field) to get a
+    409 instead of overwriting a concurrent change. A reassignment or team
+    move first reads the current team and assignee, and the update is
+    conditional on them, so the previous ones are known exactly.
     """
+    serializer = TaskSerializer(data=request.data, partial=True, context={'request': request})
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     try:
-        task = Task.objects.get(id=ObjectId(task_id))
-    except (Task.DoesNotExist, Exception):
+        expected_version = _expected_version(request)
+    except ValueError:
+        return Response(
+            {'error': 'Invalid version'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    updates = {f'set__{field}': value for field, value in serializer.validated_data.items()}
+    previous = None
+    try:
+        if set(VISIBILITY_FIELDS) & set(serializer.validated_data):
+            previous = Task.objects(id=ObjectId(task_id)).only(*VISIBILITY_FIELDS).as_pymongo().first()
+            if previous is None:
+                raise Task.DoesNotExist
+        task, error = _conditional_update(task_id, updates, expected_version, unchanged=previous)
+    except Exception:
         return Response(
             {'error': 'Task not found'},
             status=status.HTTP_404_NOT_FOUND
         )
-    
-    serializer = TaskSerializer(task, data=request.data, partial=True, context={'request': request})
-    if serializer.is_valid():
-        serializer.save()
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    if error:
+        return error
+    if previous is not None:
+        invalidate_task_lists(previous['team_id'], task.team_id)
+    else:
+        invalidate_task_lists(task.team_id)
+    publish_local('task.updated', task, previous=previous)
+    return _task_response(task)
 
 
 @api_view(['PATCH'])
-@permission_classes([IsTeamLeaderOrAssignedUser])
 def update_task_status(request, task_id):
     """
     Update task status (Team Leader or assigned user only).
+    
+    The permission check is part of the atomic update's condition; the
+    optional version works as in update_task.
     """
+    new_status = request.data.get('status')
+    if new_status not in ['TODO', 'IN_PROGRESS', 'DONE']:
+        return Response(
+            {'error': 'Invalid status'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     try:
-        task = Task.objects.get(id=ObjectId(task_id))
-    except (Task.DoesNotExist, Exception):
+        expected_version = _expected_version(request)
+    except ValueError:
         return Response(
-            {'error': 'Task not found'},
-            status=status.HTTP_404_NOT_FOUND
+            {'error': 'Invalid version'},
+            status=status.HTTP_400_BAD_REQUEST
         )
     
     user_role = getattr(request.user, 'role', None)
-    if user_role != 'TEAM_LEADER' and task.assigned_to_user_id != request.user.id:
-        return Response(
-            {'error': 'You do not have permission to update this task'},
-            status=status.HTTP_403_FORBIDDEN
+    assignee_id = None if user_role == 'TEAM_LEADER' else request.user.id
+    try:
+        task, error = _conditional_update(
+            task_id, {'set__status': new_status}, expected_version, assignee_id,
         )
-    
-    new_status = request.data.get('status')
-    if new_status not in ['TODO', 'IN_PROGRESS', 'DONE']:
+    except Exception:
         return Response(
-            {'error': 'Invalid status'},
-            status=status.HTTP_400_BAD_REQUEST
+            {'error': 'Task not found'},
+            status=status.HTTP_404_NOT_FOUND
         )
-    
-    task.status = new_status
-    task.save()
-    
-    serializer = TaskSerializer(task)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    if error:
+        return error
+    invalidate_task_lists(task.team_id)
+    publish_local('task.status', task)
+    return _task_response(task)
 
 
 @api_view(['GET'])
@@ -227,6 +697,9 @@ def update_task_status(request, task_id):
 def list_comments(request, task_id):
     """
     List comments for a task.
+    
+    Passing ``limit`` and/or ``cursor`` returns ``{"results", "next", "prev"}``
+    with comments newest first; ``next`` walks towards older comments.
     """
     try:
         task = Task.objects.get(id=ObjectId(task_id))
@@ -237,14 +710,29 @@ def list_comments(request, task_id):
         )
     
     comments = Comment.objects.filter(task_id=ObjectId(task_id))
-    comments_data = []
-    for comment in comments:
-        comment_data = CommentSerializer(comment).data
-        comment_files = CommentFile.objects.filter(comment_id=comment.id)
-        comment_data['files'] = CommentFileSerializer(comment_files, many=True).data
-        comments_data.append(comment_data)
     
-    return Response(comments_data, status=status.HTTP_200_OK)
+    limit = request.query_params.get('limit')
+    cursor = request.query_params.get('cursor')
+    if limit is None and cursor is None:
+        comments_data = _serialize_comments(comments)
+        return Response(comments_data, status=status.HTTP_200_OK)
+    
+    try:
+        limit = parse_limit(limit, settings.COMMENT_LIST_DEFAULT_LIMIT, settings.COMMENT_LIST_MAX_LIMIT)
+        comments, next_cursor, prev_cursor = paginate(comments, COMMENT_ORDERING, limit, cursor)
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except ValueError:
+        return Response(
+            {'error': 'limit must be a positive integer'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    return Response({
+        'results': _serialize_comments(comments),
+        'next': next_cursor,
+        'prev': prev_cursor,
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -269,32 +757,12 @@ def add_comment(request, task_id):
         comment = serializer.save()
         comment_id = str(comment.id)
         
-        uploaded_files = []
-        if request.FILES:
-            media_root = settings.MEDIA_ROOT
-            uploads_dir = os.path.join(media_root, 'comment_files')
-            os.makedirs(uploads_dir, exist_ok=True)
-            
-            for file_key in request.FILES:
-                file_list = request.FILES.getlist(file_key)
-                for uploaded_file in file_list:
-                    file_ext = os.path.splitext(uploaded_file.name)[1]
-                    unique_filename = f"{uuid.uuid4()}{file_ext}"
-                    file_path = os.path.join(uploads_dir, unique_filename)
-                    
-                    with open(file_path, 'wb+') as destination:
-                        for chunk in uploaded_file.chunks():
-                            destination.write(chunk)
-                    
-                    relative_path = f"comment_files/{unique_filename}"
-                    
-                    comment_file = CommentFile(
-                        file=relative_path,
-                        comment_id=ObjectId(comment_id),
-                        uploaded_by_user_id=request.user.id
-                    )
-                    comment_file.save()
-                    uploaded_files.append(comment_file)
+        uploaded_files = save_uploads(request, CommentFile, comment_id=ObjectId(comment_id))
+        
+        _bump_task_counters(task, comments=1, files=len(uploaded_files))
+        publish_local('comment.created', task, comment)
+        for comment_file in uploaded_files:
+            publish_local('file.created', task, file=comment_file)
         
         response_data = serializer.data
         if uploaded_files:
@@ -333,17 +801,16 @@ def delete_comment(request, task_id, comment_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    comment_files = CommentFile.objects.filter(comment_id=ObjectId(comment_id))
-    for comment_file in comment_files:
-        file_path = os.path.join(settings.MEDIA_ROOT, comment_file.file)
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception:
-            pass
-        comment_file.delete()
-    
-    comment.delete()
+    # The comment's files are removed in the background.
+    deleted_files = CommentFile.objects(comment_id=comment.id).count()
+    if not Comment.objects(id=comment.id).delete():
+        return Response(
+            {'error': 'Comment not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    schedule_comment_cascade(comment.id)
+    _bump_task_counters(task, comments=-1, files=-deleted_files)
+    publish_local('comment.deleted', task, comment)
     
     return Response(
         {'message': 'Comment deleted successfully'},
@@ -380,34 +847,13 @@ def attach_comment_file(request, task_id, comment_id):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    uploaded_files = []
     if request.FILES:
-        media_root = settings.MEDIA_ROOT
-        uploads_dir = os.path.join(media_root, 'comment_files')
-        os.makedirs(uploads_dir, exist_ok=True)
-        
-        for file_key in request.FILES:
-            file_list = request.FILES.getlist(file_key)
-            for uploaded_file in file_list:
-                file_ext = os.path.splitext(uploaded_file.name)[1]
-                unique_filename = f"{uuid.uuid4()}{file_ext}"
-                file_path = os.path.join(uploads_dir, unique_filename)
-                
-                with open(file_path, 'wb+') as destination:
-                    for chunk in uploaded_file.chunks():
-                        destination.write(chunk)
-                
-                relative_path = f"comment_files/{unique_filename}"
-                
-                comment_file = CommentFile(
-                    file=relative_path,
-                    comment_id=ObjectId(comment_id),
-                    uploaded_by_user_id=request.user.id
-                )
-                comment_file.save()
-                uploaded_files.append(comment_file)
+        uploaded_files = save_uploads(request, CommentFile, comment_id=ObjectId(comment_id))
         
         if uploaded_files:
+            _bump_task_counters(task, files=len(uploaded_files))
+            for comment_file in uploaded_files:
+                publish_local('file.created', task, file=comment_file)
             files_data = CommentFileSerializer(uploaded_files, many=True).data
             return Response(files_data, status=status.HTTP_201_CREATED)
         else:
@@ -461,21 +907,17 @@ def download_comment_file(request, task_id, comment_id, file_id):
         )
     
     download = request.query_params.get('download', 'false').lower() == 'true'
+    variant = request.query_params.get('variant')
+    if variant not in (None, 'thumb'):
+        return Response(
+            {'error': 'variant must be "thumb"'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
-        file_handle = open(file_path, 'rb')
-        response = FileResponse(file_handle, content_type='application/octet-stream')
-        
-        filename = os.path.basename(comment_file.file)
-        if download:
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        else:
-            content_type, _ = mimetypes.guess_type(file_path)
-            if content_type:
-                response['Content-Type'] = content_type
-            response['Content-Disposition'] = f'inline; filename="{filename}"'
-        
-        return response
+        if variant == 'thumb':
+            return serve_preview(request, comment_file, download)
+        return serve_file(request, comment_file, download)
     except Exception as e:
         return Response(
             {'error': f'Error serving file: {str(e)}'},
@@ -519,14 +961,16 @@ def delete_comment_file(request, task_id, comment_id, file_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    file_path = os.path.join(settings.MEDIA_ROOT, comment_file.file)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception:
-        pass
-    
-    comment_file.delete()
+    # Only the request whose delete removed the document releases its
+    # storage and counts it, so concurrent deletes act once.
+    if not CommentFile.objects(id=comment_file.id).delete():
+        return Response(
+            {'error': 'File not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    delete_stored_file(comment_file)
+    _bump_task_counters(task, files=-1)
+    publish_local('file.deleted', task, file=comment_file)
     
     return Response(
         {'message': 'File deleted successfully'},
@@ -568,34 +1012,13 @@ def attach_file(request, task_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    uploaded_files = []
     if request.FILES:
-        media_root = settings.MEDIA_ROOT
-        uploads_dir = os.path.join(media_root, 'task_files')
-        os.makedirs(uploads_dir, exist_ok=True)
-        
-        for file_key in request.FILES:
-            file_list = request.FILES.getlist(file_key)
-            for uploaded_file in file_list:
-                file_ext = os.path.splitext(uploaded_file.name)[1]
-                unique_filename = f"{uuid.uuid4()}{file_ext}"
-                file_path = os.path.join(uploads_dir, unique_filename)
-                
-                with open(file_path, 'wb+') as destination:
-                    for chunk in uploaded_file.chunks():
-                        destination.write(chunk)
-                
-                relative_path = f"task_files/{unique_filename}"
-                
-                task_file = TaskFile(
-                    file=relative_path,
-                    task_id=ObjectId(task_id),
-                    uploaded_by_user_id=request.user.id
-                )
-                task_file.save()
-                uploaded_files.append(task_file)
+        uploaded_files = save_uploads(request, TaskFile, task_id=ObjectId(task_id))
         
         if uploaded_files:
+            _bump_task_counters(task, files=len(uploaded_files))
+            for task_file in uploaded_files:
+                publish_local('file.created', task, file=task_file)
             files_data = TaskFileSerializer(uploaded_files, many=True).data
             return Response(files_data, status=status.HTTP_201_CREATED)
         else:
@@ -641,21 +1064,17 @@ def download_file(request, task_id, file_id):
         )
     
     download = request.query_params.get('download', 'false').lower() == 'true'
+    variant = request.query_params.get('variant')
+    if variant not in (None, 'thumb'):
+        return Response(
+            {'error': 'variant must be "thumb"'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
-        file_handle = open(file_path, 'rb')
-        response = FileResponse(file_handle, content_type='application/octet-stream')
-        
-        filename = os.path.basename(task_file.file)
-        if download:
-            response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        else:
-            content_type, _ = mimetypes.guess_type(file_path)
-            if content_type:
-                response['Content-Type'] = content_type
-            response['Content-Disposition'] = f'inline; filename="{filename}"'
-        
-        return response
+        if variant == 'thumb':
+            return serve_preview(request, task_file, download)
+        return serve_file(request, task_file, download)
     except Exception as e:
         return Response(
             {'error': f'Error serving file: {str(e)}'},
@@ -685,16 +1104,34 @@ def delete_file(request, task_id, file_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    file_path = os.path.join(settings.MEDIA_ROOT, task_file.file)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception:
-        pass
-    
-    task_file.delete()
+    # Only the request whose delete removed the document releases its
+    # storage and counts it, so concurrent deletes act once.
+    if not TaskFile.objects(id=task_file.id).delete():
+        return Response(
+            {'error': 'File not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    delete_stored_file(task_file)
+    _bump_task_counters(task, files=-1)
+    publish_local('file.deleted', task, file=task_file)
     
     return Response(
         {'message': 'File deleted successfully'},
         status=status.HTTP_200_OK
     )
+
+
+def metrics(request):
+    """
+    Process metrics (MongoDB pool checkout waits and others) in the
+    Prometheus text format, for a scraper sending ``TASK_METRICS_TOKEN`` as
+    a bearer token. Not found while no token is configured.
+    """
+    if not settings.TASK_METRICS_TOKEN:
+        return JsonResponse({'error': 'Not found'}, status=status.HTTP_404_NOT_FOUND)
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Method not allowed'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if not hmac.compare_digest(authorization, f'Bearer {settings.TASK_METRICS_TOKEN}'):
+        return JsonResponse({'error': 'Unauthorized'}, status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(task_metrics.render(), content_type=task_metrics.CONTENT_TYPE)
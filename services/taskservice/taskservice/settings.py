@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/6.0/ref/settings/
 
 from pathlib import Path
 import os
+from corsheaders.defaults import default_headers
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,6 +54,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'taskapi.middleware.read_your_writes_middleware',
 ]
 
 ROOT_URLCONF = 'taskservice.urls'
@@ -94,6 +96,26 @@ MONGO_USERNAME = os.environ.get('MONGO_ROOT_USERNAME', 'mongoadmin')
 MONGO_PASSWORD = os.environ.get('MONGO_ROOT_PASSWORD', 'mongoadmin')
 MONGO_DATABASE = os.environ.get('MONGO_DATABASE', 'nefosdb')
 MONGO_AUTH_DATABASE = os.environ.get('MONGO_AUTH_DATABASE', 'admin')
+# Replica set name; MONGO_HOST may then list its members (comma-separated host[:port])
+MONGO_REPLICA_SET = os.environ.get('MONGO_REPLICA_SET', '')
+
+# MongoDB client pool, timeouts (milliseconds, 0 for none), wire compression
+# (comma-separated, in order of preference: zstd, snappy, zlib) and retries.
+# The connection is registered in TaskapiConfig.ready() and opened on first use.
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)) or None
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 5000)) or None
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 30000)) or None
+# pymongo has no "no timeout" for server selection, so 0 leaves it at pymongo's default (30s).
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)) or None
+MONGO_COMPRESSORS = [name for name in os.environ.get('MONGO_COMPRESSORS', '').split(',') if name]
+MONGO_RETRY_READS = os.environ.get('MONGO_RETRY_READS', 'true').lower() in ('1', 'true', 'yes')
+MONGO_RETRY_WRITES = os.environ.get('MONGO_RETRY_WRITES', 'true').lower() in ('1', 'true', 'yes')
+
+# Bearer token a Prometheus scraper must send to metrics/; the endpoint is
+# disabled (404) while it is empty.
+TASK_METRICS_TOKEN = os.environ.get('TASK_METRICS_TOKEN', '')
 
 
 # Password validation
@@ -136,16 +158,106 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = BASE_DIR / 'media'
 MEDIA_URL = '/media/'
 
-# Initialize MongoEngine connection (after all settings are defined)
-import mongoengine
-mongoengine.connect(
-    db=MONGO_DATABASE,
-    host=MONGO_HOST,
-    port=MONGO_PORT,
-    username=MONGO_USERNAME,
-    password=MONGO_PASSWORD,
-    authentication_source=MONGO_AUTH_DATABASE
-)
+# Task list pagination (used when a client passes ``limit`` or ``cursor``)
+TASK_LIST_DEFAULT_LIMIT = int(os.environ.get('TASK_LIST_DEFAULT_LIMIT', 50))
+TASK_LIST_MAX_LIMIT = int(os.environ.get('TASK_LIST_MAX_LIMIT', 200))
+
+# Comment windows embedded in task details and comment list pagination
+TASK_DETAIL_COMMENTS_LIMIT = int(os.environ.get('TASK_DETAIL_COMMENTS_LIMIT', 20))
+COMMENT_LIST_DEFAULT_LIMIT = int(os.environ.get('COMMENT_LIST_DEFAULT_LIMIT', 20))
+COMMENT_LIST_MAX_LIMIT = int(os.environ.get('COMMENT_LIST_MAX_LIMIT', 100))
+
+# Dashboard task counts (short-lived cache, in seconds)
+TASK_COUNTS_CACHE_TTL = int(os.environ.get('TASK_COUNTS_CACHE_TTL', 15))
+TASK_COUNTS_MAX_TEAMS = int(os.environ.get('TASK_COUNTS_MAX_TEAMS', 500))
+
+# Attachment uploads are streamed straight into the blob store (see taskapi/uploads.py)
+FILE_UPLOAD_HANDLERS = ['taskapi.uploads.BlobUploadHandler']
+TASK_UPLOAD_MAX_FILE_SIZE = int(os.environ.get('TASK_UPLOAD_MAX_FILE_SIZE', 25 * 1024 * 1024))
+TASK_UPLOAD_MAX_REQUEST_SIZE = int(os.environ.get('TASK_UPLOAD_MAX_REQUEST_SIZE', 100 * 1024 * 1024))
+
+# Attachment downloads: 'python' streams from Django; 'nginx' (X-Accel-Redirect to
+# TASK_FILE_ACCEL_PREFIX) and 'sendfile' (X-Sendfile) let the front proxy send the bytes
+TASK_FILE_SERVING = os.environ.get('TASK_FILE_SERVING', 'python')
+TASK_FILE_ACCEL_PREFIX = os.environ.get('TASK_FILE_ACCEL_PREFIX', '/protected-media/')
+
+# Attachment previews (?variant=thumb), rendered by a background process pool
+TASK_PREVIEW_SIZE = int(os.environ.get('TASK_PREVIEW_SIZE', 320))
+TASK_PREVIEW_WORKERS = int(os.environ.get('TASK_PREVIEW_WORKERS', 2))
+TASK_PREVIEW_CACHE_MAX_BYTES = int(os.environ.get('TASK_PREVIEW_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+TASK_PREVIEW_EVICT_INTERVAL = int(os.environ.get('TASK_PREVIEW_EVICT_INTERVAL', 300))
+
+# Background cascade delete of tombstoned tasks and deleted comments (see taskapi/cascade.py)
+TASK_CASCADE_BATCH_SIZE = int(os.environ.get('TASK_CASCADE_BATCH_SIZE', 500))
+TASK_CASCADE_WORKERS = int(os.environ.get('TASK_CASCADE_WORKERS', 4))
+
+# Bulk task create: items per request, documents per insert_many
+TASK_BULK_MAX_ITEMS = int(os.environ.get('TASK_BULK_MAX_ITEMS', 5000))
+TASK_BULK_BATCH_SIZE = int(os.environ.get('TASK_BULK_BATCH_SIZE', 500))
+
+# Full-text search: page size, best-scoring matches considered per collection,
+# best comment matches checked against a narrowed scope (members, filters),
+# and how much a matching comment counts relative to a matching task
+TASK_SEARCH_DEFAULT_LIMIT = int(os.environ.get('TASK_SEARCH_DEFAULT_LIMIT', 20))
+TASK_SEARCH_MAX_LIMIT = int(os.environ.get('TASK_SEARCH_MAX_LIMIT', 100))
+TASK_SEARCH_MAX_QUERY_LENGTH = int(os.environ.get('TASK_SEARCH_MAX_QUERY_LENGTH', 200))
+TASK_SEARCH_MAX_CANDIDATES = int(os.environ.get('TASK_SEARCH_MAX_CANDIDATES', 1000))
+TASK_SEARCH_MAX_COMMENT_SCAN = int(os.environ.get('TASK_SEARCH_MAX_COMMENT_SCAN', 10000))
+TASK_SEARCH_COMMENT_WEIGHT = float(os.environ.get('TASK_SEARCH_COMMENT_WEIGHT', 0.5))
+
+# Read routing for list_tasks, search and counts: the read preference mode
+# ('primary' keeps them on the primary), how far a secondary may lag
+# (seconds, at least 90, or -1 for no limit) and the read concern level.
+# A client that wrote within TASK_READ_YOUR_WRITES_SECONDS (it sends back the
+# X-Read-Your-Writes token it was given) reads from the primary; keep this
+# longer than the staleness limit.
+TASK_LIST_READ_PREFERENCE = os.environ.get('TASK_LIST_READ_PREFERENCE', 'secondaryPreferred')
+TASK_LIST_READ_MAX_STALENESS = int(os.environ.get('TASK_LIST_READ_MAX_STALENESS', 90))
+TASK_LIST_READ_CONCERN = os.environ.get('TASK_LIST_READ_CONCERN', 'local')
+TASK_READ_YOUR_WRITES_SECONDS = int(os.environ.get('TASK_READ_YOUR_WRITES_SECONDS', 100))
+
+# list_tasks response cache (see taskapi/list_cache.py): 'locmem' (in-process
+# LRU of TASK_LIST_CACHE_MAX_ENTRIES responses, one process only), 'file'
+# (a directory) or 'redis' (a redis:// URL) at TASK_LIST_CACHE_LOCATION.
+# TASK_LIST_CACHE_TTL=0 disables it. Cached misses are read from the
+# primary; TASK_LIST_CACHE_SECONDARY_READS=true reads them per
+# TASK_LIST_READ_PREFERENCE instead and caches those responses for at most
+# TASK_LIST_READ_MAX_STALENESS seconds, so hits may lag recent writes.
+TASK_LIST_CACHE_BACKEND = os.environ.get('TASK_LIST_CACHE_BACKEND', 'locmem')
+TASK_LIST_CACHE_LOCATION = os.environ.get('TASK_LIST_CACHE_LOCATION', '')
+TASK_LIST_CACHE_TTL = int(os.environ.get('TASK_LIST_CACHE_TTL', 300))
+TASK_LIST_CACHE_MAX_ENTRIES = int(os.environ.get('TASK_LIST_CACHE_MAX_ENTRIES', 1000))
+TASK_LIST_CACHE_SECONDARY_READS = os.environ.get('TASK_LIST_CACHE_SECONDARY_READS', 'false').lower() in ('1', 'true', 'yes')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'task_lists': {
+        'locmem': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'task-lists',
+            'OPTIONS': {'MAX_ENTRIES': TASK_LIST_CACHE_MAX_ENTRIES},
+        },
+        'file': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': TASK_LIST_CACHE_LOCATION or BASE_DIR / 'cache' / 'task_lists',
+            'OPTIONS': {'MAX_ENTRIES': TASK_LIST_CACHE_MAX_ENTRIES},
+        },
+        'redis': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': TASK_LIST_CACHE_LOCATION or 'redis://localhost:6379/1',
+        },
+    }[TASK_LIST_CACHE_BACKEND],
+}
+
+# Live task events (Server-Sent Events at tasks/events/). The source is
+# 'changestream' (needs a replica set), 'local' (this process's writes
+# only) or 'auto' to pick the change stream when available.
+TASK_EVENTS_SOURCE = os.environ.get('TASK_EVENTS_SOURCE', 'auto')
+TASK_EVENTS_QUEUE_SIZE = int(os.environ.get('TASK_EVENTS_QUEUE_SIZE', 256))
+TASK_EVENTS_REPLAY = int(os.environ.get('TASK_EVENTS_REPLAY', 1000))
+TASK_EVENTS_HEARTBEAT = int(os.environ.get('TASK_EVENTS_HEARTBEAT', 15))
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
@@ -177,6 +289,14 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Verified access tokens are cached (see the app's authentication.py): at most
+# AUTH_TOKEN_CACHE_SIZE tokens, each until its exp or for AUTH_TOKEN_CACHE_TTL
+# seconds, whichever is sooner
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, 'if-match', 'x-read-your-writes')
+CORS_EXPOSE_HEADERS = ['ETag', 'X-Read-Your-Writes']
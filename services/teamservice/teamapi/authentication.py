@@ -1,58 +1,151 @@
+"""
+Authentication with userservice access tokens.
+
+Tokens are HMAC-signed JWTs; this service has no User model and trusts
+the ``user_id`` and ``role`` claims of a token whose signature verifies.
+Verified tokens are kept in a bounded LRU keyed by the token's SHA-256
+digest, so a client sending the same token on every request pays for one
+``jwt.decode``. An entry is dropped at the token's ``exp`` or after
+``AUTH_TOKEN_CACHE_TTL`` seconds, whichever comes first; invalid tokens
+are never cached.
+
+This module is identical in taskservice and teamservice (each service is
+its own Docker build context); keep the two copies in sync.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from rest_framework import authentication
-from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from django.conf import settings
 import jwt
 
 
+class TokenUser:
+    """The user an access token stands for."""
+
+    __slots__ = ('id', 'role')
+    is_authenticated = True
+
+    def __init__(self, user_id, role=None):
+        self.id = user_id
+        self.role = role
+
+    @property
+    def user_id(self):
+        return self.id
+
+
+class VerifiedTokenCache:
+    """Thread-safe LRU of token digest to ``(TokenUser, expires_at)``."""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, digest):
+        """The cached user for ``digest``, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._entries[digest]
+                return None
+            self._entries.move_to_end(digest)
+            return entry[0]
+
+    def put(self, digest, user, expires_at):
+        with self._lock:
+            self._entries[digest] = (user, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def verify_token(token):
+    """
+    Verify a token's signature and claims with ``jwt.decode`` (no cache).
+
+    Returns ``(TokenUser, exp)``, where ``exp`` may be None, or None when
+    the token is invalid, expired or has no ``user_id``.
+    """
+    try:
+        # Get signing key - use the same as userservice
+        # Try JWT_SECRET_KEY first, then fall back to SECRET_KEY
+        signing_key = settings.SIMPLE_JWT.get('SIGNING_KEY', settings.SECRET_KEY)
+        algorithm = settings.SIMPLE_JWT.get('ALGORITHM', 'HS256')
+
+        # Decode and validate token
+        decoded_token = jwt.decode(
+            token,
+            key=signing_key,
+            algorithms=[algorithm],
+            options={"verify_signature": True}
+        )
+    except jwt.InvalidTokenError:
+        return None
+
+    user_id = decoded_token.get('user_id')
+    if not user_id:
+        return None
+
+    # Extract role from token (added by userservice)
+    return TokenUser(user_id, decoded_token.get('role')), decoded_token.get('exp')
+
+
+def user_from_token(token):
+    """
+    Return the user of a valid access token, or None when the token is
+    invalid, expired or has no ``user_id``.
+
+    Shared by the DRF authentication class and endpoints that receive the
+    token outside the Authorization header.
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    user = verified_tokens.get(digest)
+    if user is not None:
+        return user
+
+    verified = verify_token(token)
+    if verified is None:
+        return None
+    user, exp = verified
+    expires_at = time.time() + settings.AUTH_TOKEN_CACHE_TTL
+    if exp is not None:
+        expires_at = min(expires_at, exp)
+    verified_tokens.put(digest, user, expires_at)
+    return user
+
+
 class JWTAuthenticationFromUserService(authentication.BaseAuthentication):
     """
     Custom JWT authentication that verifies tokens from userservice.
-    Since teamservice doesn't have User model, we only verify the token
+    Since this service doesn't have User model, we only verify the token
     and extract user information from it.
     """
-    
+
     def authenticate(self, request):
         auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        
+
         if not auth_header.startswith('Bearer '):
             return None
-        
+
         token = auth_header.split(' ')[1]
-        
-        try:
-            # Get signing key - use the same as userservice
-            # Try JWT_SECRET_KEY first, then fall back to SECRET_KEY
-            signing_key = settings.SIMPLE_JWT.get('SIGNING_KEY', settings.SECRET_KEY)
-            algorithm = settings.SIMPLE_JWT.get('ALGORITHM', 'HS256')
-            
-            # Decode and validate token
-            decoded_token = jwt.decode(
-                token,
-                key=signing_key,
-                algorithms=[algorithm],
-                options={"verify_signature": True}
-            )
-            
-            # Create a simple user-like object with user_id and role
-            class TokenUser:
-                def __init__(self, user_id, role=None):
-                    self.id = user_id
-                    self.user_id = user_id
-                    self.role = role
-                    self.is_authenticated = True
-            
-            user_id = decoded_token.get('user_id')
-            if not user_id:
-                return None
-            
-            # Extract role from token (added by userservice)
-            role = decoded_token.get('role')
-            
-            return (TokenUser(user_id, role), token)
-            
-        except (jwt.DecodeError, jwt.InvalidTokenError, jwt.ExpiredSignatureError, jwt.InvalidSignatureError) as e:
+        user = user_from_token(token)
+        if user is None:
             return None
-    
+        return (user, token)
+
     def authenticate_header(self, request):
         return 'Bearer'
-
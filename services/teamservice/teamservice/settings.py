@@ -157,6 +157,12 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+# Verified access tokens are cached (see the app's authentication.py): at most
+# AUTH_TOKEN_CACHE_SIZE tokens, each until its exp or for AUTH_TOKEN_CACHE_TTL
+# seconds, whichever is sooner
+AUTH_TOKEN_CACHE_SIZE = int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 300))
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True